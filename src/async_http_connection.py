@@ -63,6 +63,14 @@ class AsyncHTTPConnection(object):
       print 'died during begin_request'
       raise AsyncError()
 
+  def fileno(self):
+    """The connection's socket, for waiting on the response from a message loop."""
+    return self.conn.sock.fileno()
+
+  def close(self):
+    self.conn.close()
+    self.state = IDLE
+
   def is_response_ready(self, timeout = 0):
     if self.state == IDLE:
       raise RequestNotPending()
@@ -90,8 +98,47 @@ class AsyncHTTPConnection(object):
     try:
       r = self.conn.getresponse()
       return r
-    except httplib.BadStateLine:
+    except httplib.BadStatusLine:
       print "lost during get response"
       r = None
       self.state = IDLE
       self.conn.close()
+
+  def get_streaming_response(self):
+    """
+    Like get_response, but only reads the status and headers. The body is
+    left on the socket to be read with read_available as it arrives.
+    """
+    if self.state == REQUEST_PENDING:
+      raise RequestPending()
+    if self.state == IDLE:
+      raise RequestNotPending()
+    if not self.conn.sock:
+      raise AsyncError()
+    # HTTPResponse reads the headers unbuffered, so none of the body is
+    # consumed along with them
+    r = httplib.HTTPResponse(self.conn.sock)
+    try:
+      r.begin()
+      return r
+    except (httplib.BadStatusLine, socket.error):
+      print "lost during get streaming response"
+      self.state = IDLE
+      self.conn.close()
+      return None
+
+  def read_available(self):
+    """
+    Returns the body data that has arrived so far, without blocking. Returns
+    None once the server has closed the connection.
+    """
+    r,w,x = select.select([self.conn.sock.fileno(),], [], [], 0)
+    if not len(r):
+      return ''
+    try:
+      data = self.conn.sock.recv(65536)
+    except socket.error:
+      return None
+    if data == '':
+      return None
+    return data
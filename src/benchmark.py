@@ -0,0 +1,614 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import math
+import optparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import corpus
+import db_index
+import db_indexer
+import fixed_size_dict
+import object_size
+
+DEFAULT_FILES = 'test_data/cr_files_basenames.json'
+
+# What replay searches for without a query log: each query as it is typed,
+# then some with a dir part.
+DEFAULT_QUERIES = [
+    'r', 'rw', 'rwh', 'rwhv',
+    're', 'ren', 'rend', 'rende', 'render', 'render_', 'render_w', 'render_wi', 'render_widget',
+    'iv', 'info_view',
+    'w', 'we', 'web', 'webv', 'webvi', 'webvie', 'webview',
+    'wv', 'wvi',
+    'webgraphics',
+    'src/', 'chromium/src/', 'webkit/source/', 'src/web', 'webcore/css/m', 'cont/brow/tab', 'wk/chr/src/']
+
+###########################################################################
+
+def CMDreplay(parser):
+  """Replays a query log, or a built-in set of queries, against an index and reports search latency"""
+  parser.add_option('--speed', dest='speed', action='store', type='float', default=1, help='Replay this many times faster than the queries were typed; 0 replays them back to back')
+  parser.add_option('--max-gap', dest='max_gap', action='store', type='float', default=1, help='Shorten pauses between queries to at most this many seconds')
+  parser.add_option('--max-hits', dest='max_hits', action='store', type='int', default=100, help='Hits per search')
+  parser.add_option('--timeout', dest='timeout', action='store', type='float', default=None, help='Give each search this many seconds, like the dialog\'s search_timeout')
+  parser.add_option('--progressive', dest='progressive', action='store_true', default=False, help='Search progressively, as the open dialog does, and also time the first results')
+  parser.add_option('--each', dest='each', action='store_true', default=False, help='Also print how long each search took')
+  parser.add_option('--batch', dest='batch', action='store_true', default=False, help='Also time the distinct queries as one search_batch against one at a time, from a cold cache')
+  (options, args) = parser.parse_args()
+  if len(args) > 1:
+    parser.error('Expected: [query_log]')
+  if len(args):
+    queries = read_query_log(args[0])
+    if not len(queries):
+      parser.error('%s has no queries' % args[0])
+  else:
+    queries = [(0, q) for q in DEFAULT_QUERIES]
+
+  index, build_time = build_index(options)
+  searches = []
+  try:
+    res = replay(index, queries, options.max_hits, options.timeout, options.speed, options.max_gap,
+                 options.progressive, searches)
+    if options.batch:
+      res.update(batch(index, [q for t, q in queries], options.max_hits))
+  finally:
+    index.close()
+  res["index_files"] = len(index.files)
+  res["index_shards"] = len(index.shards)
+  res["index_build_seconds"] = build_time
+  rows = [("queries", "%i"),
+          ("index_files", "%i"),
+          ("index_build_seconds", "%.2f"),
+          ("p50_ms", "%.1f"),
+          ("p95_ms", "%.1f"),
+          ("p99_ms", "%.1f"),
+          ("max_ms", "%.1f"),
+          ("queries_per_second", "%.1f"),
+          ("cache_hit_rate", "%.2f"),
+          ("partial", "%i")]
+  if options.progressive:
+    rows.extend([("first_p50_ms", "%.1f"),
+                 ("first_p95_ms", "%.1f")])
+  if options.batch:
+    rows.extend([("one_at_a_time_seconds", "%.3f"),
+                 ("batch_seconds", "%.3f")])
+  if options.each and not options.json:
+    print "%25s %10s %10s" % ("query", "first ms", "ms")
+    for query, first, seconds in searches:
+      print "%25s %10.1f %10.1f" % (query, first * 1000, seconds * 1000)
+    print
+  return report(options, res, rows)
+
+def CMDscaling(parser):
+  """Measures crawl, index build, memory and search latency on generated trees"""
+  parser.add_option('--sizes', dest='sizes', action='store', default='100000,1000000,5000000', help='Comma separated tree sizes, in files')
+  parser.add_option('--seed', dest='seed', action='store', type='int', default=0, help='Seed for the generated trees and queries')
+  parser.add_option('--queries', dest='queries', action='store', type='int', default=100, help='Number of queries to time')
+  parser.add_option('--max-hits', dest='max_hits', action='store', type='int', default=100, help='Hits per search')
+  parser.add_option('--crawl', dest='crawl', action='store_true', default=False, help='Write each tree to disk and crawl it, instead of generating it in memory')
+  (options, args) = parser.parse_args()
+  if len(args):
+    parser.error('Unexpected arguments: %s' % ' '.join(args))
+  try:
+    sizes = [int(s) for s in options.sizes.split(',')]
+  except ValueError:
+    parser.error('--sizes should be numbers, like 100000,1000000')
+
+  results = [scale(options, n) for n in sizes]
+  return report_columns(options, results, "files", [
+      ("files", "%i"),
+      ("dirs", "%i"),
+      ("crawl_seconds", "%.2f"),
+      ("build_seconds", "%.2f"),
+      ("index_mb", "%.1f"),
+      ("bytes_per_file", "%.0f"),
+      ("p50_ms", "%.1f"),
+      ("p95_ms", "%.1f"),
+      ("p99_ms", "%.1f"),
+      ("max_ms", "%.1f")])
+
+def CMDcrawl(parser):
+  """Crawls a generated tree, or the --dirs, twice and counts file system calls"""
+  parser.add_option('--size', dest='size', action='store', type='int', default=100000, help='Number of files in the generated tree')
+  parser.add_option('--seed', dest='seed', action='store', type='int', default=0, help='Seed for the generated tree')
+  (options, args) = parser.parse_args()
+  if len(args):
+    parser.error('Unexpected arguments: %s' % ' '.join(args))
+
+  from db import DEFAULT_IGNORES
+  from dir_cache import CountingFileSystem, DirCache
+  tree = None
+  try:
+    if options.dir:
+      dirs = options.dir
+    else:
+      tree = tempfile.mkdtemp()
+      corpus.write_tree(tree, options.size, options.seed)
+      dirs = [tree]
+    # The first crawl starts from an empty DirCache, the second re-indexes
+    # with the one the first filled, as the daemon does. Neither is cold as
+    # far as the OS is concerned: writing the tree left it in the page cache.
+    fs = CountingFileSystem()
+    dir_cache = DirCache(fs)
+    dir_cache.set_ignores(DEFAULT_IGNORES)
+    results = [crawl(dirs, dir_cache, fs, "cold"), crawl(dirs, dir_cache, fs, "warm")]
+  finally:
+    if tree:
+      shutil.rmtree(tree, True)
+  return report_columns(options, results, "phase", [
+      ("phase", "%s"),
+      ("files", "%i"),
+      ("dirs", "%i"),
+      ("seconds", "%.2f"),
+      ("files_per_second", "%.0f"),
+      ("stat_per_file", "%.3f"),
+      ("listdir_per_file", "%.3f"),
+      ("realpath_per_file", "%.3f"),
+      ("islink_per_file", "%.3f"),
+      ("isdir_per_file", "%.3f"),
+      ("cache_mb", "%.1f"),
+      ("max_rss_mb", "%.1f")])
+
+def CMDmemory(parser):
+  """Measures the index, and with --dir the DirCache, against the plain strings they replaced"""
+  (options, args) = parser.parse_args()
+  if len(args):
+    parser.error('Unexpected arguments: %s' % ' '.join(args))
+  rows = [("files", "%i"),
+          ("paths_mb", "%.1f"),
+          ("paths_bytes_per_file", "%.0f"),
+          ("table_mb", "%.1f"),
+          ("table_bytes_per_file", "%.0f")]
+  res = index_memory(options)
+  if options.dir:
+    res.update(dir_cache_memory(options.dir))
+    rows.extend([("dirs", "%i"),
+                 ("dir_paths_mb", "%.1f"),
+                 ("dir_paths_bytes_per_dir", "%.0f"),
+                 ("dir_cache_mb", "%.1f"),
+                 ("dir_cache_bytes_per_dir", "%.0f")])
+  return report(options, res, rows)
+
+def CMDstartup(parser):
+  """Times each non-UI quickopen command from launch to exit against a test daemon"""
+  parser.add_option('--runs', dest='runs', action='store', type='int', default=10, help='Launch each command this many times')
+  (options, args) = parser.parse_args()
+  if len(args):
+    parser.error('Unexpected arguments: %s' % ' '.join(args))
+
+  # This is what scripted callers such as quickopen.vim wait on.
+  import temporary_daemon
+  import test_data
+  data = test_data.TestData()
+  daemon = temporary_daemon.TemporaryDaemon()
+  quickopen_script = os.path.join(os.path.dirname(__file__), "../quickopen")
+  def args(*cmd):
+    full_args = [sys.executable, quickopen_script, cmd[0],
+                 "--host", daemon.host,
+                 "--port", str(daemon.port)]
+    full_args.extend(cmd[1:])
+    return full_args
+  results = []
+  try:
+    subprocess.call(args("add", data.test_data_dir))
+    for i in range(50):
+      if subprocess.Popen(args("status"), stdout=subprocess.PIPE).communicate()[0].startswith("up-to-date: "):
+        break
+      time.sleep(0.2)
+    results.append(startup_times("(python)", [sys.executable, "-c", "pass"], options.runs))
+    for cmd in [("help",),
+                ("status",),
+                ("dirs",),
+                ("ignores",),
+                ("rawsearch", "MySubSystem.c")]:
+      results.append(startup_times(cmd[0], args(*cmd), options.runs))
+  finally:
+    daemon.close()
+    data.close()
+  return report_columns(options, results, "command", [
+      ("command", "%s"),
+      ("min_ms", "%.1f"),
+      ("median_ms", "%.1f")])
+
+def CMDcorpus(parser):
+  """Writes a generated tree, to index with --files or --dir"""
+  parser.add_option('--size', dest='size', action='store', type='int', default=100000, help='Number of files')
+  parser.add_option('--seed', dest='seed', action='store', type='int', default=0, help='Seed for the tree')
+  parser.add_option('--tree', dest='tree', action='store_true', default=False, help='Create the files under <output>, rather than writing a dump')
+  (options, args) = parser.parse_args()
+  if len(args) != 1:
+    parser.error('Expected: <output>')
+  if options.tree:
+    corpus.write_tree(args[0], options.size, options.seed)
+  else:
+    corpus.write_dump(args[0], options.size, options.seed)
+  return 0
+
+###########################################################################
+
+def read_query_log(path):
+  """
+  Returns the (time, query) of every search in a query log, oldest first.
+  Reads logs written by QueryLog and the older {"ts", "query"} ones.
+  """
+  queries = []
+  for line in open(path):
+    try:
+      record = json.loads(line)
+    except ValueError:
+      continue # a line cut short by a crash
+    query = record.get("q", record.get("query", None))
+    if query:
+      queries.append((record.get("t", record.get("ts", 0)), query))
+  queries.sort(lambda x,y: cmp(x[0], y[0]))
+  return queries
+
+def build_index(options):
+  """Returns (DBIndex, seconds it took to build) for the files the options name."""
+  start = time.time()
+  if options.dir:
+    from db import DEFAULT_IGNORES
+    from dir_cache import DirCache
+    dir_cache = DirCache()
+    dir_cache.set_ignores(DEFAULT_IGNORES)
+    indexer = db_indexer.DBIndexer(options.dir, dir_cache)
+    while not indexer.complete:
+      indexer.index_a_bit_more()
+  else:
+    indexer = db_indexer.MockIndexer(options.files)
+  index = db_index.DBIndex(indexer, threaded = not options.single_threaded)
+  return index, time.time() - start
+
+def replay(index, queries, max_hits, timeout, speed, max_gap, progressive = False, searches = None):
+  """
+  Searches for each of queries, a list of (time, query), in order. With a
+  speed, each search starts when it would have been typed, or as soon as the
+  one before it finishes. With progressive, it searches the way the open
+  dialog does and also times the first results. Returns the measurements,
+  and appends (query, seconds to the first results, seconds) for each
+  search to the list searches, if given.
+  """
+  cache_hits = index.cache_hits
+  cache_misses = index.cache_misses
+  latencies = []
+  first_latencies = []
+  partial = 0
+  start = time.time()
+  due = start
+  for i in range(len(queries)):
+    t, query = queries[i]
+    if speed > 0 and i > 0:
+      due += min(max_gap, max(0, t - queries[i-1][0])) / speed
+      delay = due - time.time()
+      if delay > 0:
+        time.sleep(delay)
+    search_start = time.time()
+    if progressive:
+      first = None
+      for res in index.search_progressively(query, max_hits, timeout):
+        if first is None:
+          first = time.time() - search_start
+    else:
+      res = index.search(query, max_hits, timeout)
+    seconds = time.time() - search_start
+    if not progressive:
+      first = seconds
+    latencies.append(seconds)
+    first_latencies.append(first)
+    if searches is not None:
+      searches.append((query, first, seconds))
+    if res.partial:
+      partial += 1
+  wall = time.time() - start
+
+  hits = index.cache_hits - cache_hits
+  misses = index.cache_misses - cache_misses
+  latencies.sort()
+  first_latencies.sort()
+  return {"queries": len(latencies),
+          "wall_seconds": wall,
+          "search_seconds": sum(latencies),
+          "p50_ms": percentile(latencies, 50) * 1000,
+          "p95_ms": percentile(latencies, 95) * 1000,
+          "p99_ms": percentile(latencies, 99) * 1000,
+          "max_ms": latencies[-1] * 1000,
+          "queries_per_second": len(latencies) / max(sum(latencies), 1e-9),
+          "cache_hits": hits,
+          "cache_misses": misses,
+          "cache_hit_rate": float(hits) / max(hits + misses, 1),
+          "partial": partial,
+          "first_p50_ms": percentile(first_latencies, 50) * 1000,
+          "first_p95_ms": percentile(first_latencies, 95) * 1000}
+
+def batch(index, queries, max_hits):
+  """
+  Times searching for each distinct query in queries one at a time, then all
+  of them with one search_batch, both without the query cache.
+  """
+  distinct = []
+  for q in queries:
+    if q not in distinct:
+      distinct.append(q)
+  start = time.time()
+  for q in distinct:
+    index.search_nocache(q, max_hits)
+  one_at_a_time = time.time() - start
+
+  index.query_cache = fixed_size_dict.FixedSizeDict(256) # start cold
+  start = time.time()
+  index.search_batch(distinct, max_hits)
+  return {"one_at_a_time_seconds": one_at_a_time,
+          "batch_seconds": time.time() - start}
+
+def scale(options, num_files):
+  """Returns the scaling measurements for one generated tree of num_files."""
+  res = {"files": num_files, "crawl_seconds": 0}
+  tree = None
+  try:
+    if options.crawl:
+      from dir_cache import DirCache
+      tree = tempfile.mkdtemp()
+      corpus.write_tree(tree, num_files, options.seed)
+      start = time.time()
+      indexer = db_indexer.DBIndexer([tree], DirCache())
+      while not indexer.complete:
+        indexer.index_a_bit_more()
+      res["crawl_seconds"] = time.time() - start
+    else:
+      indexer = corpus.CorpusIndexer(num_files, options.seed)
+  finally:
+    if tree:
+      shutil.rmtree(tree, True)
+
+  start = time.time()
+  index = db_index.DBIndex(indexer, threaded = not options.single_threaded)
+  res["build_seconds"] = time.time() - start
+  try:
+    # Only what the daemon process holds; each shard keeps its own copy of
+    # the basenames on top of this.
+    nbytes = object_size.deep_getsizeof(index.files, index._lower_basename_ids,
+                                        index._lower_basename_starts, index._lower_basename_files,
+                                        index.dir_index, index._dir_starts, index._dir_files)
+    res["dirs"] = len(index.files.dirs)
+    res["index_mb"] = nbytes / (1024.0 * 1024.0)
+    res["bytes_per_file"] = float(nbytes) / max(len(index.files), 1)
+    queries = [(0, q) for q in corpus.sample_queries(index.files, options.queries, options.seed)]
+    res.update(replay(index, queries, options.max_hits, None, 0, 0))
+  finally:
+    index.close()
+  return res
+
+def crawl(dirs, dir_cache, fs, phase):
+  """
+  Indexes dirs with dir_cache, whose file system is the CountingFileSystem fs.
+  Returns the measurements.
+  """
+  fs.reset()
+  start = time.time()
+  indexer = db_indexer.DBIndexer(dirs, dir_cache)
+  while not indexer.complete:
+    indexer.index_a_bit_more()
+  seconds = time.time() - start
+
+  nfiles = len(indexer.files)
+  nbytes = object_size.deep_getsizeof(dir_cache.paths, dir_cache.dirs, dir_cache._real, indexer.files)
+  res = {"phase": phase,
+         "files": nfiles,
+         "dirs": len(dir_cache.dirs),
+         "seconds": seconds,
+         "files_per_second": nfiles / max(seconds, 1e-9),
+         "cache_mb": nbytes / (1024.0 * 1024.0),
+         "max_rss_mb": max_rss_mb()}
+  for name, count in fs.counts.items():
+    res[name + "_per_file"] = float(count) / max(nfiles, 1)
+  return res
+
+def index_memory(options):
+  """
+  Returns the size of the index's file tables next to that of what DBIndex
+  used to hold: every file as a full path string, three times over.
+  """
+  index, build_time = build_index(options)
+  try:
+    files = []
+    files_by_basename = dict()
+    files_by_lower_basename = dict()
+    for f in xrange(len(index.files)):
+      path = index.files.path(f)
+      basename = index.files.basename_of(f)
+      files.append(path)
+      files_by_basename.setdefault(basename, []).append(path)
+      files_by_lower_basename.setdefault(basename.lower(), []).append(path)
+    legacy_bytes = object_size.deep_getsizeof(files_by_basename, files, files_by_lower_basename)
+    nbytes = object_size.deep_getsizeof(index.files, index._lower_basename_ids,
+                                        index._lower_basename_starts, index._lower_basename_files)
+  finally:
+    index.close()
+  nfiles = max(len(files), 1)
+  return {"files": len(files),
+          "paths_mb": legacy_bytes / (1024.0 * 1024.0),
+          "paths_bytes_per_file": float(legacy_bytes) / nfiles,
+          "table_mb": nbytes / (1024.0 * 1024.0),
+          "table_bytes_per_file": float(nbytes) / nfiles}
+
+class _LegacyDirEnt(object):
+  def __init__(self, st_mtime, ents):
+    self.st_mtime = st_mtime
+    self.ents = ents
+
+def dir_cache_memory(dirs):
+  """
+  Walks dirs the way DBIndexer does with a DirCache. Returns its size next to
+  that of the dicts of path strings and DirEnts it replaced, filled the same
+  way.
+  """
+  from dir_cache import DirCache
+  c = DirCache()
+  legacy_dirs = dict()
+  legacy_rel_to_real = dict()
+  pending = [c.realpath(d) for d in dirs]
+  while len(pending):
+    d = pending.pop()
+    ents = c.listdir(d)
+    legacy_dirs[d] = _LegacyDirEnt(os.stat(d).st_mtime, list(ents))
+    for e in ents:
+      p = os.path.join(d, e)
+      r = c.realpath(p)
+      legacy_rel_to_real[p] = os.path.realpath(p)
+      if os.path.isdir(r) and r not in legacy_dirs:
+        pending.append(r)
+  legacy_bytes = object_size.deep_getsizeof(legacy_dirs, legacy_rel_to_real)
+  nbytes = object_size.deep_getsizeof(c.dirs, c.paths, c._real)
+  ndirs = max(len(legacy_dirs), 1)
+  return {"dirs": len(legacy_dirs),
+          "dir_paths_mb": legacy_bytes / (1024.0 * 1024.0),
+          "dir_paths_bytes_per_dir": float(legacy_bytes) / ndirs,
+          "dir_cache_mb": nbytes / (1024.0 * 1024.0),
+          "dir_cache_bytes_per_dir": float(nbytes) / ndirs}
+
+def startup_times(command, full_args, runs):
+  """Launches full_args runs times and returns the fastest and median time to exit."""
+  times = []
+  for i in range(runs):
+    start = time.time()
+    proc = subprocess.Popen(full_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    proc.communicate()
+    times.append(time.time() - start)
+  times.sort()
+  return {"command": command,
+          "min_ms": times[0] * 1000,
+          "median_ms": times[len(times) / 2] * 1000}
+
+def max_rss_mb():
+  """Peak resident memory of this process so far."""
+  import resource
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  if sys.platform == 'darwin':
+    return rss / (1024.0 * 1024.0) # bytes
+  return rss / 1024.0 # kilobytes
+
+def percentile(sorted_values, p):
+  """Nearest-rank percentile of an already sorted list."""
+  if not len(sorted_values):
+    return 0
+  rank = int(math.ceil(p / 100.0 * len(sorted_values)))
+  return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+def report(options, res, rows):
+  """
+  Prints res, either as a table of rows, a list of (key, format), or as JSON.
+  With --baseline, also shows how each row changed since that JSON report.
+  """
+  if options.json:
+    print json.dumps(res, indent = 2, sort_keys = True)
+    return 0
+  baseline = None
+  if options.baseline:
+    baseline = json.load(open(options.baseline))
+    print "%25s %12s %12s %8s" % ("", "this run", "baseline", "change")
+  for key, fmt in rows:
+    line = "%25s %12s" % (key, fmt % res[key])
+    if baseline and key in baseline:
+      old = baseline[key]
+      line += " %12s" % (fmt % old)
+      if old:
+        line += " %+7.1f%%" % ((res[key] - old) * 100.0 / old)
+    print line
+  return 0
+
+def report_columns(options, results, column_key, rows):
+  """
+  Like report, for a list of results that are shown a column each. With
+  --baseline, adds how each row changed for the columns whose column_key
+  value is also in the baseline.
+  """
+  if options.json:
+    print json.dumps(results, indent = 2, sort_keys = True)
+    return 0
+  baseline = dict()
+  if options.baseline:
+    baseline = dict([(r[column_key], r) for r in json.load(open(options.baseline))])
+  for key, fmt in rows:
+    line = "%18s" % key
+    for res in results:
+      line += " %12s" % (fmt % res[key])
+    print line
+    old = [baseline.get(res[column_key], {}).get(key) for res in results]
+    if key != column_key and len([o for o in old if o]):
+      line = "%18s" % "vs baseline"
+      for i in range(len(results)):
+        if old[i]:
+          line += " %+11.1f%%" % ((results[i][key] - old[i]) * 100.0 / old[i])
+        else:
+          line += " %12s" % ""
+      print line
+  return 0
+
+# Subcommand addins to optparse, taken from git-cl.py,
+# http://src.chromium.org/svn/trunk/tools/depot_tools/git_cl.py
+###########################################################################
+
+def Command(name):
+  return getattr(sys.modules[__name__], 'CMD' + name, None)
+
+def CMDhelp(parser):
+  """print list of commands or help for a specific command"""
+  _, args = parser.parse_args()
+  if len(args) == 1:
+    sys.argv = [args[0], '--help']
+    GenUsage(parser, 'help')
+    return CMDhelp(parser)
+  parser.print_help()
+  return 0
+
+def GenUsage(parser, command):
+  """Modify an OptParse object with the function's documentation."""
+  obj = Command(command)
+  more = getattr(obj, 'usage_more', '')
+  if command == 'help':
+    command = '<command>'
+  else:
+    parser.description = re.sub('[\r\n ]{2,}', ' ', obj.__doc__)
+  parser.set_usage('usage: %%prog %s [options] %s' % (command, more))
+
+def main_usage():
+  return "Usage: benchmark [global options] <command> [command arguments]"
+
+def main(parser):
+  parser.add_option('--files', dest='files', action='store', default=DEFAULT_FILES, help='Index the files in this dump: JSON like test_data, or one path per line. Default %s' % DEFAULT_FILES)
+  parser.add_option('--dir', dest='dir', action='append', help='Index this tree instead of a dump; repeat for several')
+  parser.add_option('--single-threaded', dest='single_threaded', action='store_true', default=False, help='Search with one shard')
+  parser.add_option('--json', dest='json', action='store_true', default=False, help='Print the results as JSON, to save as a --baseline')
+  parser.add_option('--baseline', dest='baseline', action='store', help='Compare with the results of an earlier --json run')
+
+  CMDhelp.usage_more = ('\n\nCommands are:\n' + '\n'.join([
+        '  %-10s %s' % (fn[3:], Command(fn[3:]).__doc__.split('\n')[0].strip())
+        for fn in dir(sys.modules[__name__]) if fn.startswith('CMD')]))
+  non_switch_args = [i for i in sys.argv[1:] if not i.startswith('-')]
+  if non_switch_args and Command(non_switch_args[0]):
+    GenUsage(parser, non_switch_args[0])
+    new_args = list(sys.argv[1:])
+    new_args.remove(non_switch_args[0])
+    new_args.insert(0, sys.argv[0])
+    sys.argv = new_args
+    return Command(non_switch_args[0])(parser)
+  GenUsage(parser, 'help')
+  return CMDhelp(parser)
@@ -0,0 +1,111 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import benchmark
+import corpus
+import db_index
+import db_indexer
+import dir_cache
+import json
+import shutil
+import tempfile
+import unittest
+
+class BenchmarkTest(unittest.TestCase):
+  def test_percentile(self):
+    values = range(1, 101)
+    self.assertEquals(50, benchmark.percentile(values, 50))
+    self.assertEquals(95, benchmark.percentile(values, 95))
+    self.assertEquals(100, benchmark.percentile(values, 100))
+    self.assertEquals(7, benchmark.percentile([7], 99))
+    self.assertEquals(0, benchmark.percentile([], 50))
+
+  def test_read_query_log(self):
+    f = tempfile.NamedTemporaryFile()
+    f.write(json.dumps({"t": 2, "q": "foo", "n": 1, "ms": 3}) + "\n")
+    f.write(json.dumps({"ts": 1, "query": "fo"}) + "\n")
+    f.write('{"t": 3, "q": "fo') # cut short
+    f.flush()
+    self.assertEquals([(1, "fo"), (2, "foo")], benchmark.read_query_log(f.name))
+    f.close()
+
+  def test_replay(self):
+    index = db_index.DBIndex(db_indexer.MockIndexer('test_data/cr_files_by_basename_five_percent.json'), threaded = False)
+    try:
+      queries = [(0, 'r'), (0, 'rw'), (0, 'rwh'), (0, 'rw')]
+      res = benchmark.replay(index, queries, 100, None, 0, 1)
+    finally:
+      index.close()
+    self.assertEquals(4, res["queries"])
+    self.assertEquals(1, res["cache_hits"])
+    self.assertEquals(3, res["cache_misses"])
+    self.assertTrue(res["p50_ms"] <= res["p99_ms"] <= res["max_ms"])
+
+  def test_replay_progressive(self):
+    index = db_index.DBIndex(db_indexer.MockIndexer('test_data/cr_files_by_basename_five_percent.json'), threaded = False)
+    try:
+      searches = []
+      res = benchmark.replay(index, [(0, 'rwhv'), (0, 'src/web')], 100, None, 0, 1, True, searches)
+      res.update(benchmark.batch(index, ['rwhv', 'src/web', 'rwhv'], 100))
+    finally:
+      index.close()
+    self.assertEquals(['rwhv', 'src/web'], [q for q, first, seconds in searches])
+    for q, first, seconds in searches:
+      self.assertTrue(first <= seconds)
+    self.assertTrue(res["first_p50_ms"] <= res["p50_ms"])
+    self.assertTrue(res["batch_seconds"] > 0)
+    self.assertTrue(res["one_at_a_time_seconds"] > 0)
+
+  def test_memory(self):
+    class Options(object):
+      dir = None
+      files = 'test_data/cr_files_by_basename_five_percent.json'
+      single_threaded = True
+    res = benchmark.index_memory(Options())
+    self.assertTrue(res["files"] > 0)
+    self.assertTrue(0 < res["table_mb"] < res["paths_mb"])
+    root = tempfile.mkdtemp()
+    try:
+      corpus.write_tree(root, 100)
+      res = benchmark.dir_cache_memory([root])
+    finally:
+      shutil.rmtree(root)
+    self.assertTrue(res["dirs"] > 1)
+    self.assertTrue(0 < res["dir_cache_mb"] < res["dir_paths_mb"])
+
+  def test_scale(self):
+    class Options(object):
+      seed = 0
+      queries = 8
+      max_hits = 10
+      crawl = False
+      single_threaded = True
+    res = benchmark.scale(Options(), 2000)
+    self.assertEquals(2000, res["files"])
+    self.assertEquals(8, res["queries"])
+    self.assertTrue(res["bytes_per_file"] > 0)
+
+  def test_crawl(self):
+    root = tempfile.mkdtemp()
+    try:
+      corpus.write_tree(root, 500)
+      fs = dir_cache.CountingFileSystem()
+      cache = dir_cache.DirCache(fs)
+      cold = benchmark.crawl([root], cache, fs, "cold")
+      warm = benchmark.crawl([root], cache, fs, "warm")
+    finally:
+      shutil.rmtree(root)
+    self.assertEquals(500, cold["files"])
+    self.assertEquals(500, warm["files"])
+    self.assertTrue(cold["listdir_per_file"] > 0)
+    self.assertEquals(0, warm["listdir_per_file"])
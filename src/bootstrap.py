@@ -48,14 +48,6 @@ def run():
 
 def handle_options(options, args):
   """Called by bootstrapper to process global commandline options."""
-  import message_loop
-  if not message_loop.has_toolkit:
-    suports = ['PyGtk', 'WxPython', 'Curses']
-    if '--objc' in sys.argv:
-      suports.append('PyObjC')
-    print """No supported GUI toolkit found. Trace_event_viewer supports %s.""" % ", ".join(supports)
-    return -1
-
   if options.verbose >= 2:
     logging.basicConfig(level=logging.DEBUG)
   elif options.verbose:
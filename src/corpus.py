@@ -0,0 +1,232 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import bisect
+import collections
+import json
+import os
+import random
+
+from file_table import FileTable
+
+# Synthetic monorepo-shaped file trees for the scaling benchmarks. The shape
+# follows test_data/cr_files_by_basename_five_percent.json: most dirs hold a
+# handful of files, a few hold hundreds, paths are 6-12 components deep, and
+# basenames are a few code-ish words in snake_case with a skew towards some
+# words, sibling .cc/.h/_unittest.cc families and BUILD/OWNERS-style names
+# repeated in every dir.
+
+TOP_DIRS = ['base', 'build', 'chrome', 'components', 'content', 'docs', 'gpu',
+            'media', 'net', 'services', 'testing', 'third_party', 'tools', 'ui']
+
+# Most common first; _zipf_choice makes the n-th word about 1/n as likely as the first.
+WORDS = [
+  'test', 'util', 'base', 'browser', 'common', 'content', 'view', 'file',
+  'net', 'host', 'web', 'impl', 'resource', 'manager', 'data', 'render',
+  'page', 'frame', 'string', 'url', 'http', 'cache', 'request', 'input',
+  'event', 'layout', 'style', 'dom', 'media', 'audio', 'video', 'gpu',
+  'image', 'font', 'text', 'list', 'map', 'tree', 'node', 'parser', 'token',
+  'debug', 'trace', 'log', 'metrics', 'stats', 'profile', 'config',
+  'settings', 'options', 'command', 'shell', 'process', 'thread', 'task',
+  'queue', 'pool', 'worker', 'message', 'loop', 'ipc', 'socket', 'server',
+  'client', 'proxy', 'auth', 'crypto', 'cert', 'key', 'hash', 'store', 'db',
+  'index', 'search', 'query', 'result', 'match', 'sandbox', 'policy',
+  'window', 'dialog', 'menu', 'button', 'label', 'panel', 'layer', 'surface',
+  'paint', 'canvas', 'scroll', 'touch', 'mouse', 'keyboard', 'clipboard',
+  'download', 'update', 'install', 'extension', 'plugin', 'module', 'loader',
+  'bundle', 'package', 'manifest', 'version', 'platform', 'win', 'mac',
+  'linux', 'android', 'posix', 'internal', 'public', 'api', 'bindings',
+  'observer', 'delegate', 'factory', 'controller', 'service', 'helper',
+  'handler', 'provider', 'registry', 'tracker', 'monitor', 'watcher',
+  'scheduler', 'timer', 'clock', 'time', 'locale', 'unicode', 'json', 'xml',
+  'html', 'svg', 'zip', 'stream', 'buffer', 'memory', 'allocator', 'heap',
+  'stack', 'ref', 'ptr', 'weak', 'scoped', 'callback', 'bind', 'promise',
+  'sync', 'tab', 'omnibox', 'bookmark', 'history', 'password', 'autofill',
+  'printing', 'storage', 'quota', 'blob', 'fetch', 'cookie', 'dns', 'quic',
+  'spdy', 'ssl', 'tcp', 'udp', 'shader', 'texture', 'mojo', 'accessibility',
+  'animation', 'compositor', 'display', 'screen', 'color', 'icon', 'theme']
+
+# (extension, weight) roughly as they occur in the Chromium sample
+EXTENSIONS = [
+  ('.txt', 24), ('.png', 16), ('.html', 12), ('.h', 10), ('.cc', 9),
+  ('.js', 6), ('.json', 4), ('.cpp', 3), ('.py', 2), ('.c', 2), ('.svg', 1),
+  ('.xhtml', 1), ('.mm', 1), ('.idl', 1), ('.gn', 1), ('.java', 2), ('', 1)]
+
+# names found in many dirs, with the chance that a given dir has each
+COMMON_NAMES = [('BUILD.gn', 0.3), ('OWNERS', 0.2), ('README.md', 0.05),
+                ('DEPS', 0.05), ('__init__.py', 0.03), ('Makefile', 0.02)]
+
+class _Weighted(object):
+  def __init__(self, values, weights):
+    self.values = values
+    self.cumulative = []
+    total = 0
+    for w in weights:
+      total += w
+      self.cumulative.append(total)
+
+  def choice(self, rng):
+    i = bisect.bisect_right(self.cumulative, rng.random() * self.cumulative[-1])
+    return self.values[min(i, len(self.values) - 1)]
+
+_words = _Weighted(WORDS, [1.0 / (i + 1) for i in range(len(WORDS))])
+_extensions = _Weighted([e for e, w in EXTENSIONS], [w for e, w in EXTENSIONS])
+
+def _stem(rng):
+  n = rng.choice((1, 2, 2, 2, 3, 3, 4))
+  return '_'.join([_words.choice(rng) for i in range(n)])
+
+def _dir_files(rng, n):
+  """Returns n distinct basenames for one dir."""
+  names = []
+  seen = set()
+  def add(name):
+    if name not in seen and len(names) < n:
+      seen.add(name)
+      names.append(name)
+  for name, p in COMMON_NAMES:
+    if rng.random() < p:
+      add(name)
+  misses = 0
+  while len(names) < n and misses < 100:
+    before = len(names)
+    stem = _stem(rng)
+    ext = _extensions.choice(rng)
+    if ext in ('.cc', '.h', '.cpp', '.mm'):
+      # C++ comes in families: foo.h, foo.cc, foo_unittest.cc, foo_win.cc
+      add(stem + '.h')
+      add(stem + ext)
+      if rng.random() < 0.3:
+        add(stem + '_unittest' + ext)
+      if rng.random() < 0.1:
+        add(stem + '_' + rng.choice(('win', 'mac', 'linux', 'android')) + ext)
+    elif ext == '.png' and rng.random() < 0.5:
+      # icons come in sizes
+      for size in rng.sample((16, 24, 32, 48, 64, 128), rng.randint(2, 4)):
+        add('%s_%i%s' % (stem, size, ext))
+    elif ext == '.txt' and rng.random() < 0.5:
+      # layout test expectations: foo.html next to foo-expected.txt
+      add(stem + '.html')
+      add(stem + '-expected.txt')
+    else:
+      add(stem + ext)
+    if len(names) == before:
+      misses += 1
+  n = len(names)
+  i = 0
+  while len(names) < n:
+    add('file%i%s' % (i, _extensions.choice(rng)))
+    i += 1
+  return names
+
+def generate(num_files, seed = 0):
+  """
+  Yields the relative paths of a synthetic tree with exactly num_files files,
+  in the order a crawl would find them. The same seed always gives the same
+  tree.
+  """
+  rng = random.Random(seed)
+  pending = collections.deque([(d, 1) for d in TOP_DIRS])
+  remaining = num_files
+  extra_top_dirs = 0
+  while remaining > 0:
+    if not len(pending):
+      # the tree died out: start another vendored project
+      extra_top_dirs += 1
+      pending.append((os.path.join('third_party', '%s%i' % (_words.choice(rng), extra_top_dirs)), 2))
+    d, depth = pending.popleft()
+
+    # A few huge dirs (test expectations, icons) and many small ones.
+    n = min(remaining, int(rng.lognormvariate(1.2, 1.3)))
+    basenames = _dir_files(rng, n)
+    for basename in basenames:
+      yield os.path.join(d, basename)
+    remaining -= n
+
+    # Keep the tree growing while it is shallow, then let branches end.
+    if depth < 3:
+      nsubdirs = rng.randint(3, 8)
+    elif depth < 12:
+      nsubdirs = rng.choice((0, 0, 1, 1, 1, 2, 2, 3, 4))
+    else:
+      nsubdirs = 0
+    names = set(basenames) # a subdir can't share a name with a file
+    for i in range(nsubdirs):
+      name = rng.random() < 0.8 and _words.choice(rng) or _stem(rng)
+      if name not in names:
+        names.add(name)
+        pending.append((os.path.join(d, name), depth + 1))
+
+class CorpusIndexer(object):
+  """An indexer for a generated tree under root, without touching the disk."""
+  def __init__(self, num_files, seed = 0, root = '~/corpus'):
+    self.files = FileTable()
+    self.roots = []
+    for path in generate(num_files, seed):
+      path = os.path.join(root, path)
+      self.files.add(os.path.basename(path), path)
+
+def write_tree(root, num_files, seed = 0):
+  """Creates the generated tree under root as empty files."""
+  made = set()
+  for path in generate(num_files, seed):
+    d = os.path.join(root, os.path.dirname(path))
+    if d not in made:
+      if not os.path.exists(d):
+        os.makedirs(d)
+      made.add(d)
+    open(os.path.join(root, path), 'w').close()
+
+def write_dump(filename, num_files, seed = 0, root = '~/corpus'):
+  """
+  Writes the generated tree in a format MockIndexer loads: basename -> [paths]
+  JSON if filename ends in .json, else one path per line.
+  """
+  f = open(filename, 'w')
+  try:
+    if filename.endswith('.json'):
+      files_by_basename = dict()
+      for path in generate(num_files, seed):
+        path = os.path.join(root, path)
+        files_by_basename.setdefault(os.path.basename(path), []).append(path)
+      json.dump(files_by_basename, f)
+    else:
+      for path in generate(num_files, seed):
+        f.write(os.path.join(root, path) + '\n')
+  finally:
+    f.close()
+
+def sample_queries(files, count, seed = 0):
+  """
+  Returns count queries for a FileTable, mixing what people type: a prefix of
+  a basename, the first letters of its words, a whole basename and
+  dir/basename.
+  """
+  rng = random.Random(seed)
+  queries = []
+  while len(queries) < count and len(files):
+    path = files.path(rng.randrange(len(files)))
+    basename = os.path.basename(path)
+    stem = os.path.splitext(basename)[0]
+    kind = len(queries) % 4
+    if kind == 0:
+      query = stem[:rng.randint(3, 8)]
+    elif kind == 1:
+      query = ''.join([w[0] for w in stem.replace('-', '_').split('_') if len(w)])
+    elif kind == 2:
+      query = basename
+    else:
+      query = os.path.join(os.path.basename(os.path.dirname(path)), stem[:rng.randint(2, 5)])
+    if len(query) >= 2:
+      queries.append(query)
+  return queries
@@ -0,0 +1,72 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import collections
+import corpus
+import db_indexer
+import dir_cache
+import os
+import shutil
+import tempfile
+import unittest
+
+class CorpusTest(unittest.TestCase):
+  def test_generate_is_deterministic(self):
+    self.assertEquals(list(corpus.generate(2000, 1)), list(corpus.generate(2000, 1)))
+    self.assertNotEquals(list(corpus.generate(2000, 1)), list(corpus.generate(2000, 2)))
+
+  def test_generate_size(self):
+    for n in (0, 1, 10, 5000):
+      paths = list(corpus.generate(n))
+      self.assertEquals(n, len(paths))
+      self.assertEquals(n, len(set(paths)))
+
+  def test_generate_shape(self):
+    paths = list(corpus.generate(20000))
+    files_per_dir = collections.Counter([os.path.dirname(p) for p in paths])
+    self.assertTrue(len(files_per_dir) > 1000)
+    self.assertTrue(max(files_per_dir.values()) > 100)
+    basenames = collections.Counter([os.path.basename(p) for p in paths])
+    self.assertTrue(basenames['BUILD.gn'] > 100)
+    self.assertTrue(len(basenames) < len(paths))
+    dirs = set(files_per_dir.keys())
+    self.assertEquals([], [p for p in paths if p in dirs])
+
+  def test_corpus_indexer(self):
+    indexer = corpus.CorpusIndexer(1000)
+    self.assertEquals(1000, len(indexer.files))
+    self.assertEquals(os.path.join('~/corpus', list(corpus.generate(1))[0]), indexer.files.path(0))
+
+  def test_write_dump(self):
+    for suffix in ('.json', '.txt'):
+      f = tempfile.NamedTemporaryFile(suffix = suffix)
+      corpus.write_dump(f.name, 1000)
+      self.assertEquals(1000, len(db_indexer.MockIndexer(f.name).files))
+      f.close()
+
+  def test_write_tree(self):
+    root = tempfile.mkdtemp()
+    try:
+      corpus.write_tree(root, 500)
+      indexer = db_indexer.DBIndexer([root], dir_cache.DirCache())
+      while not indexer.complete:
+        indexer.index_a_bit_more()
+      self.assertEquals(500, len(indexer.files))
+    finally:
+      shutil.rmtree(root)
+
+  def test_sample_queries(self):
+    indexer = corpus.CorpusIndexer(1000)
+    queries = corpus.sample_queries(indexer.files, 20)
+    self.assertEquals(20, len(queries))
+    self.assertEquals(queries, corpus.sample_queries(indexer.files, 20))
@@ -11,17 +11,25 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import errno
 import json
 import logging
 import re
 import select
+import socket
 import sys
+import time
 import traceback
 import urlparse
 import BaseHTTPServer
+import metrics
 
 from event import Event
 
+REQUEST_SECONDS = metrics.histogram('quickopen_request_seconds',
+                                    'Time requests spend waiting to be handled, in their handler and serializing the response',
+                                    ('route', 'phase'))
+
 """
 Exception that you can throw in a handler that will trigger a 404 response.
 """
@@ -37,34 +45,122 @@ class SilentException(Exception):
   def __init__(self,*args):
     Exception.__init__(self, *args)
 
+# How long handle_immediate_requests waits for a new connection's request line.
+IMMEDIATE_REQUEST_LINE_WAIT = 0.01
+
+def _select(r, w, x, timeout):
+  """
+  select.select, retried for the rest of timeout when a signal interrupts it.
+  The sampling profiler's SIGPROF does, and select is never restarted.
+  """
+  deadline = time.time() + timeout
+  while True:
+    try:
+      return select.select(r, w, x, timeout)
+    except select.error, ex:
+      if ex.args[0] != errno.EINTR:
+        raise
+      timeout = max(0, deadline - time.time())
+
+class DeferredResponse(object):
+  """
+  Return one of these from a json route handler to answer the request later,
+  for example from an idle handler. The connection is held open until
+  complete() is called.
+  """
+  def __init__(self):
+    self._daemon = None
+    self._request = None
+    self.completed = False
+
+  def complete(self, obj):
+    if self.completed:
+      return
+    self.completed = True
+    self._daemon._complete_deferred(self._request, obj)
+
 class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
   def __init__(self, request, client_address, server):
     BaseHTTPServer.BaseHTTPRequestHandler.__init__(self, request, client_address, server)
     self.server = server
 
   def send_json(self, obj, resp_code=200, resp_code_str='OK'):
-    text = json.dumps(obj)
+    self.send_text(json.dumps(obj), 'application/json', resp_code, resp_code_str)
+
+  def send_text(self, text, content_type, resp_code=200, resp_code_str='OK'):
     try:
       self.send_response(resp_code, resp_code_str)
       self.send_header('Cache-Control', 'no-cache')
-      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Type', content_type)
       self.send_header('Content-Length', len(text))
       self.end_headers()
       self.wfile.write(text)
     except IOError:
       return
 
+  def send_json_stream(self, objs):
+    """
+    Sends each object from the iterable objs as a line of json as soon as it
+    is produced. The body ends when the connection closes.
+    """
+    # errors from the first object can still become a 500
+    objs = iter(objs)
+    try:
+      first = [objs.next()]
+    except StopIteration:
+      first = []
+    try:
+      self.send_response(200, 'OK')
+      self.send_header('Cache-Control', 'no-cache')
+      self.send_header('Content-Type', 'application/x-json-stream')
+      self.end_headers()
+      for obj in first:
+        self.wfile.write(json.dumps(obj) + "\n")
+        self.wfile.flush()
+      for obj in objs:
+        self.wfile.write(json.dumps(obj) + "\n")
+        self.wfile.flush()
+    except IOError:
+      return # the client went away
+    except Exception:
+      # too late to send a 500; the client just gets a shorter stream
+      traceback.print_exc()
+
   def send_result(self, route, obj):
+    if isinstance(obj, DeferredResponse):
+      self.server._defer(self.request, obj)
+      return
     if route.output == 'json':
-      self.send_json(obj)
+      start = time.time()
+      text = json.dumps(obj)
+      REQUEST_SECONDS.labels(route.name, 'serialize').observe(time.time() - start)
+      self.send_text(text, 'application/json')
+    elif route.output == 'text':
+      self.send_text(obj, route.content_type)
+    elif route.output == 'json_stream':
+      self.send_json_stream(obj)
     else:
       raise Exception('Unrecognized output type: ' + route.output)
 
+  # The client may hang up on a canceled request before we reply.
+  def handle(self):
+    try:
+      BaseHTTPServer.BaseHTTPRequestHandler.handle(self)
+    except socket.error:
+      pass
+
+  def finish(self):
+    try:
+      BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+    except socket.error:
+      pass
+
   def log_message(self, format, *args):
     logging.info(format, args)
 
   def handleRequest(self, verb):
     path = urlparse.urlsplit(self.path)[2]
+    accepted = self.server._accept_times.pop(self.request, None)
 
     if 'Content-Length' in self.headers:
       cl = int(self.headers['Content-Length'])
@@ -86,8 +182,15 @@ class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
     (route,verb_ok,match) = self.server.find_route_matching(path, verb)
     if route:
       if verb_ok:
+        # immediate routes can run while another request is being handled
+        outer_request = self.server.current_request
+        self.server.current_request = self.request
         try:
+          start = time.time()
+          if accepted:
+            REQUEST_SECONDS.labels(route.name, 'queue').observe(start - accepted)
           resp = route.handler(match, verb, obj)
+          REQUEST_SECONDS.labels(route.name, 'handle').observe(time.time() - start)
           self.send_result(route, resp)
         except Exception, ex:
           if not isinstance(ex,SilentException):
@@ -105,6 +208,8 @@ class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
               self.send_json(info, 500, 'Exception in handler')
           except IOError:
             return
+        finally:
+          self.server.current_request = outer_request
       else:
         self.send_response(405, 'Method Not Allowed')
         self.send_header('Content-Length', 0)
@@ -124,23 +229,33 @@ class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
     self.handleRequest('POST')
 
 class Route(object):
-  def __init__(self, path_regex, output, handler, allowed_verbs):
+  def __init__(self, path_regex, output, handler, allowed_verbs, immediate, content_type = None):
     self.allowed_verbs = set(allowed_verbs)
     self.path_regex = path_regex
+    # what the route is called in metrics: its path with each group as a *,
+    # so /dirs/([a-zA-Z0-9]+) is dirs/*
+    self.name = re.sub(r'\([^)]*\)', '*', path_regex).strip('/')
     self.output = output
+    self.content_type = content_type # of text routes
     self.handler = handler
+    self.immediate = immediate
 
 class Daemon(BaseHTTPServer.HTTPServer):
   def __init__(self, test_mode, *args):
     BaseHTTPServer.HTTPServer.__init__(self, *args)
     self.port_ = args[0][1]
     self.routes = []
+    self._deferred_requests = set()
+    self._queued_requests = [] # (request, client_address) accepted by handle_immediate_requests
+    self._accept_times = dict() # request -> when it was accepted
+    self.current_request = None # socket of the request being handled
     self.test_mode = test_mode
     self.hi_idle = Event() # event that is fired every 0.05sec as long as no transactions are pending
     self.lo_idle = Event() # event that is fired once a second
     self.exit = Event()
 
     self.add_json_route('/exit', self.on_exit, ['POST', 'GET'])
+    self.add_text_route('/metrics', self.on_metrics, ['GET'], metrics.CONTENT_TYPE)
 
     if test_mode:
       import daemon_test
@@ -152,9 +267,31 @@ class Daemon(BaseHTTPServer.HTTPServer):
     self.exit.fire()
     return {"status": "OK"}
 
-  def add_json_route(self, path_regex, handler, allowed_verbs):
+  def on_metrics(self, m, verb, data):
+    return metrics.registry.render()
+
+  def add_json_route(self, path_regex, handler, allowed_verbs, immediate = False):
+    """
+    Adds a route. Immediate routes are also handled in the middle of other
+    requests that call handle_immediate_requests, so their handlers must be
+    quick and must not depend on the interrupted request having finished.
+    """
+    re.compile(path_regex)
+    self.routes.append(Route(path_regex, 'json', handler, allowed_verbs, immediate))
+
+  def add_json_stream_route(self, path_regex, handler, allowed_verbs):
+    """
+    Adds a route whose handler returns an iterable, typically a generator. The
+    client gets each of its objects as a line of json as soon as it is
+    produced, rather than one response at the end.
+    """
     re.compile(path_regex)
-    self.routes.append(Route(path_regex, 'json', handler, allowed_verbs))
+    self.routes.append(Route(path_regex, 'json_stream', handler, allowed_verbs, False))
+
+  def add_text_route(self, path_regex, handler, allowed_verbs, content_type = 'text/plain'):
+    """Adds a route whose handler returns a string, sent as content_type."""
+    re.compile(path_regex)
+    self.routes.append(Route(path_regex, 'text', handler, allowed_verbs, False, content_type))
 
   def find_route_matching(self, path, verb):
     found_route = None
@@ -169,9 +306,108 @@ class Daemon(BaseHTTPServer.HTTPServer):
       return (r, False, m)
     return (None, None, None)
 
+  def _defer(self, request, deferred):
+    deferred._daemon = self
+    deferred._request = request
+    self._deferred_requests.add(request)
+
+  def _complete_deferred(self, request, obj):
+    text = json.dumps(obj)
+    try:
+      request.sendall("HTTP/1.0 200 OK\r\n"
+                      "Cache-Control: no-cache\r\n"
+                      "Content-Type: application/json\r\n"
+                      "Content-Length: %i\r\n"
+                      "\r\n%s" % (len(text), text))
+    except socket.error:
+      pass # the client went away
+    self._deferred_requests.remove(request)
+    self.shutdown_request(request)
+
+  def get_request(self):
+    request, client_address = BaseHTTPServer.HTTPServer.get_request(self)
+    self._accept_times[request] = time.time()
+    return request, client_address
+
+  # SocketServer closes each request's socket once its handler returns; deferred
+  # requests keep theirs until they are completed.
+  def shutdown_request(self, request):
+    self._accept_times.pop(request, None)
+    if request in self._deferred_requests:
+      return
+    BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+  def close_request(self, request):
+    self._accept_times.pop(request, None)
+    if request in self._deferred_requests:
+      return
+    BaseHTTPServer.HTTPServer.close_request(self, request)
+
+  def current_client_disconnected(self):
+    """Whether the client of the request being handled has hung up."""
+    request = self.current_request
+    if not request:
+      return False
+    r, w, e = _select([request], [], [], 0)
+    if not r:
+      return False
+    try:
+      return request.recv(1, socket.MSG_PEEK) == ''
+    except socket.error:
+      return True
+
+  def handle_immediate_requests(self):
+    """
+    Called by long-running handlers to serve requests for immediate routes
+    that arrived while they ran. Any other new requests are handled once the
+    current one finishes.
+    """
+    while True:
+      r, w, e = _select([self], [], [], 0)
+      if not r:
+        return
+      try:
+        request, client_address = self.get_request()
+      except socket.error:
+        return
+      if self._is_immediate(request):
+        self._process_accepted_request(request, client_address)
+      else:
+        self._queued_requests.append((request, client_address))
+
+  def _is_immediate(self, request):
+    # peek at the request line without consuming it
+    r, w, e = _select([request], [], [], IMMEDIATE_REQUEST_LINE_WAIT)
+    if not r:
+      return False
+    try:
+      line = request.recv(1024, socket.MSG_PEEK).split('\r\n', 1)[0].split(' ')
+    except socket.error:
+      return False
+    if len(line) < 2:
+      return False
+    path = urlparse.urlsplit(line[1])[2]
+    (route, verb_ok, match) = self.find_route_matching(path, line[0])
+    return route != None and verb_ok and route.immediate
+
+  def _process_accepted_request(self, request, client_address):
+    # what SocketServer does with a request once it is accepted
+    if self.verify_request(request, client_address):
+      try:
+        self.process_request(request, client_address)
+      except:
+        self.handle_error(request, client_address)
+        self.shutdown_request(request)
+    else:
+      self.shutdown_request(request)
+
   def serve_forever(self):
     self.is_running_ = True
     while self.is_running_:
+      while len(self._queued_requests) and self.is_running_:
+        (request, client_address) = self._queued_requests.pop(0)
+        self._process_accepted_request(request, client_address)
+
       if self.hi_idle.has_listeners:
         delay = 0.05
         fire_lo_idle_listeners = False
@@ -179,7 +415,7 @@ class Daemon(BaseHTTPServer.HTTPServer):
         delay = 1
         fire_lo_idle_listeners = True
 
-      r, w, e = select.select([self], [], [], delay)
+      r, w, e = _select([self], [], [], delay)
       if r:
         self.handle_request()
       else:
@@ -89,6 +89,59 @@ class DaemonTest(unittest.TestCase):
     x = json.loads(res.read())
     self.assertEquals(x["status"], 'OK')
 
+  def test_deferred_response(self):
+    self.conn.request('POST', '/test_deferred', json.dumps('deferred_ok'))
+    res = self.conn.getresponse()
+    self.assertEquals(res.status, 200)
+    self.assertEquals(json.loads(res.read()), 'deferred_ok')
+
+  def test_json_stream(self):
+    self.conn.request('GET', '/test_stream')
+    res = self.conn.getresponse()
+    self.assertEquals(res.status, 200)
+    self.assertEquals([1, 2, 3], [json.loads(l) for l in res.read().splitlines()])
+
+  def test_metrics(self):
+    self.get_json('/test_simple')
+    self.conn.request('GET', '/metrics')
+    res = self.conn.getresponse()
+    self.assertEquals(res.status, 200)
+    self.assertEquals('text/plain; version=0.0.4', res.getheader('Content-Type'))
+    lines = res.read().splitlines()
+    self.assertTrue('# TYPE quickopen_request_seconds histogram' in lines)
+    self.assertTrue('quickopen_request_seconds_count{route="test_simple",phase="handle"} 1' in lines)
+    self.assertTrue('quickopen_request_seconds_count{route="test_simple",phase="queue"} 1' in lines)
+
+  def test_metrics_route_names(self):
+    self.get_json('/test_complex/2')
+    self.conn.request('GET', '/metrics')
+    lines = self.conn.getresponse().read().splitlines()
+    self.assertTrue('quickopen_request_seconds_count{route="test_complex/*",phase="handle"} 1' in lines)
+
+  def test_text(self):
+    self.conn.request('GET', '/test_text')
+    res = self.conn.getresponse()
+    self.assertEquals(res.status, 200)
+    self.assertEquals('text/plain', res.getheader('Content-Type'))
+    self.assertEquals('text_ok', res.read())
+
+  def test_json_stream_exception(self):
+    self.conn.request('GET', '/test_failing_stream')
+    res = self.conn.getresponse()
+    self.assertEquals(res.status, 500)
+
+  def test_immediate_route_runs_during_other_request(self):
+    self.conn.request('GET', '/test_wait_for_poke')
+    conn2 = httplib.HTTPConnection(self.daemon.host, self.daemon.port, True)
+    conn2.request('POST', '/test_poke')
+    res = conn2.getresponse()
+    self.assertEquals(res.status, 200)
+    self.assertEquals(json.loads(res.read()), 'OK')
+    conn2.close()
+    res = self.conn.getresponse()
+    self.assertEquals(res.status, 200)
+    self.assertEquals(json.loads(res.read()), 'poked')
+
   def tearDown(self):
     if self.conn:
       self.conn.close()
@@ -124,9 +177,50 @@ def add_test_handlers_to_daemon(daemon):
     return x
   daemon.add_json_route('/test_dyn_obj', handler_for_obj, ['GET'])
 
+  def handler_for_text(m, verb, data):
+    return 'text_ok'
+  daemon.add_text_route('/test_text', handler_for_text, ['GET'])
+
 
   def handler_for_sleep(m, verb, data):
     import time
     time.sleep(0.25)
     return 'OK'
   daemon.add_json_route('/sleep', handler_for_sleep, ['GET'])
+
+  def handler_for_deferred(m, verb, data):
+    d = daemon_module.DeferredResponse()
+    def complete():
+      daemon.hi_idle.remove_listener(complete)
+      d.complete(data)
+    daemon.hi_idle.add_listener(complete)
+    return d
+  daemon.add_json_route('/test_deferred', handler_for_deferred, ['POST'])
+
+  def handler_for_stream(m, verb, data):
+    for i in range(1, 4):
+      yield i
+  daemon.add_json_stream_route('/test_stream', handler_for_stream, ['GET'])
+
+  def handler_for_failing_stream(m, verb, data):
+    raise daemon_module.SilentException('Server side error')
+    yield 1
+  daemon.add_json_stream_route('/test_failing_stream', handler_for_failing_stream, ['GET'])
+
+  poked = []
+  def handler_for_wait_for_poke(m, verb, data):
+    import time
+    start = time.time()
+    while not len(poked) and time.time() - start < 5:
+      daemon.handle_immediate_requests()
+      time.sleep(0.01)
+    if len(poked):
+      del poked[:]
+      return 'poked'
+    return 'not poked'
+  daemon.add_json_route('/test_wait_for_poke', handler_for_wait_for_poke, ['GET'])
+
+  def handler_for_poke(m, verb, data):
+    poked.append(True)
+    return 'OK'
+  daemon.add_json_route('/test_poke', handler_for_poke, ['POST'], immediate = True)
@@ -14,13 +14,19 @@
 import hashlib
 import logging
 import os
+import time
 
 import daemon
-from db_index import DBIndex, DBIndexSearchResult
+import metrics
+import sampling_profiler
+import slow_query_log
+from db_index import DBIndex
 from db_indexer import DBIndexer
+from db_types import DBStatus, DBIndexSearchResult
 from dir_cache import DirCache
 from event import Event
 from trace_event import *
+from usage_store import UsageStore
 
 DEFAULT_IGNORES=[
   ".*",
@@ -31,28 +37,15 @@ DEFAULT_IGNORES=[
   "#*",
 ]
 
+INDEXER_FILES = metrics.counter('quickopen_indexer_files_total', 'Files found by the crawl')
+INDEXER_SECONDS = metrics.counter('quickopen_indexer_seconds_total', 'Time spent crawling')
+INDEX_BUILD_SECONDS = metrics.histogram('quickopen_index_build_seconds', 'Time taken to build an index once the crawl finishes')
+INDEXED_FILES = metrics.gauge('quickopen_indexed_files', 'Files in the index being searched')
+SLOW_SEARCHES = metrics.counter('quickopen_slow_searches_total', 'Searches that took slow_query_ms or more')
+
 class DBException(daemon.SilentException):
   pass
 
-class DBStatus(object):
-  def __init__(self):
-    self.is_up_to_date = False
-    self.has_index = False
-    self.status = "Unknown"
-
-  def as_dict(self):
-    return {"is_up_to_date": self.is_up_to_date,
-            "has_index": self.has_index,
-            "status": self.status}
-
-  @staticmethod
-  def from_dict(d):
-    s = DBStatus()
-    s.is_up_to_date = d["is_up_to_date"]
-    s.has_index = d["has_index"]
-    s.status = d["status"]
-    return s
-
 class DBDir(object):
   def __init__(self, d):
     self.path = d
@@ -76,8 +69,11 @@ class DB(object):
     self.needs_indexing = Event() # fired when the database gets dirtied and needs syncing
     self._pending_indexer = None # non-None if a DBIndex is running
     self._cur_index = None # the last DBIndex object --> actually runs the searches
+    self._index_generation = 0 # bumped each time a new DBIndex replaces _cur_index
 
     self._dir_cache = DirCache() # thread only state
+    self.usage = UsageStore(settings) # which files get opened, for ranking
+    self.profiler = sampling_profiler.SamplingProfiler("quickopend")
 
     # if we are currently looking for changed dirs, this is the iterator
     # directories remaining to be checked
@@ -92,6 +88,18 @@ class DB(object):
 
     self._on_settings_ignores_changed(None, self.settings.ignores)
 
+    # searches taking slow_query_ms or more are kept for slow_queries(), and
+    # appended to slow_query_log if it is set
+    self.settings.register('slow_query_ms', int, 250, self._on_settings_slow_query_ms_changed)
+    self.settings.register('slow_query_log', str, "")
+    self.settings.register('slow_query_log_entries', int, 100)
+    path = None
+    if self.settings.slow_query_log != "":
+      path = os.path.expanduser(self.settings.slow_query_log)
+    self._slow_queries = slow_query_log.SlowQueryLog(self.settings.slow_query_ms / 1000.0,
+                                                     self.settings.slow_query_log_entries,
+                                                     path)
+
   ###########################################################################
 
   def _on_settings_dirs_changed(self, old, new):
@@ -128,6 +136,9 @@ class DB(object):
   def _on_settings_ignores_changed(self, old, new):
     self._set_dirty()
 
+  def _on_settings_slow_query_ms_changed(self, old, new):
+    self._slow_queries.threshold = new / 1000.0
+
   @property
   def ignores(self):
     return list(self.settings.ignores)
@@ -215,6 +226,8 @@ class DB(object):
     res.is_up_to_date = self.is_up_to_date
     res.has_index = self.has_index
     res.status = status
+    if self._cur_index:
+      res.shards = self._cur_index.shard_stats()
     return res
 
   @trace
@@ -227,10 +240,20 @@ class DB(object):
       self._pending_indexer = DBIndexer(self.settings.dirs, self._dir_cache)
 
     if self._pending_indexer.complete:
-      self._cur_index = DBIndex(self._pending_indexer)
+      start = time.time()
+      self._cur_index = DBIndex(self._pending_indexer, usage = self.usage)
+      self._index_generation += 1
+      INDEX_BUILD_SECONDS.observe(time.time() - start)
+      INDEXED_FILES.set(len(self._cur_index.files))
       self._pending_indexer = None
+      if self.profiler.running:
+        self._cur_index.start_shard_profilers(self.profiler.interval)
     else:
+      found = self._pending_indexer.num_files_found
+      start = time.time()
       self._pending_indexer.index_a_bit_more()
+      INDEXER_SECONDS.inc(time.time() - start)
+      INDEXER_FILES.inc(self._pending_indexer.num_files_found - found)
 
   def sync(self):
     """Ensures database index is up-to-date"""
@@ -242,18 +265,122 @@ class DB(object):
   def _empty_result(self):
     return DBIndexSearchResult()
 
-  @trace
-  def search(self, query, max_hits = -1):
+  def _index_for_search(self, query):
+    """Returns the index to search for query, or None if there is nothing to search."""
+    index = self._current_index()
+    if query == '':
+      return None
+    return index
+
+  def _current_index(self):
     if self._pending_indexer:
       self.step_indexer()
       # step sync might change the db sync status
       if not self._cur_index:
-        return self._empty_result()
+        return None
+    return self._cur_index
 
-    if query == '':
+  @trace
+  def search(self, query, max_hits = -1, timeout = None, should_cancel = None):
+    index = self._index_for_search(query)
+    if not index:
       return self._empty_result()
 
+    start = time.time()
+    if max_hits == -1:
+      res = index.search(query, timeout = timeout, should_cancel = should_cancel)
+    else:
+      res = index.search(query, max_hits, timeout, should_cancel)
+    self._record_search(query, time.time() - start, res)
+    return res
+
+  @trace
+  def search_batch(self, queries, exact = False, max_hits = -1, timeout = None):
+    """Searches for all of queries at once. See DBIndex.search_batch."""
+    index = self._current_index()
+    if not index:
+      return [self._empty_result() for q in queries]
+
     if max_hits == -1:
-      return self._cur_index.search(query)
+      return index.search_batch(queries, exact = exact, timeout = timeout)
     else:
-      return self._cur_index.search(query, max_hits)
+      return index.search_batch(queries, max_hits, exact, timeout)
+
+  def record_open(self, path):
+    """Records that path was opened from the search results, so that it ranks higher."""
+    self.usage.record(path)
+
+  def lookup_basename(self, basename):
+    return self._lookup('lookup_basename', basename)
+
+  def lookup_path(self, path):
+    return self._lookup('lookup_path', path)
+
+  def lookup_suffix(self, suffix):
+    return self._lookup('lookup_suffix', suffix)
+
+  def _lookup(self, method, key):
+    """Runs one of DBIndex's exact lookups. They find nothing until there is an index."""
+    index = self._current_index()
+    if not index:
+      return []
+    return getattr(index, method)(key)
+
+  def search_progressively(self, query, max_hits = -1, timeout = None, should_cancel = None):
+    """Yields the best results early, then the complete ones. See DBIndex.search_progressively."""
+    index = self._index_for_search(query)
+    if not index:
+      return iter([self._empty_result()])
+
+    if max_hits == -1:
+      results = index.search_progressively(query, timeout = timeout, should_cancel = should_cancel)
+    else:
+      results = index.search_progressively(query, max_hits, timeout, should_cancel)
+    return self._record_search_progressively(query, results)
+
+  def _record_search_progressively(self, query, results):
+    start = time.time()
+    for res in results:
+      yield res
+    self._record_search(query, time.time() - start, res)
+
+  def _record_search(self, query, seconds, res):
+    if self._slow_queries.record(query, seconds, res, self._index_generation):
+      SLOW_SEARCHES.inc()
+
+  def slow_queries(self):
+    """Returns the recent searches that took slow_query_ms or more, oldest first. See SlowQueryLog."""
+    return list(self._slow_queries.entries)
+
+  ###########################################################################
+  def start_profiler(self, interval = sampling_profiler.DEFAULT_INTERVAL):
+    """
+    Starts sampling the stacks of the daemon and its shards, throwing away the
+    samples of any earlier run. An index built while profiling gets its shards
+    profiled too, but the shard samples of the index it replaces are lost.
+    """
+    if not sampling_profiler.is_supported():
+      raise DBException("Profiling needs signal.setitimer, which this platform lacks")
+    if interval <= 0:
+      raise DBException("Profiler interval must be positive")
+    self.profiler.start(interval)
+    if self._cur_index:
+      self._cur_index.start_shard_profilers(interval)
+
+  def stop_profiler(self):
+    self.profiler.stop()
+    if self._cur_index:
+      self._cur_index.stop_shard_profilers()
+
+  def profiler_status(self):
+    """Whether the profiler runs, and how many samples it took in the daemon itself."""
+    return {"running": self.profiler.running,
+            "interval": self.profiler.interval,
+            "samples": self.profiler.samples}
+
+  def profiler_stacks(self):
+    """Returns every sample so far as collapsed stacks, for flamegraph.pl."""
+    stacks = self.profiler.stacks
+    if self._cur_index:
+      stacks = sampling_profiler.merge_stacks(stacks, self._cur_index.shard_profiler_stacks())
+    return sampling_profiler.collapsed(stacks)
@@ -11,74 +11,428 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import copy
+import dir_suffix_index
 import fixed_size_dict
 import os
+import metrics
 import multiprocessing
 import db_index_shard
+import sampling_profiler
+import time
 
+from db_types import DBIndexSearchResult
 from local_pool import *
 
 global slave
 
-class DBIndexSearchResult(object):
-  def __init__(self):
-    self.hits = []
-    self.ranks = []
-    self.truncated = False
-
-  def as_dict(self):
-    return {"hits": self.hits,
-            "ranks": self.ranks,
-            "truncated": self.truncated}
-
-  @staticmethod
-  def from_dict(d):
-    r = DBIndexSearchResult()
-    r.hits = d["hits"]
-    r.ranks = d["ranks"]
-    r.truncated = d["truncated"]
-    return r
-
-def ShardInit(files_by_basename):
+# How long past a search's deadline to wait for a shard to report back.
+SHARD_RESULT_GRACE = 0.05
+
+# How often to ask whether a search should be canceled while waiting on shards.
+SHARD_CANCEL_POLL_INTERVAL = 0.01
+
+# When a query's dir part is matched fuzzily and that filters out most of what
+# the shards found, they are asked once more for this many times as many hits.
+DIR_FILTER_WIDENING = 10
+
+# The shards are only handed the basenames in a query's exact dirs when those
+# hold at most this many files. Past that, building the set and sending it to
+# every shard costs more than filtering what they return.
+MAX_DIR_FILTER_FILES = 10000
+
+SEARCH_PHASE_SECONDS = metrics.histogram('quickopen_search_phase_seconds',
+                                         'Time searches spend waiting on the shards (fanout), merging their hits (merge), '
+                                         'matching dirs (dirs) and ranking (rank), per time each phase runs',
+                                         ('phase',))
+SHARD_SCAN_SECONDS = metrics.histogram('quickopen_shard_scan_seconds',
+                                       'Time each shard spends scanning its basenames for a search',
+                                       ('shard',))
+SEARCH_CACHE = metrics.counter('quickopen_search_cache_total',
+                               'Searches answered from the query cache (hit) or not (miss)',
+                               ('result',))
+
+shard_abort = None
+
+def ShardSetAbort(abort):
+  # run as the pool initializer: shared values can only be inherited
+  global shard_abort
+  shard_abort = abort
+
+def ShardInit(basenames):
   global slave
-  slave = db_index_shard.DBIndexShard(files_by_basename)
+  slave = db_index_shard.DBIndexShard(basenames)
+  slave.abort = shard_abort
+
+def ShardSetCanceler(should_cancel):
+  # only for the in-process shard: functions can't be sent to the pools
+  slave.should_cancel = should_cancel
+
+def ShardSearchBasenames(queries, max_hits, deadline, generation, allowed = None):
+  """
+  Returns (stats, [(hits, truncated, timed out) for each query]). stats has
+  the seconds the shard spent on the queries, the seconds of that in each
+  matching stage, and the number of basenames it scanned and hits it found
+  for them. If allowed is given, only the lower-cased basenames in it are
+  hits.
+  """
+  assert slave
+  start = time.time()
+  results = []
+  scanned = 0
+  nhits = 0
+  stages = dict()
+  for query in queries:
+    hits, truncated = slave.search_basenames(query, max_hits, deadline, generation, allowed)
+    scanned += slave.scanned
+    nhits += len(hits)
+    for stage, seconds in slave.stage_seconds.items():
+      stages[stage] = stages.get(stage, 0) + seconds
+    results.append((hits, truncated, slave.timed_out))
+  return {"seconds": time.time() - start, "stages": stages, "scanned": scanned, "hits": nhits}, results
 
-def ShardSearchBasenames(query, max_hits):
+def ShardSearchWordstarts(query, max_hits):
   assert slave
-  return slave.search_basenames(query, max_hits)
+  return slave.search_wordstarts(query, max_hits)
+
+shard_profiler = None
+
+def ShardProfilerStart(shard, interval):
+  global shard_profiler
+  if not shard_profiler:
+    shard_profiler = sampling_profiler.SamplingProfiler()
+  shard_profiler.root = "shard%i" % shard
+  shard_profiler.start(interval)
+
+def ShardProfilerStop():
+  if shard_profiler:
+    shard_profiler.stop()
+
+def ShardProfilerStacks():
+  if not shard_profiler:
+    return dict()
+  return shard_profiler.stacks
 
 class DBIndex(object):
   """
   The DBIndex takes a complete list of basenames in the database and manages the sharding
   of those basenames into DBIndexShards hosted using the multiprocessing module.
   """
-  def __init__(self, indexer, threaded = True):
+  def __init__(self, indexer, threaded = True, usage = None):
     self.query_cache = fixed_size_dict.FixedSizeDict(256)
-    self.files = []
-    self.files_by_lower_basename = dict()
-    for basename,files_with_basename in indexer.files_by_basename.items():
-      lower_basename = basename.lower()
-      if lower_basename in self.files_by_lower_basename:
-        self.files_by_lower_basename[lower_basename].extend(files_with_basename)
-      else:
-        self.files_by_lower_basename[lower_basename] = files_with_basename
-      self.files.extend(files_with_basename)
+    self.cache_hits = 0
+    self.cache_misses = 0
+    self.files = indexer.files
+    self.roots = indexer.roots
+
+    # Rank bonuses from the UsageStore, by file id and by dir node.
+    self.usage = usage
+    self._usage_generation = None
+    self._file_boosts = dict()
+    self._dir_boosts = dict()
+
+    # The files with lower-cased basename b are
+    # self._lower_basename_files[self._lower_basename_starts[i]:self._lower_basename_starts[i+1]]
+    # where i = self._lower_basename_ids[b].
+    def lower(b):
+      l = b.lower()
+      if l == b:
+        return b # share the string with the FileTable
+      return l
+    (self._lower_basename_ids,
+     self._lower_basename_starts,
+     self._lower_basename_files) = self.files.group_by_basename(lower)
+
+    # dir queries resolve the matching directories first, then their files
+    self.dir_index = dir_suffix_index.DirSuffixIndex(self.files.dirs)
+    self._dir_starts, self._dir_files = self.files.group_by_dir()
 
     if threaded:
       N = min(multiprocessing.cpu_count(), 4) # test for scaling beyond 4
     else:
       N = 1
 
-    chunks = self._make_chunks(list(indexer.files_by_basename.items()), N)
+    # shards only search basenames, so don't ship them the files
+    chunks = self._make_chunks([(b, None) for b in self.files.basenames()], N)
+
+    # Every basename search gets a new generation. Raising _abort to it makes
+    # the shards stop scanning for that search.
+    self._abort = multiprocessing.RawValue('l', 0)
+    self._generation = 0
+    ShardSetAbort(self._abort)
 
     self.shards = [LocalPool(1)]
-    self.shards.extend([multiprocessing.Pool(1) for x in range(len(chunks)-1)])
+    self.shards.extend([multiprocessing.Pool(1, ShardSetAbort, (self._abort,)) for x in range(len(chunks)-1)])
 
     for i in range(len(self.shards)):
       chunk = chunks[i]
       shard = self.shards[i]
       shard.apply(ShardInit, (chunk,))
 
+    # How each shard has done over every search, for status()
+    self._shard_totals = [{"shard": i,
+                           "basenames": len(chunks[i]),
+                           "searches": 0,
+                           "late": 0,
+                           "seconds": 0.0,
+                           "max_seconds": 0.0,
+                           "scanned": 0,
+                           "hits": 0} for i in range(len(self.shards))]
+
+  def files_with_lower_basename(self, lower_basename):
+    """Returns the ids of the files whose lower-cased basename is lower_basename."""
+    if lower_basename not in self._lower_basename_ids:
+      return []
+    i = self._lower_basename_ids[lower_basename]
+    return self._lower_basename_files[self._lower_basename_starts[i]:self._lower_basename_starts[i+1]]
+
+  def lookup_basename(self, basename):
+    """Returns the paths of the files named basename, sorted."""
+    return self._lookup(basename, None)
+
+  def lookup_path(self, path):
+    """
+    Returns the file at path, or at path relative to any of the indexed dirs,
+    as a sorted list of paths.
+    """
+    dirname, basename = os.path.split(path)
+    dirnames = []
+    if len(dirname):
+      dirnames.append(dirname)
+    if not os.path.isabs(path):
+      dirnames.extend([os.path.join(root, dirname) for root in self.roots])
+    dirs = set()
+    for d in dirnames:
+      n = self.files.dirs.lookup(os.path.normpath(d))
+      if n != -1:
+        dirs.add(n)
+    return self._lookup(basename, lambda d: d in dirs)
+
+  def lookup_suffix(self, suffix):
+    """
+    Returns the paths of the files whose path ends with suffix, sorted. Only
+    whole path components match: 'b/c.h' finds a/b/c.h but not a/xb/c.h.
+    """
+    dirname, basename = os.path.split(suffix)
+    if not dirname:
+      return self._lookup(basename, None)
+    components = dirname.split(os.path.sep)
+    components.reverse()
+    table = self.files.dirs
+    def dir_matches(n):
+      for c in components:
+        if n == -1 or table.basename(n) != c:
+          return False
+        n = table.parent(n)
+      return True
+    return self._lookup(basename, dir_matches)
+
+  def _lookup(self, basename, dir_matches):
+    # The lower-cased basename table narrows things down to a handful of
+    # files, so exact-case matching needs no table of its own.
+    hits = []
+    for f in self.files_with_lower_basename(basename.lower()):
+      if self.files.basename_of(f) != basename:
+        continue
+      if dir_matches and not dir_matches(self.files.dir_of(f)):
+        continue
+      hits.append(self.files.path(f))
+    hits.sort()
+    return hits
+
+  def files_in_dir(self, d):
+    """Returns the ids of the files directly in dir node d."""
+    return self._dir_files[self._dir_starts[d]:self._dir_starts[d+1]]
+
+  def _search_basenames(self, basepart, max_chunk_hits, deadline, should_cancel, allowed = None):
+    """
+    Returns (lower-cased basename -> rank, truncated, partial, shard stats)
+    from all the shards. partial is set if any shard ran out of time or the
+    search was canceled. The shard stats are a dict per shard: see
+    _search_debug. If allowed, a set of lower-cased basenames, is given, the
+    shards leave out every other basename.
+    """
+    results, shard_stats = self._search_basenames_batch([basepart], max_chunk_hits, deadline, should_cancel, allowed)
+    return results[0] + (shard_stats,)
+
+  def _search_basenames_batch(self, baseparts, max_chunk_hits, deadline, should_cancel, allowed = None):
+    """
+    Like _search_basenames, but for each of baseparts. Every shard gets all of
+    them in one request. Returns ([(base hits, truncated, partial) for each
+    of baseparts], shard stats).
+    """
+    results = [[dict(), False, False] for b in baseparts]
+    shard_stats = []
+    result_handles = []
+    self._generation += 1
+    generation = self._generation
+    start = time.time()
+    merge_seconds = 0
+    for i in range(len(self.shards)):
+      shard = self.shards[i]
+      result_handles.append(shard.apply_async(ShardSearchBasenames, (baseparts, max_chunk_hits, deadline, generation, allowed)))
+    for i in range(len(result_handles)):
+      stats = {"shard": i, "basenames": self._shard_totals[i]["basenames"]}
+      shard_stats.append(stats)
+      # Shard 0 runs in this process, inside get(), so it has to poll for
+      # cancellation itself.
+      if i == 0 and should_cancel:
+        ShardSetCanceler(self._local_canceler(should_cancel, generation))
+      try:
+        scan_stats, shard_results = self._wait_for_shard(result_handles[i], deadline, should_cancel, generation)
+      except multiprocessing.TimeoutError:
+        stats["late"] = True # its results never came back
+        for r in results:
+          r[2] = True
+        continue
+      finally:
+        if i == 0 and should_cancel:
+          ShardSetCanceler(None)
+      stats["late"] = False
+      stats["ms"] = scan_stats["seconds"] * 1000
+      stats["stage_ms"] = dict([(stage, seconds * 1000) for stage, seconds in scan_stats["stages"].items()])
+      stats["scanned"] = scan_stats["scanned"]
+      stats["hits"] = scan_stats["hits"]
+      SHARD_SCAN_SECONDS.labels(i).observe(scan_stats["seconds"])
+      merge_start = time.time()
+      for r, (subhits, subtruncated, subpartial) in zip(results, shard_results):
+        base_hits = r[0]
+        r[1] |= subtruncated
+        r[2] |= subpartial
+        for hit,rank in subhits.items():
+          if hit in base_hits:
+            base_hits[hit] = max(base_hits[hit],rank)
+          else:
+            base_hits[hit] = rank
+      merge_seconds += time.time() - merge_start
+    SEARCH_PHASE_SECONDS.labels('fanout').observe(time.time() - start - merge_seconds)
+    SEARCH_PHASE_SECONDS.labels('merge').observe(merge_seconds)
+    if self._abort.value >= generation:
+      for r in results:
+        r[2] = True # canceled
+    self._add_shard_totals(shard_stats)
+    return [tuple(r) for r in results], shard_stats
+
+  def _add_shard_totals(self, shard_stats):
+    for stats in shard_stats:
+      totals = self._shard_totals[stats["shard"]]
+      totals["searches"] += 1
+      if stats["late"]:
+        totals["late"] += 1
+        continue
+      seconds = stats["ms"] / 1000
+      totals["seconds"] += seconds
+      totals["max_seconds"] = max(totals["max_seconds"], seconds)
+      totals["scanned"] += stats["scanned"]
+      totals["hits"] += stats["hits"]
+
+  def shard_stats(self):
+    """
+    Returns how each shard has done over every search so far: its number of
+    basenames, searches, searches it was too late for, mean and max time,
+    and basenames scanned and hits found in total.
+    """
+    res = []
+    for totals in self._shard_totals:
+      answered = totals["searches"] - totals["late"]
+      res.append({"shard": totals["shard"],
+                  "basenames": totals["basenames"],
+                  "searches": totals["searches"],
+                  "late": totals["late"],
+                  "mean_ms": totals["seconds"] * 1000 / max(answered, 1),
+                  "max_ms": totals["max_seconds"] * 1000,
+                  "scanned": totals["scanned"],
+                  "hits": totals["hits"]})
+    return res
+
+  def _search_debug(self, shard_stats):
+    """
+    Returns the debug section of a search's result: the shard stats of its
+    last trip to the shards, which shard was slowest, and skew, the slowest
+    shard's time over the mean. Each shard's stats are its basenames, whether
+    it was too late to be heard from, and if not its ms, ms in each matching
+    stage, basenames scanned and hits. stage_ms adds up the shards' stage
+    times and stage is the one that took longest.
+    """
+    debug = {"shards": shard_stats}
+    if not len(shard_stats):
+      return debug
+    late = [s for s in shard_stats if s["late"]]
+    answered = [s for s in shard_stats if not s["late"]]
+    if len(late):
+      debug["slowest"] = late[0]["shard"]
+    else:
+      debug["slowest"] = max(answered, key = lambda s: s["ms"])["shard"]
+    if len(answered):
+      mean = sum([s["ms"] for s in answered]) / len(answered)
+      if mean > 0:
+        debug["skew"] = max([s["ms"] for s in answered]) / mean
+      stage_ms = dict()
+      for s in answered:
+        for stage, ms in s["stage_ms"].items():
+          stage_ms[stage] = stage_ms.get(stage, 0) + ms
+      debug["stage_ms"] = stage_ms
+      debug["stage"] = max(stage_ms.items(), key = lambda x: x[1])[0]
+    return debug
+
+  def _search_wordstarts(self, basepart, max_chunk_hits):
+    """Returns lower-cased basename -> rank from the shards' word start indexes."""
+    result_handles = []
+    for shard in self.shards:
+      result_handles.append(shard.apply_async(ShardSearchWordstarts, (basepart, max_chunk_hits)))
+    base_hits = dict()
+    for h in result_handles:
+      for hit,rank in h.get().items():
+        base_hits[hit] = max(base_hits.get(hit, rank), rank)
+    return base_hits
+
+  def _local_canceler(self, should_cancel, generation):
+    """
+    Returns the function the in-process shard polls while it scans. It asks
+    should_cancel at most every SHARD_CANCEL_POLL_INTERVAL, and once that
+    returns True it aborts the search on every shard.
+    """
+    next_poll = [0]
+    def canceled():
+      now = time.time()
+      if now < next_poll[0]:
+        return False
+      next_poll[0] = now + SHARD_CANCEL_POLL_INTERVAL
+      if should_cancel():
+        self._abort.value = generation
+        return True
+      return False
+    return canceled
+
+  def _wait_for_shard(self, h, deadline, should_cancel, generation):
+    if should_cancel:
+      while not h.ready() and self._abort.value < generation:
+        if deadline is not None and time.time() > deadline + SHARD_RESULT_GRACE:
+          break
+        if should_cancel():
+          self._abort.value = generation
+          break
+        h.wait(SHARD_CANCEL_POLL_INTERVAL)
+    if deadline is None:
+      return h.get()
+    # the shards stop on their own at the deadline; the grace period covers
+    # sending their results back
+    return h.get(max(0, deadline - time.time()) + SHARD_RESULT_GRACE)
+
+  def _files_with_basenames(self, base_hits, dir_rank):
+    """
+    Expands lower-cased basename -> rank to a list of (file id, rank).
+    dir_rank(dir node) returns the rank to add for a file's dir, or None to
+    leave the file out.
+    """
+    hits = []
+    for hit,rank in base_hits.items():
+      for f in self.files_with_lower_basename(hit):
+        d = dir_rank(self.files.dir_of(f))
+        if d is not None:
+          hits.append((f,rank + d))
+    return hits
+
   def _make_chunks(self, items, N):
     base = 0
     chunksize = len(items) / N
@@ -100,6 +454,22 @@ class DBIndex(object):
   def status(self):
     return "%i files indexed; %i-threaded searches" % (len(self.files), len(self.shards))
 
+  def start_shard_profilers(self, interval):
+    """
+    Starts a sampling profiler in each shard's process. Shard 0 runs in this
+    process, so its samples land in this process's own profiler.
+    """
+    for i in range(1, len(self.shards)):
+      self.shards[i].apply(ShardProfilerStart, (i, interval))
+
+  def stop_shard_profilers(self):
+    for shard in self.shards[1:]:
+      shard.apply(ShardProfilerStop, ())
+
+  def shard_profiler_stacks(self):
+    """Returns the shard profilers' collapsed stack -> samples, added up."""
+    return sampling_profiler.merge_stacks(*[shard.apply(ShardProfilerStacks, ()) for shard in self.shards[1:]])
+
   def close(self):
     for p in self.shards:
       p.close()
@@ -108,67 +478,282 @@ class DBIndex(object):
       except:
         p.terminate()
 
-  def search(self, query, max_hits = 100):
-    assert len(query) > 0
-    if query in self.query_cache:
-      res = self.query_cache[query]
-      return res
+  def search(self, query, max_hits = 100, timeout = None, should_cancel = None):
+    """
+    Searches for query. If timeout is given, the search gives up after that
+    many seconds and returns what it found so far with partial set. While it
+    waits on the shards it calls should_cancel(), if given; once that returns
+    True the shards stop and the result is likewise partial.
+    """
+    for res in self._search(query, max_hits, timeout, should_cancel, False):
+      pass
+    return res
+
+  def search_progressively(self, query, max_hits = 100, timeout = None, should_cancel = None):
+    """
+    Like search, but yields a result built from the shards' word start
+    indexes before the complete one, so that callers can show the best hits
+    while the rest are found. Every result yielded replaces the previous
+    one; the last is what search would have returned.
+    """
+    return self._search(query, max_hits, timeout, should_cancel, True)
+
+  def search_batch(self, queries, max_hits = 100, exact = False, timeout = None):
+    """
+    Searches for each of queries, returning their results in the same order.
+    The shards are asked about all of the queries at once instead of one
+    search at a time. With exact set, each query is a basename, optionally
+    preceded by part of its dir, and only files with that basename match.
+    """
+    self._update_usage_boosts()
+    if exact:
+      return [self._search_exact(q) for q in queries]
+
+    if timeout is not None:
+      deadline = time.time() + timeout
+    else:
+      deadline = None
 
-    res = self.search_nocache(query, max_hits)
-    self.query_cache[query] = res
+    results = [None for q in queries]
+    pending = [] # (index into queries, dirpart, dirs, index into baseparts)
+    baseparts = []
+    basepart_ids = dict()
+    for i in range(len(queries)):
+      query = queries[i]
+      if query in self.query_cache:
+        self.cache_hits += 1
+        SEARCH_CACHE.labels('hit').inc()
+        results[i] = self._cached_result(query)
+        continue
+      self.cache_misses += 1
+      SEARCH_CACHE.labels('miss').inc()
+      dirpart, basepart = self._split_query(query)
+      if not len(basepart):
+        # nothing for the shards to do
+        results[i] = self._finish_batch_search(query, max_hits, deadline)
+        continue
+      if basepart not in basepart_ids:
+        basepart_ids[basepart] = len(baseparts)
+        baseparts.append(basepart)
+      pending.append((i, dirpart, self._exact_dirs(dirpart), basepart_ids[basepart]))
+
+    if not len(pending):
+      return results
+    max_chunk_hits = max(1, max_hits / len(self.shards))
+    base_results, shard_stats = self._search_basenames_batch(baseparts, max_chunk_hits, deadline, None)
+    debug = self._search_debug(shard_stats)
+    for i, dirpart, dirs, b in pending:
+      base_hits, truncated, partial = base_results[b]
+      hits, dirs_partial = self._files_in_dirs(base_hits, dirs, dirpart, deadline, None, not partial)
+      partial = partial or dirs_partial
+      if dirs is not None and len(hits) < max_hits and truncated and not partial:
+        # the shards' hits were mostly outside the query's dirs; on its own,
+        # the query has them leave those out or widens the search
+        results[i] = self._finish_batch_search(queries[i], max_hits, deadline)
+        continue
+      res = self._make_result(hits, truncated, partial)
+      res.debug = debug
+      if not partial:
+        self.query_cache[queries[i]] = res
+      results[i] = res
+    return results
+
+  def _finish_batch_search(self, query, max_hits, deadline):
+    """Searches for query alone. search_batch already counted its cache miss."""
+    if not len(query):
+      return DBIndexSearchResult()
+    if deadline is None:
+      res = self.search_nocache(query, max_hits)
+    else:
+      res = self.search_nocache(query, max_hits, max(0, deadline - time.time()))
+    if not res.partial:
+      self.query_cache[query] = res
     return res
 
-  def search_nocache(self, query, max_hits = 100):
+  def _search_exact(self, query):
+    dirpart, basepart = self._split_query(query)
+    dirs = self._exact_dirs(dirpart)
+    hits = []
+    for f in self.files_with_lower_basename(basepart.lower()):
+      if dirs is not None and self.files.dir_of(f) not in dirs:
+        continue
+      if self.files.basename_of(f) == basepart:
+        hits.append((f, 2))
+      else:
+        hits.append((f, 1)) # differs in case
+    return self._make_result(hits, False, False)
+
+  def _split_query(self, query):
+    """Returns (dirpart, basepart) of query. dirpart is None if there isn't one."""
     slashIdx = query.rfind('/')
     if slashIdx != -1:
-      dirpart = query[:slashIdx]
-      basepart = query[slashIdx+1:]
+      return query[:slashIdx], query[slashIdx+1:]
+    return None, query
+
+  def _exact_dirs(self, dirpart):
+    """Returns dir node -> rank bonus for the dirs ending with dirpart, or None for no dirpart."""
+    if not dirpart:
+      return None
+    return dict([(d, 0) for d in self.dir_index.search(dirpart)])
+
+  def _search(self, query, max_hits, timeout, should_cancel, progressive):
+    assert len(query) > 0
+    self._update_usage_boosts()
+    if query in self.query_cache:
+      self.cache_hits += 1
+      SEARCH_CACHE.labels('hit').inc()
+      yield self._cached_result(query)
+      return
+    self.cache_misses += 1
+    SEARCH_CACHE.labels('miss').inc()
+
+    for res in self._search_nocache(query, max_hits, timeout, should_cancel, progressive):
+      yield res
+    if not res.partial:
+      self.query_cache[query] = res
+
+  def _cached_result(self, query):
+    res = copy.copy(self.query_cache[query])
+    res.debug = {"cached": True}
+    return res
+
+  def search_nocache(self, query, max_hits = 100, timeout = None, should_cancel = None):
+    for res in self._search_nocache(query, max_hits, timeout, should_cancel, False):
+      pass
+    return res
+
+  def _search_nocache(self, query, max_hits, timeout, should_cancel, progressive):
+    if timeout is not None:
+      deadline = time.time() + timeout
     else:
-      dirpart = None
-      basepart = query
+      deadline = None
+
+    dirpart, basepart = self._split_query(query)
 
     hits = []
     truncated = False
+    partial = False
+    shard_stats = []
+
+    # dirs is dir node -> rank bonus. Exact suffix matches come first; the
+    # dir part is only matched fuzzily when they give nothing.
+    dirs = self._exact_dirs(dirpart)
+
     max_chunk_hits = max(1, max_hits / len(self.shards))
     if len(basepart):
-      result_handles = []
-      base_hits = dict()
-      for i in range(len(self.shards)):
-        shard = self.shards[i]
-        result_handles.append(shard.apply_async(ShardSearchBasenames, (basepart, max_chunk_hits)))
-      for h in result_handles:
-        (subhits, subtruncated) = h.get()
-        truncated |= subtruncated
-        for hit,rank in subhits.items():
-          if hit in base_hits:
-            base_hits[hit] = max(base_hits[hit],rank)
-          else:
-            base_hits[hit] = rank
-      for hit,rank in base_hits.items():
-        files = self.files_by_lower_basename[hit]
-        for f in files:
-          hits.append((f,rank))
-    else:
-      if len(dirpart):
-        hits.extend([(f, 1) for f in self.files])
+      if progressive:
+        base_hits = self._search_wordstarts(basepart, max_chunk_hits)
+        hits, _ = self._files_in_dirs(base_hits, dirs, dirpart, deadline, should_cancel, True)
+        if len(hits):
+          yield self._make_result(hits, False, False)
+      # Left to themselves, the shards could fill max_chunk_hits with files
+      # that the dir filter then throws out, so when the exact dirs are small
+      # enough they only get to return the basenames of files in them.
+      allowed = None
+      if dirs and self._count_files_in_dirs(dirs) <= MAX_DIR_FILTER_FILES:
+        allowed = self._lower_basenames_in_dirs(dirs)
+      base_hits, truncated, partial, shard_stats = self._search_basenames(basepart, max_chunk_hits, deadline, should_cancel, allowed)
+      # a partial search says nothing about what is in the exact dirs, so it
+      # doesn't fall back to matching them fuzzily
+      hits, dirs_partial = self._files_in_dirs(base_hits, dirs, dirpart, deadline, should_cancel, not partial)
+      partial = partial or dirs_partial
+      if allowed is not None:
+        widen = not len(hits) # nothing in the exact dirs
       else:
-        hits = []
+        widen = dirs is not None and len(hits) < max_hits and truncated
+      if widen and not partial:
+        # The dir filter runs after the shards truncated their hits, so it can
+        # throw away most of what they found. Widen once; past that, the
+        # result stays truncated with fewer than max_hits hits.
+        base_hits, truncated, partial, shard_stats = self._search_basenames(basepart, max_chunk_hits * DIR_FILTER_WIDENING, deadline, should_cancel)
+        hits, dirs_partial = self._files_in_dirs(base_hits, dirs, dirpart, deadline, should_cancel, not partial)
+        partial = partial or dirs_partial
+    elif dirpart:
+      if not len(dirs):
+        dirs = self.dir_index.search_fuzzy(dirpart, deadline, should_cancel)
+        partial = self.dir_index.timed_out
+      for d,rank in dirs.items():
+        hits.extend([(f, 1 + rank) for f in self.files_in_dir(d)])
+
+    res = self._make_result(hits, truncated, partial)
+    res.debug = self._search_debug(shard_stats)
+    yield res
 
-    if dirpart:
-      reshits = []
-      lower_dirpart = dirpart.lower()
-      for hit in hits:
-        dirname = os.path.dirname(hit[0])
-        if dirname.endswith(lower_dirpart):
-          reshits.append(hit)
-      hits = reshits
+  def _count_files_in_dirs(self, dirs):
+    return sum([self._dir_starts[d+1] - self._dir_starts[d] for d in dirs])
+
+  def _lower_basenames_in_dirs(self, dirs):
+    """Returns the set of lower-cased basenames of the files directly in dirs."""
+    basenames = set()
+    for d in dirs:
+      for f in self.files_in_dir(d):
+        basenames.add(self.files.basename_of(f).lower())
+    return basenames
+
+  def _files_in_dirs(self, base_hits, dirs, dirpart, deadline, should_cancel, fuzzy):
+    """
+    Returns (hits, partial) for the files named in base_hits that are in dirs,
+    or, if none are and fuzzy is set, in the dirs matching dirpart fuzzily.
+    partial is set if the fuzzy match ran out of time or was canceled.
+    """
+    start = time.time()
+    partial = False
+    if dirs is None:
+      hits = self._files_with_basenames(base_hits, lambda d: 0)
+    else:
+      hits = self._files_with_basenames(base_hits, dirs.get)
+      if not len(hits) and len(base_hits) and fuzzy:
+        ranker = self.dir_index.fuzzy_ranker(dirpart, deadline, should_cancel)
+        partial = self.dir_index.timed_out
+        hits = self._files_with_basenames(base_hits, ranker)
+    SEARCH_PHASE_SECONDS.labels('dirs').observe(time.time() - start)
+    return hits, partial
+
+  def _update_usage_boosts(self):
+    if not self.usage:
+      return
+    file_boosts, dir_boosts = self.usage.boosts()
+    if self.usage.generation == self._usage_generation:
+      return
+    self._usage_generation = self.usage.generation
+    self.query_cache = fixed_size_dict.FixedSizeDict(256) # its ranks are stale
+
+    self._file_boosts = dict()
+    for path, boost in file_boosts.items():
+      f = self._file_id(path)
+      if f is not None:
+        self._file_boosts[f] = boost
+    self._dir_boosts = dict()
+    for d, boost in dir_boosts.items():
+      n = self.files.dirs.lookup(d)
+      if n != -1:
+        self._dir_boosts[n] = boost
+
+  def _file_id(self, path):
+    """Returns the id of the file at path, or None if it isn't indexed."""
+    dirname, basename = os.path.split(path)
+    d = self.files.dirs.lookup(dirname)
+    if d == -1:
+      return None
+    for f in self.files_with_lower_basename(basename.lower()):
+      if self.files.dir_of(f) == d and self.files.path(f) == path:
+        return f
+    return None
+
+  def _make_result(self, hits, truncated, partial):
+    start = time.time()
+    # files that were opened before, and their neighbors, move up
+    if len(self._file_boosts) or len(self._dir_boosts):
+      hits = [(f, rank + self._file_boosts.get(f, 0) + self._dir_boosts.get(self.files.dir_of(f), 0))
+              for f, rank in hits]
 
     # sort by rank
     hits.sort(lambda x,y: -cmp(x[1],y[1]))
 
     res = DBIndexSearchResult()
-    res.hits = [c[0] for c in hits]
+    res.hits = [self.files.path(c[0]) for c in hits]
     res.ranks = [c[1] for c in hits]
     res.truncated = truncated
+    res.partial = partial
+    SEARCH_PHASE_SECONDS.labels('rank').observe(time.time() - start)
     return res
-
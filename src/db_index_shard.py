@@ -11,29 +11,152 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import array
 import fnmatch
 import re
+import sys
+import time
 
 from ranker import Ranker
 
+# Regex scans look at this many bytes of basenames at a time, checking the
+# search deadline in between.
+SCAN_WINDOW = 32 * 1024
+
+# Scans of the basenames that pass the signature prefilter check the search
+# deadline after this many basenames.
+SCAN_BATCH = 4096
+
+# When more than this fraction of the basenames pass the signature prefilter,
+# a regex scan of all of them is quicker than a match per basename. The
+# fraction is estimated from the first DENSITY_SAMPLE basenames.
+DENSE_CANDIDATES = 0.1
+DENSITY_SAMPLE = 65536
+
+# A basename's signature has a bit for each character class in it. Each
+# letter gets a class of its own; the other characters share the rest. A
+# basename lacking any of a query's classes can't match it.
+SIGNATURE_TYPECODE = 'L'
+SIGNATURE_BITS = 8 * array.array(SIGNATURE_TYPECODE).itemsize
+
+def _signature_bits():
+  bits = dict()
+  for i in range(256):
+    c = chr(i)
+    if c >= 'a' and c <= 'z':
+      bits[c] = 1 << (i - ord('a'))
+    else:
+      bits[c] = 1 << (26 + i % (SIGNATURE_BITS - 26))
+  return bits
+_SIGNATURE_BIT = _signature_bits()
+
+def signature(s):
+  """Returns the signature of s, a byte string."""
+  sig = 0
+  for c in set(s):
+    sig |= _SIGNATURE_BIT[c]
+  return sig
+
+def query_signature(query):
+  """Returns the signature every basename matching query has, in any case."""
+  query = query.lower()
+  if isinstance(query, unicode):
+    query = query.encode('utf8')
+  return signature(query)
+
+# _BIT_CHARS[k] translates each byte to '1' if its bit k is set, else '0'.
+_BIT_CHARS = [''.join([str((v >> k) & 1) for v in range(256)]) for k in range(8)]
+
+def bit_slices(signatures):
+  """
+  Transposes an array of signatures into a long per signature bit, whose bit
+  i is that bit of signatures[i]. ANDing the slices for the bits of a
+  query's signature then tests every signature at once.
+  """
+  data = signatures.tostring()
+  size = signatures.itemsize
+  slices = []
+  for bit in range(size * 8):
+    byte = bit / 8
+    if sys.byteorder == 'big':
+      byte = size - 1 - byte
+    column = data[byte::size].translate(_BIT_CHARS[bit % 8])
+    if len(column):
+      slices.append(long(column[::-1], 2))
+    else:
+      slices.append(0L)
+  return slices
+
+class BasenameLines(object):
+  """
+  The basenames in a blob of them, one per line, with the bit slices of their
+  signatures. Signatures are of the lower-cased basenames, so that they rule
+  basenames out for queries in either case.
+  """
+  def __init__(self, blob, count, case_sensitive):
+    self.blob = blob
+    self.case_sensitive = case_sensitive
+    # basename i is blob[starts[i]:starts[i+1] - 1]
+    self.starts = array.array('l')
+    signatures = array.array(SIGNATURE_TYPECODE)
+    if count:
+      start = 1
+      for b in blob[1:-1].split('\n'):
+        self.starts.append(start)
+        if case_sensitive:
+          signatures.append(signature(b.lower()))
+        else:
+          signatures.append(signature(b))
+        start += len(b) + 1
+      self.starts.append(start)
+    self.slices = bit_slices(signatures)
+
+  def __len__(self):
+    return max(len(self.starts) - 1, 0)
+
+  def candidates(self, needle_sig):
+    """
+    Returns bin() of a long whose bit i is set if basename i's signature has
+    every bit of needle_sig. The last digit is basename 0's.
+    """
+    bits = (1L << len(self)) - 1
+    for bit in range(SIGNATURE_BITS):
+      if needle_sig & (1 << bit):
+        bits &= self.slices[bit]
+    return bin(bits)
+
+  def are_dense(self, candidates):
+    """Whether more than DENSE_CANDIDATES of the basenames are candidates."""
+    sample = min(len(self), DENSITY_SAMPLE)
+    return candidates.count('1', max(2, len(candidates) - sample)) > DENSE_CANDIDATES * sample
+
 class DBIndexShard(object):
-  def __init__(self, files_by_basename):
+  def __init__(self, basenames):
+    self._deadline = None
+    self._generation = None
+    self._allowed = None
+    self.timed_out = False # whether the last search_basenames ran out of time or was canceled
+    self.scanned = 0 # basenames the last search_basenames' regexes looked at
+    self.stage_seconds = dict() # time the last search_basenames spent in each matching stage
+    self.abort = None # shared value; a search stops once it reaches the search's generation
+    self.should_cancel = None # if set, polled while scanning; the search stops once it returns True
 
-    files_by_lower_basename = dict()
-    for basename,files_with_basename in files_by_basename.items():
-      lower_basename = basename.lower()
-      if lower_basename in files_by_lower_basename:
-        files_by_lower_basename[lower_basename].extend(files_with_basename)
-      else:
-        files_by_lower_basename[lower_basename] = files_with_basename
+    lower_basenames = set()
+    for basename in basenames:
+      lower_basenames.add(basename.lower())
 
-    self.basenames_unsplit = ("\n" + "\n".join(files_by_basename.keys()) + "\n").encode('utf8')
-    self.lower_basenames_unsplit = ("\n" + "\n".join(files_by_lower_basename.keys()) + "\n").encode('utf8')
+    self.basenames_unsplit = ("\n" + "\n".join(basenames) + "\n").encode('utf8')
+    self.lower_basenames_unsplit = ("\n" + "\n".join(lower_basenames) + "\n").encode('utf8')
     assert type(self.lower_basenames_unsplit) == str
 
+    self._lower_lines = BasenameLines(self.lower_basenames_unsplit, len(lower_basenames), False)
+    # only the camelcase filters need these, so they're made on first use
+    self._basename_count = len(basenames)
+    self._lines = None
+
     ranker = Ranker()
     wordstarts = {}
-    for basename,files_with_basename in files_by_basename.items():
+    for basename in basenames:
       start_letters = ranker.get_start_letters(basename)
       if len(start_letters) <= 1:
         continue
@@ -51,16 +174,31 @@ class DBIndexShard(object):
       items.sort(lambda x,y: cmp(x[1],y[1]))
       self.basenames_by_wordstarts[ws] = [i[0] for i in items]
 
-  def search_basenames(self, query, max_hits):
+  def search_basenames(self, query, max_hits, deadline = None, generation = None, allowed = None):
+    """
+    Returns (hits, truncated). If deadline, a time.time() value, passes before
+    every basename is scanned, the search stops early with what it has found
+    and sets self.timed_out. It does the same if self.abort is raised to
+    generation, which is how the coordinator cancels a search. If allowed, a
+    set of lower-cased basenames, is given, only those can be hits, so the
+    others don't use up max_hits.
+    """
     lower_query = query.lower()
-
-    hits = dict()
+    self.timed_out = False
+    self.scanned = 0
+    self._deadline = deadline
+    self._generation = generation
+    self._allowed = allowed
 
     # word starts first
-    self.add_all_wordstarts_matching( hits, query, max_hits )
+    start = time.time()
+    hits = self.search_wordstarts(query, max_hits)
 
     # add in substring matches
+    substring_start = time.time()
     self.add_all_matching( hits, query, self.get_substring_filter(lower_query), max_hits )
+    self.stage_seconds = {"wordstart": substring_start - start,
+                          "substring": time.time() - substring_start}
 
     # add in superfuzzy matches ONLY if we have no high-quality hit
     has_hq = False
@@ -68,16 +206,40 @@ class DBIndexShard(object):
       if rank > 2:
         has_hq = True
         break
-    if not has_hq:
-      self.add_all_matching( hits, query, self.get_superfuzzy_filter(lower_query), max_hits )
+    if not has_hq and not self.timed_out:
+      superfuzzy_start = time.time()
+      self.add_all_subsequences( hits, query, max_hits )
+      self.stage_seconds["superfuzzy"] = time.time() - superfuzzy_start
 
+    self._allowed = None
     return hits, len(hits) == max_hits
 
+  def search_wordstarts(self, query, max_hits):
+    """
+    Returns the hits from the word start index alone. These are the best
+    matches and take no scanning to find, so they can be shown while
+    search_basenames looks for the rest.
+    """
+    hits = dict()
+    self.add_all_wordstarts_matching( hits, query, max_hits )
+    return hits
+
+  def _should_stop(self):
+    if self._deadline and time.time() > self._deadline:
+      return True
+    if self.abort and self._generation != None and self.abort.value >= self._generation:
+      return True
+    if self.should_cancel and self.should_cancel():
+      return True
+    return False
+
   def add_all_wordstarts_matching( self, hits, query, max_hits ):
     lower_query = query.lower()
     if lower_query in self.basenames_by_wordstarts:
       ranker = Ranker()
       for basename in self.basenames_by_wordstarts[lower_query]:
+        if self._allowed is not None and basename not in self._allowed:
+          continue
         rank = ranker.rank(query, basename)
         hits[basename] = rank
         if len(hits) >= max_hits:
@@ -114,45 +276,131 @@ class DBIndexShard(object):
     flt = "\n.*%s.*\n" % query
     return (flt, False)
 
-  def get_superfuzzy_filter(self, query):
-    tmp = []
-    for i in range(len(query)):
-      tmp.append(re.escape(query[i]))
-    flt = "\n.*%s.*\n" % '.*'.join(tmp)
-    return (flt, False)
-
   def add_all_matching(self, hits, query, flt_tuple, max_hits):
     """
     hits is the dictionary to put results in
     query is the query string originally entered by user, used by ranking
     flt_tuple is [filter_regex, case_sensitive_bool]
     max_hits is largest hits should grow before matching terminates.
+    Gives up and sets self.timed_out when the current search's deadline passes
+    or it is aborted. Adds the number of basenames it looked at to self.scanned.
+    The regex only runs on the basenames whose signature has every character
+    class of query, unless so many do that a scan of the whole blob is quicker.
     """
     flt, case_sensitive = flt_tuple
 
     regex = re.compile(flt)
+    lines = self._basename_lines(case_sensitive)
+    candidates = lines.candidates(query_signature(query))
+    if not lines.are_dense(candidates):
+      blob = lines.blob
+      def matches(start, end):
+        return regex.match(blob, start - 1, end + 1)
+      self._add_candidates(hits, query, lines, candidates, matches, max_hits)
+      return
+
     base = 0
     ranker = Ranker()
-    if not case_sensitive:
-      index = self.lower_basenames_unsplit
-    else:
-      index = self.basenames_unsplit
+    index = lines.blob
     while True:
-      m = regex.search(index, base)
+      if self._should_stop():
+        self.timed_out = True
+        break
+      # end the window on a newline so that no basename is split across two
+      end = index.find('\n', base + SCAN_WINDOW)
+      if end == -1:
+        end = len(index)
+      else:
+        end += 1
+      m = regex.search(index, base, end)
       if m:
+        self.scanned += index.count('\n', base, m.end() - 1)
         hit = m.group(0)[1:-1]
         if hit.find('\n') != -1:
           raise Exception("Somethign is messed up with flt=[%s] query=[%s] hit=[%s]" % (flt,query,hit))
-        rank = ranker.rank(query, hit)
-        if case_sensitive:
-          hit = hit.lower()
-        if hit in hits:
-          hits[hit] = max(hits[hit],rank)
-        else:
-          hits[hit] = rank
+        self._add_hit(hits, ranker, query, hit, case_sensitive)
         base = m.end() - 1
         if len(hits) >= max_hits:
           truncated = True
           break
       else:
-        break
+        self.scanned += index.count('\n', base, end - 1)
+        if end == len(index):
+          break
+        base = end - 1
+
+  def add_all_subsequences(self, hits, query, max_hits):
+    """
+    Adds the lower-cased basenames that have the characters of query in
+    order, in any case, to hits. These are the superfuzzy matches. Basenames
+    that get past the signature prefilter take a single pass, so unlike a
+    .*a.*b.*c regex the time taken never blows up with long basenames or
+    queries. Stops like add_all_matching, and counts the basenames it looked
+    at the same way.
+    """
+    needle = query.lower()
+    if isinstance(needle, unicode):
+      needle = needle.encode('utf8')
+    lines = self._lower_lines
+    blob = lines.blob
+    def matches(start, end):
+      pos = start
+      for c in needle:
+        pos = blob.find(c, pos, end) + 1
+        if not pos:
+          return False
+      return True
+    self._add_candidates(hits, query, lines, lines.candidates(signature(needle)), matches, max_hits)
+
+  def _basename_lines(self, case_sensitive):
+    if not case_sensitive:
+      return self._lower_lines
+    if not self._lines:
+      self._lines = BasenameLines(self.basenames_unsplit, self._basename_count, True)
+    return self._lines
+
+  def _add_hit(self, hits, ranker, query, hit, case_sensitive):
+    """
+    Adds basename hit to hits, lower-cased and ranked against query, unless
+    the current search doesn't allow it.
+    """
+    lower_hit = hit
+    if case_sensitive:
+      lower_hit = hit.lower()
+    if self._allowed is not None and lower_hit not in self._allowed:
+      return
+    rank = ranker.rank(query, hit)
+    if lower_hit in hits:
+      hits[lower_hit] = max(hits[lower_hit], rank)
+    else:
+      hits[lower_hit] = rank
+
+  def _add_candidates(self, hits, query, lines, candidates, matches, max_hits):
+    """
+    Adds to hits each basename i in lines that candidates has and for which
+    matches(start, end) is true, where start and end delimit the basename in
+    lines.blob. Stops like add_all_matching.
+    """
+    blob = lines.blob
+    starts = lines.starts
+    ranker = Ranker()
+    check_at = 0
+    last = len(candidates) - 1
+    pos = candidates.rfind('1', 2)
+    while pos != -1:
+      i = last - pos
+      if i >= check_at:
+        if self._should_stop():
+          self.timed_out = True
+          self.scanned += i
+          return
+        check_at = i + SCAN_BATCH
+      start = starts[i]
+      end = starts[i + 1] - 1
+      if matches(start, end):
+        self._add_hit(hits, ranker, query, blob[start:end], lines.case_sensitive)
+        if len(hits) >= max_hits:
+          self.scanned += i + 1
+          return
+      pos = candidates.rfind('1', 2, pos)
+    self.scanned += len(lines)
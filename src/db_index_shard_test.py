@@ -12,8 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import db_index_shard
+import multiprocessing
+import random
 import unittest
 import re
+import time
 
 class DBIndexShardTest(unittest.TestCase):
   def test_filters(self):
@@ -21,7 +24,6 @@ class DBIndexShardTest(unittest.TestCase):
     camelcase = m.get_camelcase_wordstart_filter
     delimited = m.get_delimited_wordstart_filter
     substring = m.get_substring_filter
-    superfuzzy = m.get_superfuzzy_filter
 
     def check_match(getflt, example, query, expected):
       flt, case_sensitive = getflt(query)
@@ -62,17 +64,47 @@ class DBIndexShardTest(unittest.TestCase):
     ensure_nonmatch(delimited, "foo_render_widget", "_")
 
     # substring tests
-    ensure_matches (superfuzzy, "RenderWidgetHost", "ren")
-    ensure_matches (superfuzzy, "RenderWidgetHost", "renderwidget")
-    ensure_matches (superfuzzy, "RenderWidgetHost", "enderwidget")
-    ensure_nonmatch(superfuzzy, "RenderWidgetHost", "renderview")
+    ensure_matches (substring, "RenderWidgetHost", "ren")
+    ensure_matches (substring, "RenderWidgetHost", "renderwidget")
+    ensure_matches (substring, "RenderWidgetHost", "enderwidget")
+    ensure_nonmatch(substring, "RenderWidgetHost", "renderview")
 
-    # superfuzzy tests
-    ensure_matches (superfuzzy, "RenderWidgetHost", "rwh")
-    ensure_matches (superfuzzy, "RenderWidgetHost", "endgethost")
-    ensure_matches (superfuzzy, "f*oo", "*")
-    ensure_nonmatch(superfuzzy, "foo", "*")
-    ensure_nonmatch(superfuzzy, "foo", "_")
+  def test_subsequences(self):
+    def check_match(example, query, expected):
+      m = db_index_shard.DBIndexShard([example])
+      hits = dict()
+      m.add_all_subsequences(hits, query, 100)
+      self.assertEquals(expected, example.lower() in hits)
+
+    def ensure_matches(example, query):
+      check_match(example, query, True)
+    def ensure_nonmatch(example, query):
+      check_match(example, query, False)
+
+    ensure_matches ("RenderWidgetHost", "ren")
+    ensure_matches ("RenderWidgetHost", "renderwidget")
+    ensure_nonmatch("RenderWidgetHost", "renderview")
+    ensure_matches ("RenderWidgetHost", "rwh")
+    ensure_matches ("RenderWidgetHost", "RWH")
+    ensure_matches ("RenderWidgetHost", "endgethost")
+    ensure_nonmatch("RenderWidgetHost", "hwr")
+    ensure_matches ("f*oo", "*")
+    ensure_nonmatch("foo", "*")
+    ensure_nonmatch("foo", "_")
+    ensure_matches ("foo", "")
+    # a regex would backtrack through every way of placing the a's
+    ensure_nonmatch("a" * 2000, "a" * 20 + "b")
+
+  def test_subsequences_match_regex(self):
+    rng = random.Random(0)
+    basenames = ["".join([rng.choice("abcde_.") for j in range(rng.randint(1, 12))]) for i in range(2000)]
+    m = db_index_shard.DBIndexShard(basenames)
+    for query in ["a", "ab", "e.a", "_c_", "edcba", "aaaa"]:
+      hits = dict()
+      m.add_all_subsequences(hits, query, 100000)
+      regex = re.compile("^%s$" % ".*".join([re.escape(c) for c in query]).join([".*", ".*"]))
+      expected = set([b.lower() for b in basenames if regex.match(b.lower())])
+      self.assertEquals(expected, set(hits.keys()))
 
 
 
@@ -85,3 +117,113 @@ class DBIndexShardTest(unittest.TestCase):
     
     hits, truncated = m.search_basenames("rwh", 10000)
     self.assertTrue("render_widget_host.cpp" in hits)
+
+  def test_search_wordstarts(self):
+    m = db_index_shard.DBIndexShard(["render_widget_host.cpp", "rwh.cpp", "foo.cpp"])
+    hits = m.search_wordstarts("rwh", 10000)
+    self.assertEquals(["render_widget_host.cpp"], hits.keys())
+
+  def test_scan_windows(self):
+    basenames = ["file%i.cpp" % i for i in range(1000)]
+    m = db_index_shard.DBIndexShard(basenames)
+    old_window = db_index_shard.SCAN_WINDOW
+    db_index_shard.SCAN_WINDOW = 17 # smaller than a line, and not aligned to one
+    try:
+      hits, truncated = m.search_basenames("9.cpp", 10000)
+    finally:
+      db_index_shard.SCAN_WINDOW = old_window
+    self.assertEquals(set([b for b in basenames if b.endswith("9.cpp")]), set(hits.keys()))
+    self.assertFalse(m.timed_out)
+
+  def test_scanned(self):
+    basenames = ["file%i.cpp" % i for i in range(1000)]
+    m = db_index_shard.DBIndexShard(basenames)
+    # no hits, so both the substring and the superfuzzy scans see everything
+    m.search_basenames("zzz", 10000)
+    self.assertEquals(2000, m.scanned)
+    old_window = db_index_shard.SCAN_WINDOW
+    db_index_shard.SCAN_WINDOW = 17
+    try:
+      m.search_basenames("zzz", 10000)
+    finally:
+      db_index_shard.SCAN_WINDOW = old_window
+    self.assertEquals(2000, m.scanned)
+    m.search_basenames("file1.cpp", 1)
+    self.assertTrue(m.scanned <= 1000) # stops at the first hit
+
+  def test_allowed(self):
+    basenames = ["file%i.cpp" % i for i in range(1000)] + ["render_widget_host.cpp", "RenderWidgetHost.h"]
+    m = db_index_shard.DBIndexShard(basenames)
+    allowed = set(["file19.cpp", "file999.cpp", "renderwidgethost.h"])
+    old_dense = db_index_shard.DENSE_CANDIDATES
+    try:
+      for dense in (2, -1): # candidates only, then the window scan
+        db_index_shard.DENSE_CANDIDATES = dense
+        hits, truncated = m.search_basenames("9.cpp", 2, allowed = allowed)
+        self.assertEquals(set(["file19.cpp", "file999.cpp"]), set(hits.keys()))
+    finally:
+      db_index_shard.DENSE_CANDIDATES = old_dense
+    hits, truncated = m.search_basenames("rwh", 10, allowed = allowed)
+    self.assertEquals(["renderwidgethost.h"], hits.keys())
+    self.assertFalse(truncated)
+    # only that search is restricted
+    self.assertEquals(2, len(m.search_basenames("rwh", 10)[0]))
+
+  def test_stage_seconds(self):
+    m = db_index_shard.DBIndexShard(["render_widget_host.cpp", "foo.cpp", "bar.cpp"])
+    m.search_basenames("zzz", 100)
+    self.assertEquals(set(["wordstart", "substring", "superfuzzy"]), set(m.stage_seconds.keys()))
+    # a good hit makes the superfuzzy scan unnecessary
+    m.search_basenames("rwh", 100)
+    self.assertEquals(set(["wordstart", "substring"]), set(m.stage_seconds.keys()))
+
+  def test_candidates(self):
+    lines = db_index_shard.BasenameLines("\nfoo.cc\nbar.h\nfoobar.cc\n", 3, False)
+    self.assertEquals(3, len(lines))
+    self.assertEquals('0b101', lines.candidates(db_index_shard.query_signature("FO")))
+    self.assertEquals('0b111', lines.candidates(db_index_shard.query_signature("")))
+    self.assertEquals('0b0', lines.candidates(db_index_shard.query_signature("z")))
+    lines = db_index_shard.BasenameLines("\nFoo.cc\nBar.h\n", 2, True)
+    self.assertEquals('0b10', lines.candidates(db_index_shard.query_signature("b")))
+    lines = db_index_shard.BasenameLines("\n\n", 0, False)
+    self.assertEquals(0, len(lines))
+    self.assertEquals('0b0', lines.candidates(db_index_shard.query_signature("b")))
+
+  def test_prefilter_matches_scan(self):
+    rng = random.Random(0)
+    basenames = ["".join([rng.choice("abcdeABC_.") for j in range(rng.randint(1, 12))]) for i in range(2000)]
+    m = db_index_shard.DBIndexShard(basenames)
+    filters = [m.get_substring_filter, m.get_camelcase_wordstart_filter, m.get_delimited_wordstart_filter]
+    old_dense = db_index_shard.DENSE_CANDIDATES
+    try:
+      for query in ["a", "ab", "e.a", "_c", "bca", "Abc"]:
+        for getflt in filters:
+          results = []
+          for dense in [-1, 1]: # always scan the whole blob, then never
+            db_index_shard.DENSE_CANDIDATES = dense
+            hits = dict()
+            m.add_all_matching(hits, query, getflt(query.lower()), 100000)
+            results.append(hits)
+          self.assertEquals(results[0], results[1])
+    finally:
+      db_index_shard.DENSE_CANDIDATES = old_dense
+
+  def test_search_past_deadline(self):
+    m = db_index_shard.DBIndexShard(["render_widget_host.cpp", "foo.cpp", "bar.cpp"])
+    hits, truncated = m.search_basenames("rwh", 10000, time.time() - 1)
+    self.assertTrue(m.timed_out)
+    # the wordstart index is a lookup, so its hits come back anyway
+    self.assertTrue("render_widget_host.cpp" in hits)
+    hits, truncated = m.search_basenames("foo", 10000, time.time() + 60)
+    self.assertFalse(m.timed_out)
+    self.assertTrue("foo.cpp" in hits)
+
+  def test_abort(self):
+    m = db_index_shard.DBIndexShard(["foo.cpp", "bar.cpp"])
+    m.abort = multiprocessing.RawValue('l', 0)
+    hits, truncated = m.search_basenames("foo", 10000, None, 1)
+    self.assertFalse(m.timed_out)
+    self.assertTrue("foo.cpp" in hits)
+    m.abort.value = 2
+    hits, truncated = m.search_basenames("foo", 10000, None, 2)
+    self.assertTrue(m.timed_out)
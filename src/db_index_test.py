@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import db_index
+import db_index_shard
 import db_indexer
-import sys
+import settings
+import tempfile
 import unittest
-import time
+import usage_store
 
 FILES_BY_BASENAME = None
 
@@ -68,6 +70,161 @@ class DBIndexTestBase(object):
   def test_dir_and_name_query(self):
     self.assertTrue("~/ndbg/quickopen/src/db_proxy_test.py" in self.index.search('src/db_proxy_test.py').hits)
 
+  def test_search_batch(self):
+    queries = ['rwhv', 'ClientHelper', 'src/db_proxy_test.py', 'quickopen/src/', 'cont/rend_host/rwh', 'rwhv']
+    results = self.index.search_batch(queries)
+    self.assertEquals(len(queries), len(results))
+    for i in range(len(queries)):
+      self.assertEquals(self.index.search_nocache(queries[i]).hits, results[i].hits)
+
+  def test_search_batch_counts_widened_search_once(self):
+    # few of the shards' hits for 'c' are in sandbox/src, so this takes the
+    # search_batch fallback that searches for the query alone
+    res = self.index.search_batch(['sandbox/src/c'], 10)[0]
+    self.assertEquals(self.index.search_nocache('sandbox/src/c', 10).hits, res.hits)
+    self.assertEquals(1, self.index.cache_misses)
+    self.index.search_batch(['sandbox/src/c'], 10)
+    self.assertEquals(1, self.index.cache_misses)
+    self.assertEquals(1, self.index.cache_hits)
+
+  def test_search_batch_exact(self):
+    results = self.index.search_batch(['clienthelper.py', 'integration/ClientHelper.py', 'ClientHelper'], exact = True)
+    self.assertEquals(['~/chrome/src/third_party/tlslite/tlslite/integration/ClientHelper.py'], results[0].hits)
+    self.assertEquals(results[0].hits, results[1].hits)
+    self.assertEquals([], results[2].hits)
+
+  def test_lookup_basename(self):
+    self.assertEquals(['~/chrome/src/third_party/tlslite/tlslite/integration/ClientHelper.py'], self.index.lookup_basename('ClientHelper.py'))
+    self.assertEquals([], self.index.lookup_basename('clienthelper.py'))
+    self.assertEquals([], self.index.lookup_basename('ClientHelper'))
+
+  def test_lookup_path(self):
+    path = '~/chrome/src/third_party/tlslite/tlslite/integration/ClientHelper.py'
+    self.assertEquals([path], self.index.lookup_path(path))
+    self.assertEquals([], self.index.lookup_path('~/chrome/src/ClientHelper.py'))
+
+  def test_lookup_suffix(self):
+    path = '~/chrome/src/third_party/tlslite/tlslite/integration/ClientHelper.py'
+    self.assertEquals([path], self.index.lookup_suffix('integration/ClientHelper.py'))
+    self.assertEquals([path], self.index.lookup_suffix('tlslite/tlslite/integration/ClientHelper.py'))
+    self.assertEquals([], self.index.lookup_suffix('gration/ClientHelper.py'))
+    self.assertEquals([], self.index.lookup_suffix('tlslite/ClientHelper.py'))
+
+  def test_usage_boost(self):
+    settings_file = tempfile.NamedTemporaryFile()
+    self.index.usage = usage_store.UsageStore(settings.Settings(settings_file.name))
+    before = self.index.search('rwh')
+    self.assertTrue(len(before.hits) > 1)
+    opened = before.hits[-1]
+    self.index.usage.record(opened)
+    after = self.index.search('rwh')
+    self.assertTrue(after.hits.index(opened) < before.hits.index(opened))
+    self.assertEquals(set(before.hits), set(after.hits))
+    settings_file.close()
+
+  def test_partial_search_is_not_cached(self):
+    res = self.index.search('rwhv', timeout = -1)
+    self.assertTrue(res.partial)
+    res = self.index.search('rwhv', timeout = 60)
+    self.assertFalse(res.partial)
+    self.assertTrue('~/chrome/src/chrome/browser/renderer_host/render_widget_host_view_views.h' in res.hits)
+
+  def test_canceled_search_is_partial(self):
+    res = self.index.search('rwhv', should_cancel = lambda: True)
+    self.assertTrue(res.partial)
+    self.assertFalse(self.index.search('rwhv').partial)
+
+  def test_search_progressively(self):
+    results = list(self.index.search_progressively('rwhv'))
+    self.assertEquals(2, len(results))
+    self.assertEquals(self.index.search('rwhv').hits, results[-1].hits)
+    # the early hits are the word start matches, which are also the best ones
+    early = results[0].hits
+    self.assertTrue('~/chrome/src/chrome/browser/renderer_host/render_widget_host_view_views.h' in early)
+    self.assertEquals(set(early), set(results[-1].hits[:len(early)]))
+
+    # once cached, the complete results come straight back
+    self.assertEquals(1, len(list(self.index.search_progressively('rwhv'))))
+
+  def test_search_debug(self):
+    res = self.index.search('rwhv')
+    shards = res.debug["shards"]
+    self.assertEquals(len(self.index.shards), len(shards))
+    self.assertEquals(len(self.index.files.basenames()), sum([s["basenames"] for s in shards]))
+    for s in shards:
+      self.assertFalse(s["late"])
+      self.assertTrue(s["scanned"] <= 2 * s["basenames"])
+    self.assertTrue(sum([s["hits"] for s in shards]) >= 1)
+    self.assertTrue(res.debug["slowest"] in range(len(shards)))
+    self.assertTrue(set(["wordstart", "substring"]) <= set(res.debug["stage_ms"].keys()))
+    self.assertTrue(res.debug["stage"] in res.debug["stage_ms"])
+    self.assertEquals({"cached": True}, self.index.search('rwhv').debug)
+
+    stats = self.index.shard_stats()
+    self.assertEquals([1] * len(shards), [s["searches"] for s in stats])
+    self.assertEquals([s["scanned"] for s in shards], [s["scanned"] for s in stats])
+    self.index.search_batch(['rwh', 'tab'])
+    self.assertEquals([2] * len(shards), [s["searches"] for s in self.index.shard_stats()])
+
+  def test_dir_query_hits_are_not_crowded_out(self):
+    # 'c' is in far more basenames than max_hits, but the shards only return
+    # the ones in sandbox/src
+    searches = self.index.shard_stats()[0]["searches"]
+    res = self.index.search('sandbox/src/c', 10)
+    self.assertFalse(res.truncated)
+    self.assertTrue("~/chrome/src/sandbox/src/sandbox.cc" in res.hits)
+    for hit in res.hits:
+      self.assertTrue(hit.startswith("~/chrome/src/sandbox/src/"))
+    self.assertEquals(searches + 1, self.index.shard_stats()[0]["searches"])
+
+  def test_large_exact_dirs_are_filtered_after_the_search(self):
+    old = db_index.MAX_DIR_FILTER_FILES
+    db_index.MAX_DIR_FILTER_FILES = 0
+    try:
+      res = self.index.search_nocache('sandbox/src/sandbox')
+    finally:
+      db_index.MAX_DIR_FILTER_FILES = old
+    self.assertTrue("~/chrome/src/sandbox/src/sandbox.cc" in res.hits)
+    for hit in res.hits:
+      self.assertTrue(hit.startswith("~/chrome/src/sandbox/src/"))
+
+  def test_partial_dir_query_is_not_fuzzy(self):
+    def fuzzy_ranker(*args):
+      self.fail("the dir part was matched fuzzily")
+    self.index.dir_index.fuzzy_ranker = fuzzy_ranker
+    try:
+      res = self.index.search_nocache('zqx/c', should_cancel = lambda: True)
+    finally:
+      del self.index.dir_index.fuzzy_ranker
+    self.assertTrue(res.partial)
+
+  def test_fuzzy_dir_query_widens_once(self):
+    # no dir matches 'zqx', so nothing the shards return survives the filter
+    searches = self.index.shard_stats()[0]["searches"]
+    res = self.index.search('zqx/c')
+    self.assertEquals([], res.hits)
+    self.assertTrue(res.truncated)
+    self.assertEquals(searches + 2, self.index.shard_stats()[0]["searches"])
+
+  def test_fuzzy_dir_query(self):
+    self.assertTrue("~/chrome/src/content/browser/tab_contents/tab_contents_observer_registrar.h" in self.index.search('cont/brow/tab').hits)
+    self.assertTrue("~/chrome/src/content/browser/renderer_host/render_widget_host_gtk.cc" in self.index.search('cont/rend_host/rwh').hits)
+    self.assertTrue("~/ndbg/quickopen/src/db_proxy_test.py" in self.index.search('qo/db_proxy_test').hits)
+
+  def test_fuzzy_dir_query_out_of_time(self):
+    res = self.index.search_nocache('cont/brow/', should_cancel = lambda: True)
+    self.assertTrue(res.partial)
+    self.assertFalse(self.index.search_nocache('cont/brow/').partial)
+
+  def test_fuzzy_dir_query_ranks_by_dir(self):
+    res = self.index.search('wk/chr/src/')
+    self.assertTrue(len(res.hits) > 0)
+    self.assertTrue(res.hits[0].startswith("~/chrome/src/third_party/WebKit/Source/WebKit/chromium/src/"))
+
+  def test_exact_dir_query_is_not_fuzzy(self):
+    for hit in self.index.search('sandbox/src/').hits:
+      self.assertTrue(hit.startswith("~/chrome/src/sandbox/src/"))
+
 class DBIndexTestMT(unittest.TestCase, DBIndexTestBase):
   def setUp(self,*args,**kwargs):
     self.threaded = True
@@ -98,53 +255,25 @@ class DBIndexTestST(unittest.TestCase, DBIndexTestBase):
     validate(10,2)
     validate(10,3)
 
+  def test_cancel_local_shard_midway(self):
+    calls = [0]
+    def should_cancel():
+      calls[0] += 1
+      return calls[0] >= 3
+    old = (db_index_shard.SCAN_WINDOW, db_index_shard.DENSE_CANDIDATES, db_index.SHARD_CANCEL_POLL_INTERVAL)
+    db_index_shard.SCAN_WINDOW = 256
+    db_index_shard.DENSE_CANDIDATES = -1 # scan the whole blob, a window at a time
+    db_index.SHARD_CANCEL_POLL_INTERVAL = 0
+    try:
+      res = self.index.search_nocache('zzzz', should_cancel = should_cancel)
+    finally:
+      db_index_shard.SCAN_WINDOW, db_index_shard.DENSE_CANDIDATES, db_index.SHARD_CANCEL_POLL_INTERVAL = old
+    self.assertTrue(res.partial)
+    self.assertEquals(3, calls[0])
+    shard = res.debug["shards"][0]
+    self.assertTrue(shard["scanned"] < shard["basenames"] / 2)
+    # the canceler is only installed for the search that asked for it
+    self.assertFalse(self.index.search_nocache('zzzz').partial)
+
   def tearDown(self):
     DBIndexTestBase.tearDown(self)
-
-class DBIndexPerfTest():
-  def __init__(self, testfile):
-    mock_indexer = db_indexer.MockIndexer(testfile)
-    self.index = db_index.DBIndex(mock_indexer)
-
-  def test_matcher_perf(self,max_hits):
-    print "%15s %s" % ("query", "time")
-
-    PERF_QUERIES = [
-    'warmup',
-      'r',
-      'rw',
-      'rwh',
-      'rwhv',
-      're',
-      'ren',
-      'rend',
-      'rende',
-      'render',
-      'render_',
-      'render_w',
-      'render_wi',
-      'render_widget',
-      'iv',
-      'info_view',
-      'w',
-      'we',
-      'web',
-      'webv',
-      'webvi',
-      'webvie',
-      'webview',
-      'wv',
-      'wvi',
-      'webgraphics'
-    ]
-    for q in PERF_QUERIES:
-      start = time.time()
-      self.index.search(q,max_hits)
-      elapsed = time.time() - start
-      print '%15s %.3f' % (q ,elapsed)
-      
-if __name__ == '__main__':
-  test = DBIndexPerfTest('test_data/cr_files_by_basename.json')
-  print "Results for max=30:"
-  test.test_matcher_perf(max_hits=30)
-  print "\n"
@@ -16,9 +16,30 @@ import os
 import time
 import json
 
+from file_table import FileTable
+
 class MockIndexer(object):
+  """
+  Loads files from a dump instead of crawling. filename is JSON, either
+  basename -> [paths] or a list of basenames that are put in one made-up
+  dir, or else a text file with one path per line.
+  """
   def __init__(self, filename):
-    self.files_by_basename = json.load(open(filename))
+    self.files = FileTable()
+    self.roots = []
+    if not filename.endswith('.json'):
+      for line in open(filename):
+        path = line.strip()
+        if len(path):
+          self.files.add(os.path.basename(path), path)
+      return
+
+    data = json.load(open(filename))
+    if type(data) == list:
+      data = dict([(basename, [os.path.join('~', basename)]) for basename in data])
+    for basename,files_with_basename in data.items():
+      for f in files_with_basename:
+        self.files.add(basename, f)
 
 class DBIndexer(object):
   def __init__(self, dirs, dir_cache):
@@ -28,7 +49,8 @@ class DBIndexer(object):
     self._basename_slots = dict()
 
     # variablse used both during indexing and once indexed
-    self.files_by_basename = dict() # maps basename to list
+    self.files = FileTable()
+    self.roots = [self.dir_cache.realpath(d) for d in dirs]
 
     # variables used during indexing
     self.pending = collections.deque()
@@ -72,10 +94,8 @@ class DBIndexer(object):
     d = self.pending.popleft()
     for basename in self.dir_cache.listdir(d):
       path = self.dir_cache.realpath(os.path.join(d, basename))
-      if os.path.isdir(path):
+      if self.dir_cache.isdir(path):
         self.enqueue_dir(path)
       else:
-        if basename not in self.files_by_basename:
-          self.files_by_basename[basename] = []
-        self.files_by_basename[basename].append(path)
+        self.files.add(basename, path)
         self.num_files_found += 1
@@ -13,14 +13,15 @@
 # limitations under the License.
 import async_http_connection
 import httplib
+import os
+import select
 import socket
 import subprocess
 import sys
 import time
 import json
 
-from db import DBStatus
-from db_index import DBIndexSearchResult
+from db_types import DBStatus, DBIndexSearchResult
 from event import Event
 from trace_event import *
 
@@ -74,7 +75,7 @@ class DBProxy(object):
       raise Exception("Daemon did not come up")
     
 
-  def _req(self, method, path, data = None):
+  def _req(self, method, path, data = None, as_text = False):
     if data != None:
       data = json.dumps(data)
     try:
@@ -105,6 +106,8 @@ class DBProxy(object):
 
     elif res.status != 200:
       raise Exception("On %s, got %s" % (path, res.status))
+    if as_text:
+      return res.read()
     res = json.loads(res.read().encode('utf8'))
     return res
 
@@ -143,12 +146,59 @@ class DBProxy(object):
     except:
       raise "Pattern not found"
 
-  def search(self, q):
-    d = self._req('POST', '/search', q)
+  def search(self, q, timeout = None, debug = False):
+    """Searches for q. With debug set, the result's debug says how each shard did."""
+    d = self._req('POST', '/search', _search_request(q, timeout, debug))
     return DBIndexSearchResult.from_dict(d)
 
-  def search_async(self, q):
-    return AsyncSearch(self.host, self.port, q)
+  def search_batch(self, queries, exact = False, timeout = None):
+    """
+    Searches for every query in queries with a single request, returning a
+    DBIndexSearchResult for each. With exact set, only files whose basename
+    is exactly the query's match.
+    """
+    req = {"queries": queries, "exact": exact}
+    if timeout is not None:
+      req["timeout"] = timeout
+    d = self._req('POST', '/search/batch', req)
+    return [DBIndexSearchResult.from_dict(r) for r in d["results"]]
+
+  def record_open(self, path):
+    """Tells the daemon that path was opened from the search results."""
+    self._req('POST', '/record_open', path)
+
+  def lookup_basename(self, basename):
+    """Returns the paths of the files named exactly basename."""
+    return self._req('POST', '/lookup/basename', basename)
+
+  def lookup_path(self, path):
+    """Returns the file at path, which may be relative to an indexed dir."""
+    return self._req('POST', '/lookup/path', path)
+
+  def lookup_suffix(self, suffix):
+    """Returns the paths of the files whose path ends with suffix."""
+    return self._req('POST', '/lookup/suffix', suffix)
+
+  def search_async(self, q, timeout = None):
+    search_id = _new_search_id()
+    return AsyncSearch(self.host, self.port, _search_request_with_id(q, timeout, search_id), search_id)
+
+  def search_stream_async(self, q, timeout = None):
+    """
+    Like search_async, but the daemon sends the best hits before the complete
+    results. See AsyncSearchStream.
+    """
+    search_id = _new_search_id()
+    return AsyncSearchStream(self.host, self.port, _search_request_with_id(q, timeout, search_id), search_id)
+
+  def cancel_search_async(self, search):
+    """
+    Abandons an AsyncSearch and tells the daemon to stop working on it.
+    Returns the AsyncRequest for the cancel, which callers can close once it
+    is answered.
+    """
+    search.close()
+    return AsyncRequest(self.host, self.port, 'POST', '/search/cancel', {"id": search.id}, lambda d: d)
 
   @property
   def is_up_to_date(self):
@@ -165,19 +215,76 @@ class DBProxy(object):
     d = self._req('GET', '/status')
     return DBStatus.from_dict(d)
 
+  def wait_for_status_change_async(self, known_status):
+    """
+    Returns an AsyncRequest whose result is the daemon's DBStatus once it
+    differs from known_status, which may be None, or after a while anyway.
+    """
+    if known_status:
+      known_status = known_status.as_dict()
+    return AsyncRequest(self.host, self.port, 'POST', '/status/wait', known_status, DBStatus.from_dict)
+
   def begin_reindex(self):
     return self._req('POST', '/begin_reindex')
 
+  def slow_queries(self):
+    return self._req('GET', '/slow_queries')
+
+  def start_profiler(self, interval = None):
+    if interval == None:
+      self._req('POST', '/profiler/start')
+    else:
+      self._req('POST', '/profiler/start', {"interval": interval})
+
+  def stop_profiler(self):
+    self._req('POST', '/profiler/stop')
+
+  def profiler_status(self):
+    return self._req('GET', '/profiler')
+
+  def profiler_stacks(self):
+    return self._req('GET', '/profiler/stacks', as_text = True)
+
+
+_next_search_id = 0
+def _new_search_id():
+  global _next_search_id
+  _next_search_id += 1
+  return "%i.%i" % (os.getpid(), _next_search_id)
 
-class AsyncSearchError(object): 
+def _search_request(q, timeout, debug = False):
+  if timeout is None and not debug:
+    return q
+  req = {"query": q}
+  if timeout is not None:
+    req["timeout"] = timeout
+  if debug:
+    req["debug"] = True
+  return req
+
+def _search_request_with_id(q, timeout, search_id):
+  req = {"query": q, "id": search_id}
+  if timeout is not None:
+    req["timeout"] = timeout
+  return req
+
+class AsyncSearchError(Exception):
   pass
 
-class AsyncSearch(object):
-  def __init__(self, host, port, q):
+class AsyncRequest(object):
+  """
+  A json request to the daemon that completes in the background. Poll ready,
+  or wait for fileno() to become readable, then read result.
+  """
+  def __init__(self, host, port, method, path, data, result_from_dict):
     self.async_conn = async_http_connection.AsyncHTTPConnection(host, port)
-    self.async_conn.begin_request('POST', '/search', json.dumps(q))
+    self.async_conn.begin_request(method, path, json.dumps(data))
+    self._result_from_dict = result_from_dict
     self._result = None
 
+  def fileno(self):
+    return self.async_conn.fileno()
+
   @property
   def ready(self):
      return self.async_conn.is_response_ready()
@@ -188,13 +295,86 @@ class AsyncSearch(object):
        raise AsyncSearchError, 'connection died during search'
 
      if not self._result:
-       res = self.async_conn.get_response()
-       if res.status != 200:
+       self.async_conn.is_response_ready(None) # blocks until the response arrives
+       try:
+         res = self.async_conn.get_response()
+       except async_http_connection.AsyncError:
+         res = None
+       if not res or res.status != 200:
          self.async_conn.close()
          self.async_conn = None
-         raise AsyncSearchError, 'got status %i' % res.status
+         if res:
+           raise AsyncSearchError, 'got status %i' % res.status
+         raise AsyncSearchError, 'connection died during search'
        else:
          data = res.read()
          res = json.loads(data.encode('utf8'))
-         self._result = DBIndexSearchResult.from_dict(res)
+         self._result = self._result_from_dict(res)
      return self._result
+
+  def close(self):
+    if self.async_conn:
+      self.async_conn.close()
+      self.async_conn = None
+
+class AsyncSearch(AsyncRequest):
+  def __init__(self, host, port, q, search_id = None):
+    AsyncRequest.__init__(self, host, port, 'POST', '/search', q, DBIndexSearchResult.from_dict)
+    self.id = search_id
+
+class AsyncSearchStream(AsyncSearch):
+  """
+  A search whose results arrive in several batches, best hits first. Each
+  time fileno() becomes readable, call read_results() for the batches that
+  have arrived. Every batch replaces the one before it, and done is set once
+  the last, complete one has arrived.
+  """
+  def __init__(self, host, port, q, search_id = None):
+    AsyncRequest.__init__(self, host, port, 'POST', '/search/stream', q, DBIndexSearchResult.from_dict)
+    self.id = search_id
+    self.done = False
+    self._response = None
+    self._buffer = ''
+
+  def read_results(self):
+    if not self.async_conn:
+      raise AsyncSearchError, 'connection died during search'
+
+    if not self._response:
+      if not self.async_conn.is_response_ready():
+        return []
+      try:
+        res = self.async_conn.get_streaming_response()
+      except async_http_connection.AsyncError:
+        res = None
+      if not res or res.status != 200:
+        self.close()
+        if res:
+          raise AsyncSearchError, 'got status %i' % res.status
+        raise AsyncSearchError, 'connection died during search'
+      self._response = res
+
+    data = self.async_conn.read_available()
+    if data == None:
+      self.done = True
+      if self._buffer != '':
+        raise AsyncSearchError, 'connection died during search'
+      return []
+    lines = (self._buffer + data).split('\n')
+    self._buffer = lines.pop()
+    results = [self._result_from_dict(json.loads(l.encode('utf8'))) for l in lines]
+    if len(results):
+      self._result = results[-1]
+    return results
+
+  @property
+  def result(self):
+    """Blocks until the complete results arrive, then returns them."""
+    while not self.done:
+      self.read_results()
+      if not self.done:
+        select.select([self.fileno()], [], [])
+    if not self._result:
+      raise AsyncSearchError, 'connection died during search'
+    return self._result
+
@@ -40,6 +40,35 @@ class DBProxyTest(db_test_base.DBTestBase, unittest.TestCase):
     self.assertEquals(1, len(res.hits))
     self.assertEquals(os.path.join(self.test_data_dir, 'project1/MySubSystem.c'), res.hits[0])
 
+  def test_cancel_search(self):
+    self.db.add_dir(self.test_data_dir)
+    self.db.sync()
+    a = self.db.search_async('MySubSystem.c')
+    cancel = self.db.cancel_search_async(a)
+    self.assertEquals({"status": "OK"}, cancel.result)
+    cancel.close()
+
+    # later searches are unaffected
+    a = self.db.search_async('MySubSystem.c')
+    self.assertEquals(1, len(a.result.hits))
+
+  def test_search_stream(self):
+    self.db.add_dir(self.test_data_dir)
+    self.db.sync()
+    a = self.db.search_stream_async('MySubSystem.c')
+    self.assertEquals(1, len(a.result.hits))
+    self.assertTrue(a.done)
+    a.close()
+
+  def test_wait_for_status_change(self):
+    stat = self.db.status()
+    w = self.db.wait_for_status_change_async(stat)
+    self.db.add_dir(self.test_data_dir)
+    self.assertNotEquals(stat.status, w.result.status)
+
+    w = self.db.wait_for_status_change_async(None)
+    self.assertEquals(self.db.status().status, w.result.status)
+
   def tearDown(self):
     self.daemon.close()
     db_test_base.DBTestBase.tearDown(self)
@@ -13,11 +13,25 @@
 # limitations under the License.
 import daemon
 import db
+import fixed_size_dict
 import re
 import time
 
 from trace_event import *
 
+# How long a /status/wait request is held before it is answered anyway.
+STATUS_WAIT_TIMEOUT = 30
+
+def _same_status(a, b):
+  """Whether two status dicts are the same, apart from their shard stats."""
+  if a is None or b is None:
+    return a is b
+  a = dict(a)
+  b = dict(b)
+  a.pop("shards", None)
+  b.pop("shards", None)
+  return a == b
+
 # TODO(nduca): is Stub the right word for this class? Mehh
 class DBStub(object):
   def __init__(self, settings, server):
@@ -36,11 +50,24 @@ class DBStub(object):
     server.add_json_route('/ignores/remove', self.ignores_remove, ['POST'])
     server.add_json_route('/sync', self.sync, ['POST'])
     server.add_json_route('/status', self.status, ['GET'])
+    server.add_json_route('/status/wait', self.status_wait, ['POST'])
+    server.add_json_route('/search/cancel', self.search_cancel, ['POST'], immediate = True)
+    server.add_json_stream_route('/search/stream', self.search_stream, ['POST'])
+    server.add_json_route('/search/batch', self.search_batch, ['POST'])
     server.add_json_route('/search', self.search, ['POST'])
+    server.add_json_route('/lookup/(basename|path|suffix)', self.lookup, ['POST'])
+    server.add_json_route('/record_open', self.record_open, ['POST'])
+    server.add_json_route('/slow_queries', self.slow_queries, ['GET'])
+    server.add_json_route('/profiler/start', self.profiler_start, ['POST'])
+    server.add_json_route('/profiler/stop', self.profiler_stop, ['POST'])
+    server.add_text_route('/profiler/stacks', self.profiler_stacks, ['GET'])
+    server.add_json_route('/profiler', self.profiler_status, ['GET'])
     if not self.db.is_up_to_date:
       self.on_db_needs_indexing()
     self.server.lo_idle.add_listener(self.on_daemon_lo_idle)
     self._last_flush_time = 0
+    self._status_waiters = [] # (DeferredResponse, status dict the client has, expiry time)
+    self._canceled_search_ids = fixed_size_dict.FixedSizeDict(64)
 
   def on_db_needs_indexing(self):
     if self.hi_idle_hook_added:
@@ -52,9 +79,11 @@ class DBStub(object):
     if time.time() - self._last_flush_time > 5:
       trace_flush()
       self._last_flush_time = time.time()
+    self._update_status_waiters()
 
   def on_daemon_hi_idle(self):
     self.db.step_indexer()
+    self._update_status_waiters()
 
     if self.db.is_up_to_date:
       self.server.hi_idle.remove_listener(self.on_daemon_hi_idle)
@@ -98,15 +127,129 @@ class DBStub(object):
     return {"status": "OK"}
 
   def search(self, m, verb, data):
-    return self.db.search(data).as_dict()
+    # data is either the bare query string or a dict with the query and options
+    if type(data) != dict:
+      return self.db.search(data).as_dict()
+    should_cancel = self._search_canceler(data)
+    if should_cancel():
+      return self._canceled_search_result()
+    return self.db.search(data["query"],
+                          data.get("max_hits", -1),
+                          data.get("timeout", None),
+                          should_cancel).as_dict(data.get("debug", False))
+
+  def search_stream(self, m, verb, data):
+    """Like search, but streams the best hits ahead of the complete results."""
+    if type(data) != dict:
+      raise daemon.SilentException("Expected search options")
+    should_cancel = self._search_canceler(data)
+    if should_cancel():
+      return [self._canceled_search_result()]
+    results = self.db.search_progressively(data["query"],
+                                           data.get("max_hits", -1),
+                                           data.get("timeout", None),
+                                           should_cancel)
+    debug = data.get("debug", False)
+    return (res.as_dict(debug) for res in results)
+
+  def search_batch(self, m, verb, data):
+    if type(data) != dict or "queries" not in data:
+      raise daemon.SilentException("Expected queries")
+    results = self.db.search_batch(data["queries"],
+                                   data.get("exact", False),
+                                   data.get("max_hits", -1),
+                                   data.get("timeout", None))
+    debug = data.get("debug", False)
+    return {"results": [res.as_dict(debug) for res in results]}
+
+  def lookup(self, m, verb, data):
+    if not isinstance(data, basestring):
+      raise daemon.SilentException("Expected a name to look up")
+    return getattr(self.db, 'lookup_' + m.group(1))(data)
+
+  def record_open(self, m, verb, data):
+    if not isinstance(data, basestring):
+      raise daemon.SilentException("Expected a path")
+    self.db.record_open(data)
+    return {"status": "OK"}
+
+  def _search_canceler(self, data):
+    if "query" not in data:
+      raise daemon.SilentException("Expected query")
+
+    # A search stops early if its client hangs up or cancels it by id.
+    search_id = data.get("id", None)
+    def should_cancel():
+      self.server.handle_immediate_requests()
+      if search_id != None and search_id in self._canceled_search_ids:
+        return True
+      return self.server.current_client_disconnected()
+    return should_cancel
+
+  def _canceled_search_result(self):
+    res = db.DBIndexSearchResult()
+    res.partial = True
+    return res.as_dict()
+
+  def search_cancel(self, m, verb, data):
+    """Cancels the search with id data["id"], whether it is running or not yet started."""
+    self._canceled_search_ids[data["id"]] = True
+    return {"status": "OK"}
 
   def sync(self, m, verb, data):
     self.db.sync()
     return {"status": "OK"}
 
+  def slow_queries(self, m, verb, data):
+    return self.db.slow_queries()
+
+  def profiler_start(self, m, verb, data):
+    if data and "interval" in data:
+      self.db.start_profiler(data["interval"])
+    else:
+      self.db.start_profiler()
+    return {"status": "OK"}
+
+  def profiler_stop(self, m, verb, data):
+    self.db.stop_profiler()
+    return {"status": "OK"}
+
+  def profiler_status(self, m, verb, data):
+    return self.db.profiler_status()
+
+  def profiler_stacks(self, m, verb, data):
+    return self.db.profiler_stacks()
+
   def status(self, m, verb, data):
     return self.db.status().as_dict()
 
+  def status_wait(self, m, verb, data):
+    """
+    Long-poll for status changes. data is the status the client last saw, or
+    None. Answers as soon as the status differs from it. The shard stats
+    change with every search, so they don't count as a change.
+    """
+    cur = self.db.status().as_dict()
+    if not _same_status(data, cur):
+      return cur
+    d = daemon.DeferredResponse()
+    self._status_waiters.append((d, data, time.time() + STATUS_WAIT_TIMEOUT))
+    return d
+
+  def _update_status_waiters(self):
+    if not len(self._status_waiters):
+      return
+    cur = self.db.status().as_dict()
+    now = time.time()
+    waiting = []
+    for w in self._status_waiters:
+      (d, known, expires) = w
+      if not _same_status(known, cur) or now >= expires:
+        d.complete(cur)
+      else:
+        waiting.append(w)
+    self._status_waiters = waiting
+
   def begin_reindex(self, m, verb, data):
     self.db.begin_reindex()
     return {"status": "OK"}
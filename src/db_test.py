@@ -47,6 +47,20 @@ class DBTest(DBTestBase, unittest.TestCase):
     self.assertEquals(1, len(res.hits))
     self.assertEquals(os.path.join(self.test_data_dir, 'something/something_file.txt'), res.hits[0])
 
+  def test_slow_queries(self):
+    self.db.add_dir(self.test_data_dir)
+    self.db.sync()
+    self.db.search('MyClass')
+    self.settings.slow_query_ms = 0
+    self.db.search('MySubSystem')
+    for res in self.db.search_progressively('something_file'):
+      pass
+    entries = self.db.slow_queries()
+    self.assertEquals(['MySubSystem', 'something_file'], [e["q"] for e in entries])
+    self.assertEquals(1, entries[0]["generation"])
+    self.assertTrue(entries[0]["stage"] in ["wordstart", "substring", "superfuzzy"])
+    self.assertEquals(len(entries[0]["shards"]), len(self.db.status().shards))
+
   def tearDown(self):
     DBTestBase.tearDown(self)
     self.settings_file.close()
@@ -75,6 +75,13 @@ class DBTestBase(object):
     self.assertEquals(1, len(res.hits))
     self.assertEquals(os.path.join(self.test_data_dir, 'project1/MySubSystem.c'), res.hits[0])
 
+  def test_search_with_timeout(self):
+    self.db.add_dir(self.test_data_dir)
+    self.db.sync()
+    res = self.db.search('MySubSystem.c', timeout = 60)
+    self.assertEquals(1, len(res.hits))
+    self.assertFalse(res.partial)
+
   def test_search_finds_new_file(self):
     self.db.add_dir(self.test_data_dir)
     self.db.sync()
@@ -117,6 +124,70 @@ class DBTestBase(object):
     self.assertEquals(1, len(res.hits))
     self.assertEquals(os.path.join(self.test_data_dir, 'project1/MySubSystem.c'), res.hits[0])
 
+  def test_search_batch(self):
+    self.db.add_dir(self.test_data_dir)
+    self.db.sync()
+    queries = ['MySubSystem.c', 'project1/MyClass', 'MyClass', 'nothing_named_this', '']
+    results = self.db.search_batch(queries)
+    self.assertEquals(len(queries), len(results))
+    for i in range(len(queries)):
+      self.assertEquals(self.db.search(queries[i]).hits, results[i].hits)
+
+  def test_search_batch_exact(self):
+    self.db.add_dir(self.test_data_dir)
+    self.db.sync()
+    results = self.db.search_batch(['myclass.c', 'MyClass', 'project1/MySubSystem.c', 'xxx/MySubSystem.c'], exact = True)
+    self.assertEquals([os.path.join(self.test_data_dir, 'project1/MyClass.c')], results[0].hits)
+    self.assertEquals([], results[1].hits)
+    self.assertEquals([os.path.join(self.test_data_dir, 'project1/MySubSystem.c')], results[2].hits)
+    self.assertEquals([], results[3].hits)
+
+  def test_lookup(self):
+    self.db.add_dir(self.test_data_dir)
+    self.db.sync()
+    path = os.path.join(self.test_data_dir, 'project1/MySubSystem.c')
+    self.assertEquals([path], self.db.lookup_basename('MySubSystem.c'))
+    self.assertEquals([], self.db.lookup_basename('mysubsystem.c'))
+    self.assertEquals([path], self.db.lookup_path(path))
+    self.assertEquals([path], self.db.lookup_path('project1/MySubSystem.c'))
+    self.assertEquals([], self.db.lookup_path('MySubSystem.c'))
+    self.assertEquals([path], self.db.lookup_suffix('project1/MySubSystem.c'))
+    self.assertEquals([], self.db.lookup_suffix('roject1/MySubSystem.c'))
+
+  def test_record_open(self):
+    self.db.add_dir(self.test_data_dir)
+    self.db.sync()
+    hits = self.db.search('MyClass').hits
+    self.assertTrue(len(hits) >= 2)
+    self.db.record_open(hits[-1])
+    self.assertEquals(hits[-1], self.db.search('MyClass').hits[0])
+
+  def test_status_shards(self):
+    self.db.add_dir(self.test_data_dir)
+    self.db.sync()
+    self.db.search('MyClass')
+    shards = self.db.status().shards
+    self.assertTrue(len(shards) >= 1)
+    self.assertEquals(1, shards[0]["searches"])
+
+  def test_profiler(self):
+    self.db.add_dir(self.test_data_dir)
+    self.db.sync()
+    self.db.start_profiler(0.001)
+    self.assertTrue(self.db.profiler_status()["running"])
+    deadline = time.time() + 10
+    i = 0
+    while self.db.profiler_status()["samples"] == 0 and time.time() < deadline:
+      self.db.search('MyClass%i' % i)
+      i += 1
+    self.db.stop_profiler()
+    status = self.db.profiler_status()
+    self.assertFalse(status["running"])
+    self.assertTrue(status["samples"] > 0)
+    lines = self.db.profiler_stacks().splitlines()
+    self.assertTrue(len(lines) > 0)
+    self.assertTrue(all([l.startswith('quickopend;') or l.startswith('shard') for l in lines]))
+
   def test_partial_search(self):
     self.db.add_dir(self.test_data_dir)
     self.assertFalse(self.db.is_up_to_date)
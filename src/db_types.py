@@ -0,0 +1,65 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# The objects that cross the wire between quickopend and its clients. These
+# live apart from db and db_index so that clients can decode them without
+# importing the daemon side of the database.
+
+class DBStatus(object):
+  def __init__(self):
+    self.is_up_to_date = False
+    self.has_index = False
+    self.status = "Unknown"
+    self.shards = [] # DBIndex.shard_stats() of the index being searched
+
+  def as_dict(self):
+    return {"is_up_to_date": self.is_up_to_date,
+            "has_index": self.has_index,
+            "status": self.status,
+            "shards": self.shards}
+
+  @staticmethod
+  def from_dict(d):
+    s = DBStatus()
+    s.is_up_to_date = d["is_up_to_date"]
+    s.has_index = d["has_index"]
+    s.status = d["status"]
+    s.shards = d.get("shards", [])
+    return s
+
+class DBIndexSearchResult(object):
+  def __init__(self):
+    self.hits = []
+    self.ranks = []
+    self.truncated = False
+    self.partial = False # the search ran out of time before looking at everything
+    self.debug = None # how the shards did; see DBIndex._search_debug
+
+  def as_dict(self, debug = False):
+    d = {"hits": self.hits,
+         "ranks": self.ranks,
+         "truncated": self.truncated,
+         "partial": self.partial}
+    if debug and self.debug is not None:
+      d["debug"] = self.debug
+    return d
+
+  @staticmethod
+  def from_dict(d):
+    r = DBIndexSearchResult()
+    r.hits = d["hits"]
+    r.ranks = d["ranks"]
+    r.truncated = d["truncated"]
+    r.partial = d.get("partial", False)
+    r.debug = d.get("debug", None)
+    return r
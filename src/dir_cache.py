@@ -11,19 +11,64 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import array
 import os
 import fnmatch
 import logging
 
+from path_table import PathTable
+
+class OSFileSystem(object):
+  """The file system calls that DirCache and the crawl make."""
+  stat = staticmethod(os.stat)
+  listdir = staticmethod(os.listdir)
+  islink = staticmethod(os.path.islink)
+  isdir = staticmethod(os.path.isdir)
+  realpath = staticmethod(os.path.realpath)
+
+class CountingFileSystem(object):
+  """Forwards to another file system, counting the calls made to each function."""
+  def __init__(self, fs = None):
+    self._fs = fs or OSFileSystem()
+    self.counts = dict([(name, 0) for name in ('stat', 'listdir', 'islink', 'isdir', 'realpath')])
+
+  def reset(self):
+    for name in self.counts:
+      self.counts[name] = 0
+
+  def stat(self, path):
+    self.counts['stat'] += 1
+    return self._fs.stat(path)
+
+  def listdir(self, path):
+    self.counts['listdir'] += 1
+    return self._fs.listdir(path)
+
+  def islink(self, path):
+    self.counts['islink'] += 1
+    return self._fs.islink(path)
+
+  def isdir(self, path):
+    self.counts['isdir'] += 1
+    return self._fs.isdir(path)
+
+  def realpath(self, path):
+    self.counts['realpath'] += 1
+    return self._fs.realpath(path)
+
 class DirEnt(object):
+  __slots__ = ['st_mtime', 'ents']
+
   def __init__(self, st_mtime, ents):
     self.st_mtime = st_mtime
-    self.ents = ents
+    self.ents = ents # array of component ids in the owning DirCache's PathTable
 
 class DirCache(object):
-  def __init__(self):
-    self.dirs = dict()
-    self.rel_to_real = dict()
+  def __init__(self, fs = None):
+    self.fs = fs or OSFileSystem()
+    self.paths = PathTable()
+    self.dirs = dict() # maps PathTable node to DirEnt
+    self._real = array.array('l') # maps PathTable node to the node of its realpath, -1 if unknown
     self.ignores = []
 
   def set_ignores(self, ignores):
@@ -38,15 +83,99 @@ class DirCache(object):
       self.ignores = [fixpath(i) for i in ignores]
 
   def reset_realpath_cache(self):
-    self.rel_to_real = dict()
+    # Only the directory nodes need to survive, and of those only the ones
+    # their cached parent still lists: the rest were deleted or ignored
+    # since. Everything else in the table was put there by realpath() and
+    # will be re-added on demand. The components are interned afresh too,
+    # so that the names of deleted files and dirs don't pile up.
+    old = self.paths
+    listed = dict()
+    parent_ents = dict()
+    survivors = [(n, de) for n,de in self.dirs.iteritems() if self._is_listed(n, listed, parent_ents)]
+    paths = PathTable()
+    new_ids = dict() # old component id -> new one
+    live = set()
+    for n,de in survivors:
+      live.update(de.ents)
+    for c in live:
+      new_ids[c] = paths.intern_component(old.component(c))
+    new_nodes = dict() # old node -> new one
+    dirs = dict()
+    for n,de in survivors:
+      ents = array.array('l', map(new_ids.__getitem__, de.ents))
+      dirs[self._copy_node(n, paths, new_nodes)] = DirEnt(de.st_mtime, ents)
+    self.paths = paths
+    self.dirs = dirs
+    self._real = array.array('l')
+
+  def _is_listed(self, n, listed, parent_ents):
+    """
+    Whether dir node n, and each of its ancestors up to the first one that
+    isn't cached, is listed by its parent. listed memoizes the answer per
+    node, and parent_ents the cached dirs' ents as sets.
+    """
+    chain = []
+    while n not in listed:
+      p = self.paths.parent(n)
+      if p not in self.dirs:
+        listed[n] = True
+        break
+      if p not in parent_ents:
+        parent_ents[p] = set(self.dirs[p].ents)
+      if self.paths.component_of(n) not in parent_ents[p]:
+        listed[n] = False
+        break
+      chain.append(n)
+      n = p
+    for m in chain:
+      listed[m] = listed[n]
+    return listed[n]
+
+  def _copy_node(self, n, paths, new_nodes):
+    """
+    Returns the node for the path of node n in paths, interning it and its
+    ancestors there. new_nodes memoizes them.
+    """
+    chain = []
+    while n != -1 and n not in new_nodes:
+      chain.append(n)
+      n = self.paths.parent(n)
+    new = new_nodes.get(n, -1)
+    chain.reverse()
+    for m in chain:
+      new = paths.intern_child(new, self.paths.basename(m))
+      new_nodes[m] = new
+    return new
+
+  def _set_real(self, n, rn):
+    if n >= len(self._real):
+      self._real.extend([-1] * (n + 1 - len(self._real)))
+    self._real[n] = rn
+
+  def _is_real(self, n):
+    return n != -1 and n < len(self._real) and self._real[n] == n
 
   def realpath(self, d):
-    if d in self.rel_to_real:
-      return self.rel_to_real[d]
+    n = self.paths.lookup(d)
+    if n != -1 and n < len(self._real) and self._real[n] != -1:
+      return self.paths.path(self._real[n])
+
+    # Entries of a directory already known to be real only need an lstat, and
+    # don't need caching: the crawl asks for each of them exactly once.
+    parent, basename = os.path.split(d)
+    if basename not in ('', '.', '..') and self._is_real(self.paths.lookup(parent)):
+      if not self.fs.islink(d):
+        return d
+
+    n = self.paths.intern(d)
+    r = self.fs.realpath(d)
+    if r == d:
+      self._set_real(n, n)
     else:
-      r = os.path.realpath(d)
-      self.rel_to_real[d] = r
-      return r
+      rn = self.paths.intern(r)
+      self._set_real(rn, rn)
+      self._set_real(n, rn)
+    return r
 
   def is_ignored(self, basename, fullname):
     for i in self.ignores:
@@ -59,7 +188,9 @@ class DirCache(object):
     return False
 
   def iterdirnames(self):
-    return self.dirs.iterkeys()
+    paths = self.paths # reset_realpath_cache may swap the table mid-iteration
+    for n in self.dirs.keys():
+      yield paths.path(n)
 
   def listdir_with_changed_status(self, d):
     """
@@ -69,23 +200,26 @@ class DirCache(object):
 
     Changed is only True if the current directory changed. Will not change if the child directory changes.
     """
-    if d in self.dirs:
-      de = self.dirs[d]
+    n = self.paths.intern(d)
+    if d == os.path.normpath(d):
+      self._set_real(n, n) # callers only ever pass realpaths
+    if n in self.dirs:
+      de = self.dirs[n]
       try:
-        st_mtime = os.stat(d).st_mtime
+        st_mtime = self.fs.stat(d).st_mtime
       except OSError:
         st_mtime = 0
-        del self.dirs[d]
+        del self.dirs[n]
         logging.debug("directory %s gone", d)
         return ([], True)
 
       if st_mtime == de.st_mtime:
-        return (de.ents, False)
+        return (self._names(de.ents), False)
       else:
-        cur_ents = self.dirs[d].ents
-        del self.dirs[d]
+        cur_ents = self.dirs[n].ents
+        del self.dirs[n]
         new_ents = self.listdir_with_changed_status(d)[0]
-        changed = set(new_ents) != set(cur_ents)
+        changed = set(self._names(cur_ents)) != set(new_ents)
         if changed:
           logging.debug("directory %s really changed", d)
         else:
@@ -94,18 +228,25 @@ class DirCache(object):
     else:
       # directory is not in cache...
       try:
-        st = os.stat(d)
+        st = self.fs.stat(d)
         st_mtime = st.st_mtime
-        ents = os.listdir(d)
+        ents = self.fs.listdir(d)
       except OSError:
         return ([], False)
 
       logging.debug("found directory %s mt=%s", d, st_mtime)
       ents = [e for e in ents if not self.is_ignored(e, os.path.join(d, e))]
-      de = DirEnt(st_mtime, ents)
-      self.dirs[d] = de
-      return (de.ents, True)
+      packed_ents = array.array('l', [self.paths.intern_component(e) for e in ents])
+      self.dirs[n] = DirEnt(st_mtime, packed_ents)
+      return (ents, True)
+
+  def _names(self, ents):
+    components = self.paths.components
+    return [components[c] for c in ents]
     
   def listdir(self, d):
     """Lists contents of a dir, but only using its realpath."""
     return self.listdir_with_changed_status(d)[0]
+
+  def isdir(self, path):
+    return self.fs.isdir(path)
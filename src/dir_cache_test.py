@@ -11,9 +11,14 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import array
+import db_indexer
+import os
+import shutil
+import tempfile
 import time
 import unittest
-from dir_cache import DirCache
+from dir_cache import CountingFileSystem, DirCache
 from test_data import TestData
 
 class DirCacheTest(unittest.TestCase):
@@ -76,4 +81,79 @@ class DirCacheTest(unittest.TestCase):
     self.test_data.write2('READMEx')
     self.assertFalse(c.listdir_with_changed_status(base)[1])
 
+  def test_realpath(self):
+    c = DirCache()
+    link = self.test_data.path_to('something/foo.txt')
+    target = self.test_data.path_to('project1/foo.txt')
+    self.assertEquals(target, c.realpath(link))
+    self.assertEquals(target, c.realpath(link))
+    self.assertEquals(target, c.realpath(target))
+
+  def test_realpath_of_listed_entries(self):
+    c = DirCache()
+    something = self.test_data.path_to('something')
+    c.listdir(something)
+    self.assertEquals(self.test_data.path_to('project1/foo.txt'),
+                      c.realpath(os.path.join(something, 'foo.txt')))
+    readme = os.path.join(something, 'README')
+    self.assertEquals(readme, c.realpath(readme))
+
+  def test_listdir_survives_realpath_reset(self):
+    c = DirCache()
+    something = self.test_data.path_to('something')
+    ents = c.listdir(something)
+    c.realpath(os.path.join(something, 'README'))
+    c.reset_realpath_cache()
+    self.assertEquals([something], list(c.iterdirnames()))
+    self.assertEquals((ents, False), c.listdir_with_changed_status(something))
+
+  def test_reindex_forgets_deleted_dirs(self):
+    root = os.path.realpath(tempfile.mkdtemp())
+    try:
+      for i in range(20):
+        d = os.path.join(root, 'gone', 'dir%i' % i)
+        os.makedirs(d)
+        open(os.path.join(d, 'file%i.txt' % i), 'w').close()
+      os.mkdir(os.path.join(root, 'kept'))
+      open(os.path.join(root, 'kept', 'README'), 'w').close()
+      c = DirCache()
+      def reindex():
+        indexer = db_indexer.DBIndexer([root], c)
+        while not indexer.complete:
+          indexer.index_a_bit_more()
+      reindex()
+      before = len(c.paths.components)
+      shutil.rmtree(os.path.join(root, 'gone'))
+      # what the daemon's up to date check does before it reindexes
+      for d in list(c.iterdirnames()):
+        c.listdir_with_changed_status(d)
+      reindex()
+      self.assertEquals(set([root, os.path.join(root, 'kept')]), set(c.iterdirnames()))
+      self.assertEquals(['README'], c.listdir(os.path.join(root, 'kept')))
+      self.assertTrue(len(c.paths.components) < before - 40)
+    finally:
+      shutil.rmtree(root)
+
+  def test_reset_forgets_unlisted_dirs(self):
+    c = DirCache()
+    project1 = self.test_data.path_to('project1')
+    c.listdir(project1)
+    c.listdir(os.path.join(project1, 'module'))
+    self.assertEquals(2, len(c.dirs))
+    # as if project1 had been listed again after its subdir was deleted
+    c.dirs[c.paths.lookup(project1)].ents = array.array('l')
+    c.reset_realpath_cache()
+    self.assertEquals([project1], list(c.iterdirnames()))
 
+  def test_counting_file_system(self):
+    fs = CountingFileSystem()
+    c = DirCache(fs)
+    something = self.test_data.path_to('something')
+    ents = c.listdir(something)
+    self.assertEquals(1, fs.counts['listdir'])
+    self.assertEquals(1, fs.counts['stat'])
+    self.assertEquals(ents, c.listdir(something))
+    self.assertEquals(1, fs.counts['listdir']) # cached; only stat'd for its mtime
+    self.assertEquals(2, fs.counts['stat'])
+    fs.reset()
+    self.assertEquals(0, sum(fs.counts.values()))
@@ -0,0 +1,173 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import array
+import bisect
+import time
+
+from db_index_shard import DBIndexShard
+
+# How many dir names each component of a fuzzy dir query may match. As with
+# basenames, the word start matches, which are the best, are found first.
+FUZZY_MAX_NAMES = 1000
+
+class DirSuffixIndex(object):
+  """
+  Finds the directories of a PathTable whose path ends with a given string,
+  without building any of their paths. Queries are matched one component at
+  a time from the end: the last query component must be a whole directory
+  name except when it is the only one, earlier components must match the
+  ancestors exactly, and the first query component need only be a suffix of
+  the ancestor it lines up with. That is the same as
+  path(d).lower().endswith(query), just without touching every directory.
+
+  search_fuzzy() is the fallback for when that finds nothing: each query
+  component is matched against the directory names the way basenames are,
+  so "cont/brow" finds content/browser.
+  """
+  def __init__(self, table):
+    self._table = table
+    self.timed_out = False # whether the last fuzzy search ran out of time or was canceled
+    self._nodes_by_name = dict() # lower-cased dir name -> array of dir nodes
+    names = set()
+    for n in xrange(len(table)):
+      basename = table.basename(n)
+      names.add(basename)
+      name = basename.lower()
+      if name not in self._nodes_by_name:
+        self._nodes_by_name[name] = array.array('l')
+      self._nodes_by_name[name].append(n)
+    # reversed so that names ending with a suffix are a contiguous range
+    self._reversed_names = sorted([name[::-1] for name in self._nodes_by_name])
+    # built along with the rest so that no search has to wait for it
+    self._fuzzy = DBIndexShard(list(names))
+
+  def _names_ending_with(self, suffix):
+    r = suffix[::-1]
+    i = bisect.bisect_left(self._reversed_names, r)
+    names = []
+    while i < len(self._reversed_names) and self._reversed_names[i].startswith(r):
+      names.append(self._reversed_names[i][::-1])
+      i += 1
+    return names
+
+  def _nodes_named(self, names):
+    nodes = []
+    for name in names:
+      if name in self._nodes_by_name:
+        nodes.extend(self._nodes_by_name[name])
+    return nodes
+
+  def _ancestors_match(self, n, components):
+    # components are the query components before the last, outermost first
+    for i in range(len(components) - 1, -1, -1):
+      n = self._table.parent(n)
+      if n == -1:
+        return False
+      name = self._table.basename(n).lower()
+      if i == 0:
+        return name.endswith(components[0])
+      if name != components[i]:
+        return False
+    return True
+
+  def search(self, dirpart):
+    """Returns the dir nodes whose path ends with dirpart, ignoring case."""
+    components = dirpart.lower().split('/')
+    if len(components) == 1:
+      return self._nodes_named(self._names_ending_with(components[0]))
+    candidates = self._nodes_named([components[-1]])
+    return [n for n in candidates if self._ancestors_match(n, components[:-1])]
+
+  def _fuzzy_ranks(self, dirpart, deadline, should_cancel):
+    """
+    Returns a dict of lower-cased dir name -> rank for each component of
+    dirpart, or none at all if the search ran out of time or was canceled.
+    """
+    self.timed_out = False
+    ranks = []
+    self._fuzzy.should_cancel = should_cancel
+    try:
+      for c in [c for c in dirpart.split('/') if len(c)]:
+        ranks.append(self._fuzzy.search_basenames(c, FUZZY_MAX_NAMES, deadline)[0])
+        if self._fuzzy.timed_out:
+          self.timed_out = True
+          return []
+    finally:
+      self._fuzzy.should_cancel = None
+    return ranks
+
+  def _should_stop(self, deadline, should_cancel):
+    if deadline and time.time() > deadline:
+      return True
+    if should_cancel and should_cancel():
+      return True
+    return False
+
+  def _match_ancestors(self, n, ranks):
+    """
+    Matches ranks, outermost first, against n and its ancestors, skipping
+    ancestors that match nothing. Returns the summed rank or None.
+    """
+    total = 0
+    i = len(ranks) - 1
+    while i >= 0:
+      while n != -1 and self._table.basename(n).lower() not in ranks[i]:
+        n = self._table.parent(n)
+      if n == -1:
+        return None
+      total += ranks[i][self._table.basename(n).lower()]
+      n = self._table.parent(n)
+      i -= 1
+    return total
+
+  def search_fuzzy(self, dirpart, deadline = None, should_cancel = None):
+    """
+    Returns a dict of dir node -> rank for the dirs whose own name matches the
+    last component of dirpart fuzzily and whose ancestors match the earlier
+    components in order, though not necessarily adjacent ones. The rank is
+    the sum of the component ranks. Once deadline, a time.time() value,
+    passes or should_cancel() returns True, it returns what it has found and
+    sets self.timed_out.
+    """
+    ranks = self._fuzzy_ranks(dirpart, deadline, should_cancel)
+    res = dict()
+    if not len(ranks):
+      return res
+    for name,rank in ranks[-1].iteritems():
+      if self._should_stop(deadline, should_cancel):
+        self.timed_out = True
+        break
+      for n in self._nodes_by_name.get(name, []):
+        ancestors_rank = self._match_ancestors(self._table.parent(n), ranks[:-1])
+        if ancestors_rank is not None:
+          res[n] = rank + ancestors_rank
+    return res
+
+  def fuzzy_ranker(self, dirpart, deadline = None, should_cancel = None):
+    """
+    Returns a function of dir node -> rank, or None if the dir doesn't match.
+    Unlike search_fuzzy(), the last component may match any ancestor, so
+    "cont/brow" also takes in content/browser/tab_contents. Results are
+    memoized per dir, so build one ranker per query. If matching the
+    components runs out of time, as for search_fuzzy(), no dir matches.
+    """
+    ranks = self._fuzzy_ranks(dirpart, deadline, should_cancel)
+    memo = dict()
+    def rank(n):
+      if not len(ranks):
+        return None
+      if n not in memo:
+        memo[n] = self._match_ancestors(n, ranks)
+      return memo[n]
+    return rank
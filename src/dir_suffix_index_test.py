@@ -0,0 +1,71 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+import unittest
+
+from dir_suffix_index import DirSuffixIndex
+from path_table import PathTable
+
+class DirSuffixIndexTest(unittest.TestCase):
+  def setUp(self):
+    self.table = PathTable()
+    self.dirs = ['/home/x/chrome/src',
+                 '/home/x/chrome/src/base',
+                 '/home/x/chrome/src/third_party/sqlite/src',
+                 '/home/x/quickopen/src',
+                 '/home/x/quickopen/Resources',
+                 '/home/x/SRC']
+    for d in self.dirs:
+      self.table.intern(d)
+    self.index = DirSuffixIndex(self.table)
+
+  def _search(self, dirpart):
+    return set([self.table.path(n) for n in self.index.search(dirpart)])
+
+  def _reference(self, dirpart):
+    # every node in the table is a directory, including the interned prefixes
+    paths = set([self.table.path(n) for n in range(len(self.table))])
+    return set([p for p in paths if p.lower().endswith(dirpart.lower())])
+
+  def test_matches_endswith(self):
+    for q in ['src', 'rc', 'c', 'chrome/src', 'ome/src', '/chrome/src', 'quickopen/resources',
+              'sqlite/src', 'party/sqlite/src', 'src/base', 'x', 'nothere', 'nothere/src', '/home', 'home']:
+      self.assertEquals(self._reference(q), self._search(q), q)
+
+  def test_case_insensitive(self):
+    self.assertTrue('/home/x/SRC' in self._search('x/src'))
+    self.assertTrue('/home/x/quickopen/Resources' in self._search('Quickopen/RESOURCES'))
+
+  def test_whole_components_after_the_first(self):
+    self.assertEquals(set(), self._search('chrome/sr'))
+    self.assertEquals(set(['/home/x/chrome/src']), self._search('rome/src'))
+
+  def test_fuzzy(self):
+    res = self.index.search_fuzzy('qo/src')
+    self.assertEquals(set(['/home/x/quickopen/src']), set([self.table.path(n) for n in res]))
+    self.assertFalse(self.index.timed_out)
+
+  def test_fuzzy_stops_at_deadline(self):
+    self.assertEquals({}, self.index.search_fuzzy('qo/src', deadline = time.time() - 1))
+    self.assertTrue(self.index.timed_out)
+    rank = self.index.fuzzy_ranker('qo/src', deadline = time.time() - 1)
+    self.assertTrue(self.index.timed_out)
+    self.assertEquals(None, rank(self.table.lookup('/home/x/quickopen/src')))
+
+  def test_fuzzy_canceled(self):
+    self.assertEquals({}, self.index.search_fuzzy('qo/src', should_cancel = lambda: True))
+    self.assertTrue(self.index.timed_out)
+    # the canceler only applies to the search that was given it
+    self.assertEquals(1, len(self.index.search_fuzzy('qo/src')))
+    self.assertFalse(self.index.timed_out)
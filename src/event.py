@@ -42,7 +42,7 @@ class Event(object):
 
   def _fire(self,silent,args):
     last = None
-    for cb in self._listeners:
+    for cb in list(self._listeners): # listeners may remove themselves
       try:
         last = cb(*args)
       except Exception,e:
@@ -0,0 +1,100 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import array
+import os
+
+from path_table import PathTable
+
+class FileTable(object):
+  """
+  Stores indexed files as (directory, basename) id pairs. Directories are
+  interned in a PathTable and basenames share its component table, so the
+  long prefix that every file in a tree has in common is stored once rather
+  than once per file. Full paths are only built by path(), which callers
+  should save for the hits they actually return.
+  """
+  def __init__(self):
+    self.dirs = PathTable()
+    self._file_dirs = array.array('l') # file id -> dir node in self.dirs
+    self._file_basenames = array.array('l') # file id -> component id of the name it was found under
+    self._real_basenames = dict() # file id -> component id, for symlinks whose target is named differently
+
+  def __len__(self):
+    return len(self._file_dirs)
+
+  def add(self, basename, path):
+    """Adds path, which was found under the name basename. Returns its file id."""
+    dirname, real_basename = os.path.split(path)
+    fid = len(self._file_dirs)
+    self._file_dirs.append(self.dirs.intern(dirname))
+    self._file_basenames.append(self.dirs.intern_component(basename))
+    if real_basename != basename:
+      self._real_basenames[fid] = self.dirs.intern_component(real_basename)
+    return fid
+
+  def basenames(self):
+    """Returns the distinct names that files were found under."""
+    return [self.dirs.component(c) for c in set(self._file_basenames)]
+
+  def dir_of(self, fid):
+    return self._file_dirs[fid]
+
+  def basename_of(self, fid):
+    return self.dirs.component(self._file_basenames[fid])
+
+  def path(self, fid):
+    if fid in self._real_basenames:
+      basename = self.dirs.component(self._real_basenames[fid])
+    else:
+      basename = self.basename_of(fid)
+    return os.path.join(self.dirs.path(self._file_dirs[fid]), basename)
+
+  def group_by_basename(self, key_fn):
+    """
+    Groups the files by key_fn(basename). Returns (ids, starts, fids), packed
+    so that the files whose key is k are fids[starts[i]:starts[i+1]] where
+    i = ids[k].
+    """
+    ids = dict()
+    group_of_component = dict()
+    for c in set(self._file_basenames):
+      k = key_fn(self.dirs.component(c))
+      if k not in ids:
+        ids[k] = len(ids)
+      group_of_component[c] = ids[k]
+    groups = array.array('l', [group_of_component[c] for c in self._file_basenames])
+    starts, fids = _pack_groups(groups, len(ids))
+    return ids, starts, fids
+
+  def group_by_dir(self):
+    """
+    Groups the files by directory. Returns (starts, fids): the files directly
+    in dir node d are fids[starts[d]:starts[d+1]].
+    """
+    return _pack_groups(self._file_dirs, len(self.dirs))
+
+def _pack_groups(groups, ngroups):
+  """Counting sort of file ids by group. groups maps file id to group."""
+  starts = array.array('l', [0]) * (ngroups + 1)
+  for g in groups:
+    starts[g + 1] += 1
+  for i in xrange(ngroups):
+    starts[i + 1] += starts[i]
+  fill = array.array('l', starts)
+  fids = array.array('l', [0]) * len(groups)
+  for fid in xrange(len(groups)):
+    g = groups[fid]
+    fids[fill[g]] = fid
+    fill[g] += 1
+  return starts, fids
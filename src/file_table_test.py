@@ -0,0 +1,73 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from file_table import FileTable
+
+class FileTableTest(unittest.TestCase):
+  def test_add(self):
+    t = FileTable()
+    a = t.add("foo.cc", "/src/a/foo.cc")
+    b = t.add("foo.cc", "/src/b/foo.cc")
+    c = t.add("bar.h", "~/src/bar.h")
+    self.assertEquals(3, len(t))
+    self.assertEquals("/src/a/foo.cc", t.path(a))
+    self.assertEquals("/src/b/foo.cc", t.path(b))
+    self.assertEquals("~/src/bar.h", t.path(c))
+    self.assertEquals(set(["foo.cc", "bar.h"]), set(t.basenames()))
+
+  def test_dirs_are_shared(self):
+    t = FileTable()
+    a = t.add("a.cc", "/src/x/a.cc")
+    b = t.add("b.cc", "/src/x/b.cc")
+    self.assertEquals(t.dir_of(a), t.dir_of(b))
+    self.assertEquals("/src/x", t.dirs.path(t.dir_of(a)))
+
+  def test_symlinked_basename(self):
+    t = FileTable()
+    f = t.add("link.txt", "/src/target.txt")
+    self.assertEquals(["link.txt"], t.basenames())
+    self.assertEquals("link.txt", t.basename_of(f))
+    self.assertEquals("/src/target.txt", t.path(f))
+
+  def test_group_by_basename(self):
+    t = FileTable()
+    a = t.add("Foo.cc", "/a/Foo.cc")
+    b = t.add("bar.cc", "/b/bar.cc")
+    c = t.add("foo.cc", "/c/foo.cc")
+    ids, starts, fids = t.group_by_basename(lambda b: b.lower())
+    def group(k):
+      i = ids[k]
+      return set(fids[starts[i]:starts[i+1]])
+    self.assertEquals(set(["foo.cc", "bar.cc"]), set(ids.keys()))
+    self.assertEquals(set([a, c]), group("foo.cc"))
+    self.assertEquals(set([b]), group("bar.cc"))
+
+  def test_group_by_dir(self):
+    t = FileTable()
+    a = t.add("a.cc", "/x/y/a.cc")
+    b = t.add("b.cc", "/x/b.cc")
+    c = t.add("c.cc", "/x/y/c.cc")
+    starts, fids = t.group_by_dir()
+    y = t.dir_of(a)
+    self.assertEquals(set([a, c]), set(fids[starts[y]:starts[y+1]]))
+    x = t.dir_of(b)
+    self.assertEquals([b], list(fids[starts[x]:starts[x+1]]))
+    parent = t.dirs.lookup("/")
+    self.assertEquals([], list(fids[starts[parent]:starts[parent+1]]))
+
+  def test_relative_and_root_paths(self):
+    t = FileTable()
+    self.assertEquals("a.txt", t.path(t.add("a.txt", "a.txt")))
+    self.assertEquals("/a.txt", t.path(t.add("a.txt", "/a.txt")))
@@ -25,7 +25,14 @@ class LocalPool(object):
 
   def apply_async(self, fn, args=()):
     class Result(object):
-      def get(self):
+      # the work is done by get(), so there is never anything to wait for
+      def ready(self):
+        return True
+
+      def wait(self, timeout = None):
+        pass
+
+      def get(self, timeout = None):
         return fn(*args)
     return Result()
 
@@ -70,27 +70,59 @@ is_gtk, is_wx, is_objc, is_curses = detect_toolkit()
 
 has_toolkit = is_gtk or is_wx or is_objc or is_curses
 
-if is_gtk:
-  import message_loop_gtk as platform_message_loop
-elif is_wx:
-  import message_loop_wx as platform_message_loop
-elif is_objc:
-  import message_loop_objc as platform_message_loop
-elif is_curses:
-  import message_loop_curses as platform_message_loop
+# The toolkit's own message loop is imported on first use. Importing gtk
+# connects to the X server, which the prelaunch zygote must not do before it
+# forks.
+_platform_message_loop = None
+
+def _platform():
+  global _platform_message_loop
+  if not _platform_message_loop:
+    if is_gtk:
+      import message_loop_gtk as platform_message_loop
+    elif is_wx:
+      import message_loop_wx as platform_message_loop
+    elif is_objc:
+      import message_loop_objc as platform_message_loop
+    elif is_curses:
+      import message_loop_curses as platform_message_loop
+    _platform_message_loop = platform_message_loop
+  return _platform_message_loop
+
+def preload():
+  """
+  Imports as much of the toolkit as can be shared by processes forked
+  afterwards: everything short of connecting to the window system.
+  """
+  if is_gtk:
+    import glib
+    import gobject
+    import pango
+  elif is_wx:
+    _platform()
 
 
 def post_task(cb, *args):
-  platform_message_loop.post_task(cb, *args)
+  _platform().post_task(cb, *args)
 
 def post_delayed_task(cb, delay, *args):
-  platform_message_loop.post_delayed_task(cb, delay, *args)
+  _platform().post_delayed_task(cb, delay, *args)
+
+def add_readable_handler(fd, cb):
+  """
+  Calls cb(fd) from the main loop whenever fd is readable (or closed) until
+  remove_readable_handler(fd) is called. Only one handler per fd.
+  """
+  _platform().add_readable_handler(fd, cb)
+
+def remove_readable_handler(fd):
+  _platform().remove_readable_handler(fd)
 
 def is_main_loop_running():
-  return platform_message_loop.is_main_loop_running()
+  return _platform().is_main_loop_running()
 
 def init_main_loop():
-  platform_message_loop.init_main_loop()
+  _platform().init_main_loop()
 
 def run_main_loop():
   """
@@ -99,10 +131,10 @@ def run_main_loop():
   UI or that wants to do asynchronous tests, derive from UITestcase which will
   call this for you.
   """
-  platform_message_loop.run_main_loop()
+  _platform().run_main_loop()
 
 def add_quit_handler(cb):
-  platform_message_loop.add_quit_handler(cb)
+  _platform().add_quit_handler(cb)
 
 def quit_main_loop():
   """
@@ -110,10 +142,10 @@ def quit_main_loop():
   not quitting the loop and returning to the run_main_loop caller. This is how a
   sane operating system works. However, this code works on OSX.
   """
-  platform_message_loop.quit_main_loop()
+  _platform().quit_main_loop()
 
 def set_unittests_running(running):
-  platform_message_loop.set_unittests_running(running)
+  _platform().set_unittests_running(running)
 
 def set_active_test(test, result):
-  platform_message_loop.set_active_test(test, result)
+  _platform().set_active_test(test, result)
@@ -35,7 +35,7 @@ class DelayedTask(object):
     self.seq = _delayed_task_next_seq
 
     self.cb = cb
-    self.run_at_or_after = time.time() + (delay / 1000.0)
+    self.run_at_or_after = time.time() + delay
     _delayed_task_next_seq += 1
 
   def __cmp__(self, that):
@@ -51,6 +51,7 @@ _active_test_result = None
 _active_test = None
 _quit_handlers = []
 _quitting = False
+_readable_handlers = {} # fd -> cb
 
 _stdscr = None
 
@@ -107,6 +108,28 @@ def post_delayed_task(cb, delay, *args):
     cb(*args)
   _pending_delayed_tasks.append(DelayedTask(on_run, delay))
 
+def add_readable_handler(fd, cb):
+  assert fd not in _readable_handlers
+  _readable_handlers[fd] = cb
+
+def remove_readable_handler(fd):
+  if fd in _readable_handlers:
+    del _readable_handlers[fd]
+
+def _run_readable_handlers(fds):
+  for fd in fds:
+    if not _main_loop_running:
+      return
+    # an earlier handler may have removed this one
+    if fd not in _readable_handlers:
+      continue
+    try:
+      _readable_handlers[fd](fd)
+    except KeyboardInterrupt:
+      raise
+    except:
+      _on_exception()
+
 def add_quit_handler(cb):
   _quit_handlers.insert(0, cb)
 
@@ -151,7 +174,7 @@ def run_main_loop():
     _stdscr = stdscr
     while _main_loop_running:
       try:
-        r, w, e = select.select([sys.stdin], [], [], 0.1)
+        r, w, e = select.select([sys.stdin] + _readable_handlers.keys(), [], [], 0.1)
       except KeyboardInterrupt:
         raise
       except:
@@ -159,11 +182,13 @@ def run_main_loop():
 
       if not _main_loop_running:
         break
-      if r:
+      if sys.stdin in r:
+        r.remove(sys.stdin)
         if on_terminal_readable.has_listeners:
           on_terminal_readable.fire()
         else:
           print "unhandled character:", _stdscr.getch()
+      _run_readable_handlers(r)
       _run_pending_tasks()
   try:
     _main_loop_running = True
@@ -178,6 +203,7 @@ def run_main_loop():
     _quitting = False
     _main_loop_running = False
     del _pending_delayed_tasks[:]
+    _readable_handlers.clear()
     sys.stdout = _old_std[0]
     sys.stderr = _old_std[1]
     if DEBUG:
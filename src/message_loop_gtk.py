@@ -24,6 +24,7 @@ _active_test_result = None
 _active_test = None
 _quitting = False
 _quit_handlers = []
+_readable_handlers = {} # fd -> glib source id
 
 def init_main_loop():
   global _hooked
@@ -64,6 +65,22 @@ def post_delayed_task(cb, delay, *args):
   timeout_ms = int(delay * 1000)
   glib.timeout_add(timeout_ms, on_run)
 
+def add_readable_handler(fd, cb):
+  init_main_loop()
+  assert fd not in _readable_handlers
+  main_loop_instance_at_add = _current_main_loop_instance
+  def on_io(source, condition):
+    # handlers that were added when the mainloop exited should not run
+    if _current_main_loop_instance == main_loop_instance_at_add:
+      cb(fd)
+    return True
+  _readable_handlers[fd] = glib.io_add_watch(fd, glib.IO_IN | glib.IO_HUP | glib.IO_ERR, on_io)
+
+def remove_readable_handler(fd):
+  if fd in _readable_handlers:
+    glib.source_remove(_readable_handlers[fd])
+    del _readable_handlers[fd]
+
 def set_unittests_running(running):
   global _unittests_running
   _unittests_running = running
@@ -98,6 +115,8 @@ def run_main_loop():
   finally:
     _is_main_loop_running = False
     _current_main_loop_instance += 1
+    for fd in _readable_handlers.keys():
+      remove_readable_handler(fd)
 
   global _quitting
   _quitting = False
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import objc
+import select
 import sys
 import unittest
 from AppKit import *
@@ -22,6 +23,8 @@ _is_main_loop_running = False
 _current_main_loop_instance = 0
 _pending_tasks = [] # list of tasks added before the NSApplication runloop began
 _quit_handlers = []
+_readable_handlers = {} # fd -> cb
+_readable_handlers_polling = False
 _unittests_running = False
 _active_test_result = None
 _active_test = None
@@ -93,6 +96,34 @@ def post_delayed_task(cb, delay, *args):
   else:
     _pending_tasks.append(p)
 
+# Readable handlers are polled with a zero-timeout select; a CFSocket run loop
+# source would avoid that, but this is only used while a request is in flight.
+READABLE_POLL_INTERVAL = 0.01
+
+def _poll_readable_handlers():
+  global _readable_handlers_polling
+  if not len(_readable_handlers):
+    _readable_handlers_polling = False
+    return
+  r, w, x = select.select(_readable_handlers.keys(), [], [], 0)
+  for fd in r:
+    # an earlier handler may have removed this one
+    if fd in _readable_handlers:
+      _readable_handlers[fd](fd)
+  post_delayed_task(_poll_readable_handlers, READABLE_POLL_INTERVAL)
+
+def add_readable_handler(fd, cb):
+  global _readable_handlers_polling
+  assert fd not in _readable_handlers
+  _readable_handlers[fd] = cb
+  if not _readable_handlers_polling:
+    _readable_handlers_polling = True
+    post_task(_poll_readable_handlers)
+
+def remove_readable_handler(fd):
+  if fd in _readable_handlers:
+    del _readable_handlers[fd]
+
 def is_main_loop_running():
   return _is_main_loop_running
 
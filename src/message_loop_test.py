@@ -44,6 +44,18 @@ class MessageLoopTest(UITestCase):
       message_loop.quit_main_loop()
     message_loop.post_delayed_task(step2, 0.1)
 
+  def test_readable_handler(self):
+    r, w = os.pipe()
+    def on_readable(fd):
+      self.assertEquals(r, fd)
+      self.assertEquals('x', os.read(fd, 1))
+      message_loop.remove_readable_handler(fd)
+      os.close(r)
+      os.close(w)
+      message_loop.quit_main_loop()
+    message_loop.add_readable_handler(r, on_readable)
+    message_loop.post_task(lambda: os.write(w, 'x'))
+
   # UITestCaseTest tests that assertions failing will stop the test
 
 class MessageLoopTest2(unittest.TestCase):
@@ -11,6 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import select
 import wx
 import wx.webkit
 import sys
@@ -24,6 +25,8 @@ _wx_frame = None # keeps the message loop alive when there aren't any other fram
 
 _pending_tasks_timer = None
 _pending_tasks = []
+_readable_handlers_timer = None
+_readable_handlers = {} # fd -> cb
 _unittests_running = False
 _active_test_result = None
 _active_test = None
@@ -88,6 +91,35 @@ def post_delayed_task(cb, delay, *args):
   timer.Bind(wx.EVT_TIMER, on_run, timer)
   timer.Start(max(1,int(delay * 1000)), True)
 
+# wx has no portable way to watch a socket, so the readable handlers are
+# polled with a zero-timeout select on a short timer.
+READABLE_POLL_INTERVAL_MS = 10
+
+def _poll_readable_handlers(e):
+  if not len(_readable_handlers):
+    _readable_handlers_timer.Stop()
+    return
+  r, w, x = select.select(_readable_handlers.keys(), [], [], 0)
+  for fd in r:
+    # an earlier handler may have removed this one
+    if fd in _readable_handlers:
+      _readable_handlers[fd](fd)
+
+def add_readable_handler(fd, cb):
+  init_main_loop()
+  assert fd not in _readable_handlers
+  global _readable_handlers_timer
+  if not _readable_handlers_timer:
+    _readable_handlers_timer = wx.Timer(None, -1)
+    _readable_handlers_timer.Bind(wx.EVT_TIMER, _poll_readable_handlers, _readable_handlers_timer)
+  _readable_handlers[fd] = cb
+  if not _readable_handlers_timer.IsRunning():
+    _readable_handlers_timer.Start(READABLE_POLL_INTERVAL_MS)
+
+def remove_readable_handler(fd):
+  if fd in _readable_handlers:
+    del _readable_handlers[fd]
+
 def add_quit_handler(cb):
   _quit_handlers.insert(0, cb)
 
@@ -155,6 +187,12 @@ def quit_main_loop():
       _pending_tasks_timer.Destroy()
       _pending_tasks_timer = None
 
+    global _readable_handlers_timer
+    if _readable_handlers_timer:
+      _readable_handlers_timer.Destroy()
+      _readable_handlers_timer = None
+    _readable_handlers.clear()
+
     for cb in _quit_handlers:
       cb()
     del _quit_handlers[:]
@@ -0,0 +1,169 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import bisect
+
+# Metrics the daemon keeps in memory and serves on /metrics, in the
+# Prometheus text format. Everything runs on the daemon's thread, so none
+# of this locks.
+
+# The Content-Type of what Registry.render() returns.
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+# Upper bounds, in seconds, of the latency histograms' buckets.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _format_value(v):
+  if isinstance(v, float):
+    if v == float('inf'):
+      return '+Inf'
+    return repr(v)
+  return str(v)
+
+def _escape(v):
+  return str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+class _CounterChild(object):
+  def __init__(self, metric):
+    self.value = 0
+
+  def inc(self, amount = 1):
+    self.value += amount
+
+  def set(self, value):
+    self.value = value
+
+  def samples(self, name):
+    return [(name, (), self.value)]
+
+class _HistogramChild(object):
+  def __init__(self, metric):
+    self._buckets = metric.buckets
+    self.bucket_counts = [0] * len(self._buckets) # not cumulative
+    self.sum = 0.0
+    self.count = 0
+
+  def observe(self, value):
+    i = bisect.bisect_left(self._buckets, value)
+    if i < len(self._buckets):
+      self.bucket_counts[i] += 1
+    self.sum += value
+    self.count += 1
+
+  def samples(self, name):
+    res = []
+    n = 0
+    for le, c in zip(self._buckets, self.bucket_counts):
+      n += c
+      res.append((name + '_bucket', (('le', _format_value(float(le))),), n))
+    res.append((name + '_bucket', (('le', '+Inf'),), self.count))
+    res.append((name + '_sum', (), self.sum))
+    res.append((name + '_count', (), self.count))
+    return res
+
+class _Metric(object):
+  """
+  A metric, or a family of them when it has label_names. Call labels() with
+  a value for each label name to get the one to update.
+  """
+  def __init__(self, name, help, label_names):
+    self.name = name
+    self.help = help
+    self.label_names = tuple(label_names)
+    self._children = dict() # label values -> child
+
+  def labels(self, *values):
+    assert len(values) == len(self.label_names)
+    values = tuple([str(v) for v in values])
+    if values not in self._children:
+      self._children[values] = self.child_type(self)
+    return self._children[values]
+
+  def _unlabeled(self):
+    assert not len(self.label_names)
+    return self.labels()
+
+  def render(self, lines):
+    lines.append('# HELP %s %s' % (self.name, self.help.replace('\\', '\\\\').replace('\n', '\\n')))
+    lines.append('# TYPE %s %s' % (self.name, self.type))
+    for values in sorted(self._children.keys()):
+      labels = zip(self.label_names, values)
+      for name, extra_labels, value in self._children[values].samples(self.name):
+        all_labels = labels + list(extra_labels)
+        if len(all_labels):
+          name += '{%s}' % ','.join(['%s="%s"' % (k, _escape(v)) for k, v in all_labels])
+        lines.append('%s %s' % (name, _format_value(value)))
+
+class Counter(_Metric):
+  type = 'counter'
+  child_type = _CounterChild
+
+  def inc(self, amount = 1):
+    self._unlabeled().inc(amount)
+
+  @property
+  def value(self):
+    return self._unlabeled().value
+
+class Gauge(Counter):
+  type = 'gauge'
+
+  def set(self, value):
+    self._unlabeled().set(value)
+
+class Histogram(_Metric):
+  type = 'histogram'
+  child_type = _HistogramChild
+
+  def __init__(self, name, help, label_names, buckets):
+    _Metric.__init__(self, name, help, label_names)
+    self.buckets = tuple(sorted(buckets))
+
+  def observe(self, value):
+    self._unlabeled().observe(value)
+
+class Registry(object):
+  def __init__(self):
+    self._metrics = dict() # name -> metric
+
+  def _add(self, metric):
+    # Modules declare their metrics at import time, so asking for one twice
+    # gives back the first.
+    if metric.name in self._metrics:
+      existing = self._metrics[metric.name]
+      assert type(existing) == type(metric) and existing.label_names == metric.label_names
+      return existing
+    self._metrics[metric.name] = metric
+    return metric
+
+  def counter(self, name, help, label_names = ()):
+    return self._add(Counter(name, help, label_names))
+
+  def gauge(self, name, help, label_names = ()):
+    return self._add(Gauge(name, help, label_names))
+
+  def histogram(self, name, help, label_names = (), buckets = DEFAULT_BUCKETS):
+    return self._add(Histogram(name, help, label_names, buckets))
+
+  def render(self):
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for name in sorted(self._metrics.keys()):
+      self._metrics[name].render(lines)
+    return '\n'.join(lines) + '\n'
+
+# The daemon's metrics.
+registry = Registry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
@@ -0,0 +1,63 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import metrics
+import unittest
+
+class MetricsTest(unittest.TestCase):
+  def setUp(self):
+    self.registry = metrics.Registry()
+
+  def test_counter(self):
+    c = self.registry.counter('hits_total', 'Hits')
+    c.inc()
+    c.inc(2)
+    self.assertEquals(3, c.value)
+    self.assertEquals("# HELP hits_total Hits\n"
+                      "# TYPE hits_total counter\n"
+                      "hits_total 3\n", self.registry.render())
+
+  def test_labels(self):
+    c = self.registry.counter('cache_total', 'Cache lookups', ('result',))
+    c.labels('miss').inc()
+    c.labels('hit').inc()
+    c.labels('hit').inc()
+    self.assertEquals(2, c.labels('hit').value)
+    lines = self.registry.render().splitlines()
+    self.assertEquals(['cache_total{result="hit"} 2',
+                       'cache_total{result="miss"} 1'], lines[2:])
+
+  def test_label_escaping(self):
+    g = self.registry.gauge('g', 'A gauge', ('path',))
+    g.labels('a"b\\c').set(1.5)
+    self.assertTrue('g{path="a\\"b\\\\c"} 1.5' in self.registry.render().splitlines())
+
+  def test_histogram(self):
+    h = self.registry.histogram('latency_seconds', 'Latency', ('phase',), buckets = (0.1, 1))
+    h.labels('scan').observe(0.05)
+    h.labels('scan').observe(0.1)
+    h.labels('scan').observe(0.5)
+    h.labels('scan').observe(3)
+    lines = self.registry.render().splitlines()
+    self.assertEquals(['# TYPE latency_seconds histogram',
+                       'latency_seconds_bucket{phase="scan",le="0.1"} 2',
+                       'latency_seconds_bucket{phase="scan",le="1.0"} 3',
+                       'latency_seconds_bucket{phase="scan",le="+Inf"} 4',
+                       'latency_seconds_sum{phase="scan"} 3.65',
+                       'latency_seconds_count{phase="scan"} 4'], lines[1:])
+
+  def test_same_name_returns_same_metric(self):
+    a = self.registry.counter('c', 'C')
+    b = self.registry.counter('c', 'C')
+    self.assertTrue(a is b)
+    self.assertRaises(AssertionError, lambda: self.registry.gauge('c', 'C'))
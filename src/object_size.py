@@ -0,0 +1,46 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import collections
+import sys
+
+def deep_getsizeof(*objs):
+  """
+  Returns the number of bytes used by objs and everything reachable from them.
+  Objects shared between several containers are only counted once. Used by the
+  memory benchmarks; it is far too slow to call on a hot path.
+  """
+  seen = set()
+  total = 0
+  pending = list(objs)
+  while len(pending):
+    o = pending.pop()
+    if id(o) in seen:
+      continue
+    seen.add(id(o))
+    total += sys.getsizeof(o)
+
+    if isinstance(o, dict):
+      pending.extend(o.iterkeys())
+      pending.extend(o.itervalues())
+    elif isinstance(o, (list, tuple, set, frozenset, collections.deque)):
+      pending.extend(o)
+    elif isinstance(o, (basestring, int, long, float)):
+      pass
+    else:
+      if hasattr(o, '__dict__'):
+        pending.append(o.__dict__)
+      for slot in getattr(type(o), '__slots__', []):
+        if hasattr(o, slot):
+          pending.append(getattr(o, slot))
+  return total
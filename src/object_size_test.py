@@ -0,0 +1,41 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import array
+import sys
+import unittest
+
+from object_size import deep_getsizeof
+
+class _Slotted(object):
+  __slots__ = ['a', 'b']
+  def __init__(self, a, b):
+    self.a = a
+    self.b = b
+
+class ObjectSizeTest(unittest.TestCase):
+  def test_containers_include_contents(self):
+    s = "x" * 1000
+    self.assertTrue(deep_getsizeof([s]) > sys.getsizeof(s))
+    self.assertTrue(deep_getsizeof({"k": s}) > sys.getsizeof(s))
+
+  def test_shared_objects_counted_once(self):
+    s = "x" * 1000
+    self.assertEquals(deep_getsizeof([s]) + sys.getsizeof([s]), deep_getsizeof([s], [s]))
+    self.assertTrue(deep_getsizeof([s, s]) < 2 * sys.getsizeof(s))
+
+  def test_slots_and_arrays(self):
+    a = array.array('l', range(100))
+    self.assertEquals(sys.getsizeof(a), deep_getsizeof(a))
+    o = _Slotted(a, "y" * 100)
+    self.assertTrue(deep_getsizeof(o) > sys.getsizeof(a) + 100)
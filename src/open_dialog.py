@@ -11,10 +11,11 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import async_http_connection
 import db_proxy
-import json
 import logging
 import message_loop
+import query_log
 import re
 import os
 import sys
@@ -22,10 +23,25 @@ import time
 
 from trace_event import *
 
+# How long to wait before asking a daemon that isn't answering for its status again.
+STATUS_RETRY_INTERVAL = 1
+
+def first_changed_row(old_files, old_ranks, files, ranks):
+  """
+  Returns the index of the first row that differs between two result lists.
+  Rows before it can be left alone when the new results are shown.
+  """
+  n = min(len(old_files), len(files))
+  for i in xrange(n):
+    if old_files[i] != files[i] or old_ranks[i] != ranks[i]:
+      return i
+  return n
+
 class OpenDialogBase(object):
   def __init__(self, settings, options, db, initial_filter = None):
     settings.register("filter_text", str, "")
     settings.register("query_log", str, "") 
+    settings.register("search_timeout", float, 0.5) # seconds; <= 0 waits for complete results
     if initial_filter:
       settings.filter_text = initial_filter
     else:
@@ -36,84 +52,159 @@ class OpenDialogBase(object):
     self._can_process_queries = False
     self._last_search_query = None
     self._pending_search = None
+    self._pending_search_start = None
+    self._last_search_partial = False
+    self._shown_results = ([], [])
+    self._db_status = None # the last DBStatus from the daemon, or None if it isn't running
+    self._status_wait = None
     self._options = options
+    if settings.query_log != "":
+      self._query_log = query_log.QueryLog(os.path.expanduser(settings.query_log))
+    else:
+      self._query_log = None
     if initial_filter:
       self.should_position_cursor_for_replace = False
     else:
       self.should_position_cursor_for_replace = True
 
-    message_loop.post_delayed_task(self.on_tick, 0.1)
+    message_loop.post_task(self._wait_for_status)
     
   def set_can_process_queries(self, can_process):
     could_process = self._can_process_queries
     self._can_process_queries = can_process
 
     self.set_results_enabled(can_process)
+    if can_process and not could_process:
+      self._search_if_needed()
 
   @trace
   def set_filter_text(self, text):
     self._filter_text = text
-    if self._settings.query_log != "":
-      try:
-        f = open(os.path.expanduser(self._settings.query_log), 'a')
-        f.write(json.dumps({"ts": time.time(), "query": text}))
-        f.write("\n");
-        f.close()
-      except IOError:
-        import traceback; traceback.print_exc()
-        pass
+    self._search_if_needed()
 
   def on_reindex_clicked(self):
     self._db.begin_reindex()
 
-  def on_tick(self,*args):
-    def begin_search():
-      self.set_status("DB Status: %s" % "searching")
-      self._last_search_query = self._filter_text
-      self._pending_search = self._db.search_async(self._last_search_query)
-
-    def on_ready():
-      try:
-        res = self._pending_search.result
-      except db_proxy.AsyncSearchError:
-        res = None
-      self._pending_search = None
+  def _search_if_needed(self):
+    if self._filter_text == self._last_search_query or not self._can_process_queries:
+      return
+    if self._pending_search:
+      self._cancel_pending_search() # its results would be stale anyway
+    self.set_status("DB Status: %s" % "searching")
+    self._last_search_query = self._filter_text
+    self._pending_search_start = time.time()
+    timeout = self._settings.search_timeout
+    if timeout <= 0:
+      timeout = None
+    try:
+      self._pending_search = self._db.search_stream_async(self._last_search_query, timeout)
+    except async_http_connection.AsyncError:
+      self._on_status(None)
+      return
+    message_loop.add_readable_handler(self._pending_search.fileno(), self._on_search_readable)
+
+  def _cancel_pending_search(self):
+    search = self._pending_search
+    self._pending_search = None
+    message_loop.remove_readable_handler(search.fileno())
+    if self._query_log:
+      start = self._pending_search_start
+      self._query_log.log(self._last_search_query, latency = time.time() - start, canceled = True, start = start)
+    try:
+      cancel = self._db.cancel_search_async(search)
+    except async_http_connection.AsyncError:
+      return
+    def on_cancel_readable(fd):
+      message_loop.remove_readable_handler(fd)
+      cancel.close()
+    message_loop.add_readable_handler(cancel.fileno(), on_cancel_readable)
+
+  def _on_search_readable(self, fd):
+    search = self._pending_search
+    try:
+      results = search.read_results()
+    except db_proxy.AsyncSearchError:
+      results = None
+    if results:
+      # show the best hits while the rest are found
+      res = results[-1]
+      self._show_results(res.hits,res.ranks)
+    if results != None and not search.done:
+      return
+
+    message_loop.remove_readable_handler(fd)
+    self._pending_search = None
+    try:
+      res = search.result # the search is over, so this doesn't block
+    except db_proxy.AsyncSearchError:
+      res = None
+    search.close()
+    if res:
+      self._last_search_partial = res.partial
+    else:
+      self._show_results([],[])
+    if self._query_log:
+      start = self._pending_search_start
       if res:
-        self.update_results_list(res.hits,res.ranks)
+        self._query_log.log(self._last_search_query, len(res.hits), time.time() - start, res.partial, start = start)
       else:
-        self.update_results_list([],[])
-      self._pending_search = None
-
-    def check_status():
-      try:
-        stat = self._db.status()
-        status = stat.status
-        enabled = stat.has_index
-      except Exception, ex:
-        status = "quickopend not running"
-        enabled = False
-      self.set_status("DB Status: %s" % status)
-      self.set_can_process_queries(enabled)
-
-    if self._pending_search:
-      self.set_status("DB Status: %s" % "searching")
-      if self._pending_search.ready:
-        on_ready()
+        self._query_log.log(self._last_search_query, latency = time.time() - start, start = start)
+    self._show_status()
+
+    # the text may have changed while we waited
+    self._search_if_needed()
+
+  def _show_results(self, files, ranks):
+    # a search's early and complete results are often the same
+    if (files, ranks) == self._shown_results:
+      return
+    self._shown_results = (files, ranks)
+    self.update_results_list(files, ranks)
+
+  def _wait_for_status(self):
+    """Subscribes to the daemon's status; see _on_status_readable."""
+    try:
+      self._status_wait = self._db.wait_for_status_change_async(self._db_status)
+    except async_http_connection.AsyncError:
+      self._on_status(None)
+      message_loop.post_delayed_task(self._wait_for_status, STATUS_RETRY_INTERVAL)
+      return
+    message_loop.add_readable_handler(self._status_wait.fileno(), self._on_status_readable)
+
+  def _on_status_readable(self, fd):
+    message_loop.remove_readable_handler(fd)
+    wait = self._status_wait
+    self._status_wait = None
+    try:
+      stat = wait.result
+    except db_proxy.AsyncSearchError:
+      stat = None
+    wait.close()
+    self._on_status(stat)
+    if stat:
+      self._wait_for_status()
+    else:
+      message_loop.post_delayed_task(self._wait_for_status, STATUS_RETRY_INTERVAL)
 
-    # re-check the self._pending_search since we might have cleared it
+  def _on_status(self, stat):
+    self._db_status = stat
     if not self._pending_search:
-      # kick off a query
-      if self._filter_text != self._last_search_query and self._can_process_queries:
-        begin_search()
-      else:
-        # poll status
-        check_status()
+      self._show_status()
+    self.set_can_process_queries(stat != None and stat.has_index)
 
-    # renew the tick
-    message_loop.post_delayed_task(self.on_tick, 0.1)
+  def _show_status(self):
+    if self._db_status:
+      status = self._db_status.status
+    else:
+      status = "quickopend not running"
+    if self._last_search_partial:
+      status = "%s; search timed out, results are incomplete" % status
+    self.set_status("DB Status: %s" % status)
 
   def on_done(self, canceled):
     self._settings.filter_text = self._filter_text.encode('utf8')
+    if self._query_log:
+      self._query_log.close()
     if canceled:
       res = []
     else:
@@ -135,6 +226,13 @@ class OpenDialogBase(object):
     if self._options.results_file:
       ofile.close()
 
+    # what gets opened ranks higher next time
+    for path in res:
+      try:
+        self._db.record_open(path)
+      except IOError:
+        break # quickopend is gone; the results are out already
+
     message_loop.quit_main_loop() # end of the line, no further output will happen
 
 def _pick_open_dialog():
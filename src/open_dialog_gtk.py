@@ -13,13 +13,94 @@
 # limitations under the License.
 import glib
 import gtk
-import time
 import logging
 import os
 
 from info_bar_gtk import *
 
-from open_dialog import OpenDialogBase
+from open_dialog import OpenDialogBase, first_changed_row
+
+class ResultsModelGtk(gtk.GenericTreeModel):
+  """
+  A list model over the current results. Rows are never copied into the
+  model; the tree view asks for the ones it is drawing. Each row's value is
+  a (file, rank) tuple.
+  """
+  # Past this many changed rows, which is more than a screenful, a new model
+  # is cheaper than a signal per row: the tree view does work for each.
+  MAX_ROW_SIGNALS = 100
+
+  def __init__(self, files = None, ranks = None):
+    gtk.GenericTreeModel.__init__(self)
+    self.files = files or []
+    self.ranks = ranks or []
+
+  def set_results(self, files, ranks):
+    """
+    Shows files and ranks, signalling the rows that changed. If more than
+    MAX_ROW_SIGNALS would change, it changes nothing and returns False; a new
+    model should then replace this one.
+    """
+    first = first_changed_row(self.files, self.ranks, files, ranks)
+    old_len = len(self.files)
+    if max(old_len, len(files)) - first > self.MAX_ROW_SIGNALS:
+      return False
+    self.files = files
+    self.ranks = ranks
+    for i in range(old_len - 1, len(files) - 1, -1):
+      self.row_deleted((i,))
+    for i in range(first, min(old_len, len(files))):
+      self.row_changed((i,), self.get_iter((i,)))
+    for i in range(old_len, len(files)):
+      self.row_inserted((i,), self.get_iter((i,)))
+    return True
+
+  # rows are referred to by their index
+  def on_get_flags(self):
+    return gtk.TREE_MODEL_LIST_ONLY | gtk.TREE_MODEL_ITERS_PERSIST
+
+  def on_get_n_columns(self):
+    return 1
+
+  def on_get_column_type(self, n):
+    return object
+
+  def on_get_iter(self, path):
+    if path[0] < len(self.files):
+      return path[0]
+    return None
+
+  def on_get_path(self, rowref):
+    return (rowref,)
+
+  def on_get_value(self, rowref, column):
+    return (self.files[rowref], self.ranks[rowref])
+
+  def on_iter_next(self, rowref):
+    if rowref + 1 < len(self.files):
+      return rowref + 1
+    return None
+
+  def on_iter_children(self, parent):
+    if parent == None and len(self.files):
+      return 0
+    return None
+
+  def on_iter_has_child(self, rowref):
+    return False
+
+  def on_iter_n_children(self, rowref):
+    if rowref == None:
+      return len(self.files)
+    return 0
+
+  def on_iter_nth_child(self, parent, n):
+    if parent == None and n < len(self.files):
+      return n
+    return None
+
+  def on_iter_parent(self, child):
+    return None
 
 class OpenDialogGtk(gtk.Dialog, OpenDialogBase):
   def __init__(self, settings, options, db, initial_filter):
@@ -31,23 +112,28 @@ class OpenDialogGtk(gtk.Dialog, OpenDialogBase):
     self.add_button("_Open",gtk.RESPONSE_OK)
     self.add_button("Cancel",gtk.RESPONSE_CANCEL)
 
-    model = gtk.ListStore(object)
+    model = ResultsModelGtk()
 
     treeview = gtk.TreeView(model)
+    # with every row the same height, only the visible rows are ever measured
+    treeview.set_fixed_height_mode(True)
     treeview.get_selection().set_mode(gtk.SELECTION_MULTIPLE)
     treeview.get_selection().connect('changed', self._on_treeview_selection_changed)
     self.connect('response', self.response)
 
     text_cell_renderer = gtk.CellRendererText()
 
-    def add_column(title,accessor_cb):
+    def add_column(title,accessor_cb,width):
       column = gtk.TreeViewColumn(title, text_cell_renderer)
       column.set_cell_data_func(text_cell_renderer, lambda column, cell, model, iter: cell.set_property('text', accessor_cb(model.get(iter,0)[0])))
+      column.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+      column.set_fixed_width(width)
+      column.set_resizable(True)
       treeview.append_column(column)
       return column
-    add_column("Rank",lambda obj: obj[1])
-    add_column("File",lambda obj: os.path.basename(obj[0]))
-    add_column("Path",lambda obj: os.path.dirname(obj[0]))
+    add_column("Rank",lambda obj: obj[1],50)
+    add_column("File",lambda obj: os.path.basename(obj[0]),250)
+    add_column("Path",lambda obj: os.path.dirname(obj[0]),650).set_expand(True)
 
     self.connect('destroy', self.on_destroy)
 
@@ -132,22 +218,11 @@ class OpenDialogGtk(gtk.Dialog, OpenDialogBase):
 
   # update the model based on result
   def update_results_list(self, files, ranks):
-    if len(files) == 0:
-      self._model.clear()
-      return
-
-    start_time = time.time()
-    self._treeview.freeze_child_notify()
-    self._treeview.set_model(None)
-
-    self._model.clear()
-
-    for i in range(len(files)):
-      row = self._model.append()
-      self._model.set(row, 0, (files[i], ranks[i]))
-
-    self._treeview.set_model(self._model)
-    self._treeview.thaw_child_notify()
+    if not self._model.set_results(files, ranks):
+      # in fixed height mode, the tree view only measures the visible rows
+      # of the new model
+      self._model = ResultsModelGtk(files, ranks)
+      self._treeview.set_model(self._model)
 
     truncated = False
     if truncated:
@@ -156,10 +231,9 @@ class OpenDialogGtk(gtk.Dialog, OpenDialogBase):
     else:
       self._truncated_bar.hide()
 
-    elapsed = time.time() - start_time
-
-    if len(self._model) > 0:
+    if len(files) > 0:
       if self._treeview.get_selection():
+        self._treeview.get_selection().unselect_all()
         self._treeview.get_selection().select_path((0,))
 
   def _on_treeview_selection_changed(self, selection):
@@ -18,6 +18,7 @@ import settings
 import tempfile
 import temporary_daemon
 import ui_test_case
+import unittest
 
 # Special indicator to TestRunner to only let us run when
 # run_unit_tests is passed -m from the commandline.
@@ -47,3 +48,12 @@ class OpenDialogTest(ui_test_case.UITestCase):
 
   def test_open_dialog(self):
     x = open_dialog.OpenDialog(self.client_settings, self.options, self.db, "")
+
+class FirstChangedRowTest(unittest.TestCase):
+  def test_first_changed_row(self):
+    f = open_dialog.first_changed_row
+    self.assertEquals(2, f(["a", "b"], [1, 1], ["a", "b"], [1, 1]))
+    self.assertEquals(1, f(["a", "b"], [1, 1], ["a", "c"], [1, 1]))
+    self.assertEquals(0, f(["a", "b"], [1, 1], ["a", "b"], [2, 1]))
+    self.assertEquals(1, f(["a"], [1], ["a", "b"], [1, 1]))
+    self.assertEquals(0, f([], [], ["a"], [1]))
@@ -17,15 +17,36 @@ import os
 import wx
 import wx.lib.mixins.listctrl  as  listmix
 import wx.lib.evtmgr as evtmgr
-import sys
 
-from open_dialog import OpenDialogBase
+from open_dialog import OpenDialogBase, first_changed_row
 
-class TestListCtrl(wx.ListCtrl, listmix.ListCtrlAutoWidthMixin):
+class ResultsListCtrl(wx.ListCtrl, listmix.ListCtrlAutoWidthMixin):
+    """
+    A virtual list of the current results: wx asks for the text of the rows
+    it is drawing, so no row is built until it scrolls into view.
+    """
     def __init__(self, parent, ID, pos=wx.DefaultPosition,
                  size=wx.DefaultSize, style=0):
-        wx.ListCtrl.__init__(self, parent, ID, pos, size, style)
+        wx.ListCtrl.__init__(self, parent, ID, pos, size, style | wx.LC_VIRTUAL)
         listmix.ListCtrlAutoWidthMixin.__init__(self)
+        self.files = []
+        self.ranks = []
+
+    def set_results(self, files, ranks):
+        first = first_changed_row(self.files, self.ranks, files, ranks)
+        self.files = files
+        self.ranks = ranks
+        self.SetItemCount(len(files))
+        if first < len(files):
+            self.RefreshItems(first, len(files) - 1)
+
+    def OnGetItemText(self, item, col):
+        if col == 0:
+            return str(self.ranks[item])
+        elif col == 1:
+            return os.path.basename(self.files[item])
+        else:
+            return os.path.dirname(self.files[item])
 
 class OpenDialogWx(wx.Dialog, OpenDialogBase):
   def __init__(self, settings, options, db, initial_filter):
@@ -48,8 +69,12 @@ class OpenDialogWx(wx.Dialog, OpenDialogBase):
     top_box.Add(reindex_bn)
 
     middle_box = wx.BoxSizer(wx.HORIZONTAL)
-    self._results_list = TestListCtrl(self, -1,
-                                      style=wx.LC_REPORT | wx.BORDER_NONE)
+    self._results_list = ResultsListCtrl(self, -1,
+                                         style=wx.LC_REPORT | wx.BORDER_NONE)
+    self._results_list.InsertColumn(0, "Rank")
+    self._results_list.InsertColumn(1, "File")
+    self._results_list.InsertColumn(2, "Path")
+    self._cur_results = []
 
     middle_box.Add(self._results_list, 1, wx.ALIGN_CENTRE|wx.ALL|wx.EXPAND)
 
@@ -103,7 +128,7 @@ class OpenDialogWx(wx.Dialog, OpenDialogBase):
   def set_results_enabled(self,en):
     self._results_list.Enable(en)
     if not en:
-      self._results_list.ClearAll()
+      self._show_results([], [])
     okbn = self.FindWindowById(wx.ID_OK)
     okbn.Enable(en)
 
@@ -127,18 +152,9 @@ class OpenDialogWx(wx.Dialog, OpenDialogBase):
 
   def update_results_list(self, files, ranks):
     self._cur_results = files
-    self._results_list.ClearAll()
-    self._results_list.InsertColumn(0, "Rank")
-    self._results_list.InsertColumn(1, "File")
-    self._results_list.InsertColumn(2, "Path")
-    for i in range(len(files)):
-      f = files[i]
-      r = ranks[i]
-      base = os.path.basename(f)
-      path = os.path.dirname(f)
-      i = self._results_list.InsertStringItem(sys.maxint, str(r))
-      self._results_list.SetStringItem(i, 1, base)
-      self._results_list.SetStringItem(i, 2, path)
+    for i in self.get_selected_indices():
+      self._results_list.SetItemState(i, 0, wx.LIST_STATE_SELECTED)
+    self._results_list.set_results(files, ranks)
 
     if len(files):
       self._results_list.SetItemState(0, wx.LIST_STATE_SELECTED, wx.LIST_STATE_SELECTED)
@@ -0,0 +1,100 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import array
+import os
+
+# Node keys pack (parent + 1, component id) into a single int, which is far
+# smaller than a tuple key. Both halves must stay below 2**31.
+_KEY_SHIFT = 31
+
+class PathTable(object):
+  """
+  Interns paths as a tree of (parent, component) nodes. Paths that share a
+  prefix share the nodes for that prefix, and every distinct path component is
+  stored exactly once. A path is referred to by its integer node id and is only
+  turned back into a string when path() is called.
+
+  Pass an existing table to share its interned components with the new one.
+  """
+  def __init__(self, components_from = None):
+    if components_from:
+      self._component_ids = components_from._component_ids
+      self.components = components_from.components
+    else:
+      self._component_ids = dict()
+      self.components = [] # component id -> component string
+    self._parents = array.array('l') # node id -> parent node id, -1 for a top-level component
+    self._node_components = array.array('l') # node id -> component id
+    self._children = dict() # packed (parent, component id) -> node id
+
+  def __len__(self):
+    return len(self._parents)
+
+  def intern_component(self, c):
+    if c in self._component_ids:
+      return self._component_ids[c]
+    cid = len(self.components)
+    self.components.append(c)
+    self._component_ids[c] = cid
+    return cid
+
+  def component(self, cid):
+    return self.components[cid]
+
+  def intern_child(self, parent, c):
+    cid = self.intern_component(c)
+    key = ((parent + 1) << _KEY_SHIFT) | cid
+    if key in self._children:
+      return self._children[key]
+    n = len(self._parents)
+    self._parents.append(parent)
+    self._node_components.append(cid)
+    self._children[key] = n
+    return n
+
+  def intern(self, path):
+    n = -1
+    for c in path.split(os.path.sep):
+      n = self.intern_child(n, c)
+    return n
+
+  def lookup(self, path):
+    """Returns the node id for path, or -1 if it was never interned."""
+    n = -1
+    for c in path.split(os.path.sep):
+      if c not in self._component_ids:
+        return -1
+      key = ((n + 1) << _KEY_SHIFT) | self._component_ids[c]
+      if key not in self._children:
+        return -1
+      n = self._children[key]
+    return n
+
+  def parent(self, n):
+    return self._parents[n]
+
+  def component_of(self, n):
+    """Returns the component id of the last component of node n."""
+    return self._node_components[n]
+
+  def basename(self, n):
+    return self.components[self._node_components[n]]
+
+  def path(self, n):
+    parts = []
+    while n != -1:
+      parts.append(self.components[self._node_components[n]])
+      n = self._parents[n]
+    parts.reverse()
+    return os.path.sep.join(parts)
@@ -0,0 +1,55 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import unittest
+
+from path_table import PathTable
+
+class PathTableTest(unittest.TestCase):
+  def test_roundtrip(self):
+    t = PathTable()
+    for p in ['/a/b/c', '/a/b', 'a/b', '~/chrome/src', '/', '', '/tmp/db_test/', 'x//y']:
+      self.assertEquals(p, t.path(t.intern(p)))
+
+  def test_shared_prefix(self):
+    t = PathTable()
+    c = t.intern('/a/b/c')
+    n = len(t)
+    d = t.intern('/a/b/d')
+    self.assertEquals(n + 1, len(t))
+    self.assertEquals(t.parent(c), t.parent(d))
+    self.assertEquals('/a/b', t.path(t.parent(c)))
+    self.assertEquals('d', t.basename(d))
+
+  def test_intern_is_stable(self):
+    t = PathTable()
+    self.assertEquals(t.intern('/a/b'), t.intern('/a/b'))
+    self.assertNotEquals(t.intern('/a/b'), t.intern('/a/c'))
+
+  def test_lookup(self):
+    t = PathTable()
+    n = t.intern('/a/b/c')
+    self.assertEquals(n, t.lookup('/a/b/c'))
+    self.assertEquals(t.parent(n), t.lookup('/a/b'))
+    self.assertEquals(t.intern_component('c'), t.component_of(n))
+    self.assertEquals(-1, t.lookup('/a/b/x'))
+    self.assertEquals(-1, t.lookup('/x'))
+
+  def test_shared_components(self):
+    t = PathTable()
+    t.intern('/a/b')
+    t2 = PathTable(t)
+    self.assertEquals(0, len(t2))
+    self.assertEquals(t.intern_component('b'), t2.intern_component('b'))
+    self.assertEquals('/a/b', t2.path(t2.intern('/a/b')))
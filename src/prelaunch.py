@@ -23,6 +23,7 @@
 # the daemon for prelaunched instance handle and then delegates its actual
 # commandline to that instance (via magic).
 import os
+import signal
 import socket
 import sys
 import httplib
@@ -34,7 +35,7 @@ _is_prelaunched_process = False
 def is_prelaunch(args):
   if len(args) >= 2 and args[1] == "prelaunch":
     if len(args) >= 3:
-      return args[2] != "--wait"
+      return args[2] != "--wait" and args[2] != "--zygote"
     else:
       return True
   return False
@@ -53,6 +54,7 @@ def wait_for_command(control_port):
       try:
         s.bind(("", control_port))
         bound = True
+        break
       except socket.error:
         time.sleep(0.1)
     if not bound:
@@ -100,6 +102,86 @@ def wait_for_command(control_port):
     s.close()
     sys.exit(0)
 
+# How often the zygote checks whether the prelaunchd that started it is gone.
+ZYGOTE_PARENT_CHECK_INTERVAL = 5
+
+# How long to wait for a zygote to fork before giving up on it.
+ZYGOTE_FORK_TIMEOUT = 1
+
+def run_zygote(control_port, start_child):
+  """
+  Runs a prelaunch zygote: a process that has already imported and loaded
+  everything it can share, and forks a new prelaunched instance whenever it
+  is asked. The children share the zygote's memory copy-on-write.
+
+  Each request to control_port is a line "fork <port>". The zygote answers
+  with the child's pid, and the child calls start_child(port), which should
+  wait for a command on port. The zygote exits along with its parent.
+  """
+  parent = os.getppid()
+  # children are never waited on, so don't let them become zombies
+  signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+  s = socket.socket()
+  s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  s.bind(("localhost", control_port))
+  s.listen(5)
+  s.settimeout(ZYGOTE_PARENT_CHECK_INTERVAL)
+  while os.getppid() == parent:
+    try:
+      c, a = s.accept()
+    except socket.timeout:
+      continue
+    c.settimeout(None)
+    f = c.makefile()
+    try:
+      req = f.readline().split()
+      if len(req) != 2 or req[0] != "fork":
+        continue
+      port = int(req[1])
+      pid = os.fork()
+      if pid == 0:
+        s.close()
+        f.close()
+        c.close()
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        try:
+          start_child(port)
+        finally:
+          sys.stdout.flush()
+          sys.stderr.flush()
+          os._exit(0)
+      f.write("%i\n" % pid)
+    except (ValueError, socket.error):
+      pass
+    finally:
+      f.close()
+      c.close()
+  s.close()
+
+def fork_from_zygote(zygote_port, control_port):
+  """
+  Asks the zygote on zygote_port for an instance that waits for its command
+  on control_port. Returns the new instance's pid, or None if the zygote
+  isn't listening.
+  """
+  s = socket.socket()
+  s.settimeout(ZYGOTE_FORK_TIMEOUT)
+  try:
+    s.connect(("localhost", zygote_port))
+    f = s.makefile()
+    f.write("fork %i\n" % control_port)
+    f.flush()
+    pid = f.readline()
+    f.close()
+  except socket.error:
+    return None
+  finally:
+    s.close()
+  if pid == "":
+    return None
+  return int(pid)
+
 def run_command_in_existing(daemon_host, daemon_port, args):
   # Prelaunched processes are DISPLAY-specific
   if sys.platform == 'darwin':
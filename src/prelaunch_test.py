@@ -12,8 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import prelaunch
+import multiprocessing
 import os
+import socket
 import temporary_daemon
+import time
 import unittest
 from quickopen_test_base import QuickopenTestBase
 
@@ -27,6 +30,7 @@ class PrelaunchTest(unittest.TestCase, QuickopenTestBase):
     self.assertEquals(False, prelaunch.is_prelaunch([""]))
     self.assertEquals(False, prelaunch.is_prelaunch(["", "search", "--wait"]))
     self.assertEquals(False, prelaunch.is_prelaunch(["", "prelaunch", "--wait"]))
+    self.assertEquals(False, prelaunch.is_prelaunch(["", "prelaunch", "--zygote"]))
     self.assertEquals(True, prelaunch.is_prelaunch(["", "prelaunch"]))
     self.assertEquals(True, prelaunch.is_prelaunch(["", "prelaunch", "search"]))
 
@@ -42,3 +46,45 @@ class PrelaunchTest(unittest.TestCase, QuickopenTestBase):
     unittest.TestCase.tearDown(self)
     QuickopenTestBase.tearDown(self)
     self.daemon.close()
+
+ZYGOTE_TEST_PORT = 12347
+
+def _echo_pid_on(port):
+  # stands in for waiting on a command: answers one connection with our pid
+  s = socket.socket()
+  s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  s.bind(("localhost", port))
+  s.listen(1)
+  c, a = s.accept()
+  c.sendall("%i\n" % os.getpid())
+  c.close()
+  s.close()
+
+def _connect(port):
+  for i in range(50):
+    try:
+      return socket.create_connection(("localhost", port))
+    except socket.error:
+      time.sleep(0.05)
+  raise Exception("Nothing listening on %i" % port)
+
+class ZygoteTest(unittest.TestCase):
+  def setUp(self):
+    self.zygote = multiprocessing.Process(target=prelaunch.run_zygote, args=(ZYGOTE_TEST_PORT, _echo_pid_on))
+    self.zygote.start()
+    _connect(ZYGOTE_TEST_PORT).close() # not a fork request, so it is ignored
+
+  def tearDown(self):
+    self.zygote.terminate()
+    self.zygote.join()
+
+  def test_fork(self):
+    for port in (ZYGOTE_TEST_PORT + 1, ZYGOTE_TEST_PORT + 2):
+      pid = prelaunch.fork_from_zygote(ZYGOTE_TEST_PORT, port)
+      self.assertNotEquals(None, pid)
+      self.assertNotEquals(self.zygote.pid, pid)
+      self.assertEquals("%i\n" % pid, _connect(port).makefile().readline())
+
+  def test_no_zygote(self):
+    self.assertEquals(None, prelaunch.fork_from_zygote(ZYGOTE_TEST_PORT + 3, ZYGOTE_TEST_PORT + 4))
+
@@ -17,6 +17,8 @@
 # background, and service "give me a prelauncher" requests from quickopend
 # clients.
 import os
+import prelaunch
+import signal
 import subprocess
 import logging
 
@@ -47,14 +49,52 @@ class PrelaunchedProcess(object):
   def kill(self):
     self.proc.kill()
 
+class ForkedProcess(object):
+  """A prelaunched instance forked by a zygote. It isn't our child, so it is tracked by pid."""
+  def __init__(self, pid, port):
+    self.pid = pid
+    self.port = port
+
+  def poll(self):
+    try:
+      os.kill(self.pid, 0)
+    except OSError:
+      return 0
+    return None
+
+  def kill(self):
+    try:
+      os.kill(self.pid, signal.SIGKILL)
+    except OSError:
+      pass
+
 class PrelaunchDaemon(object):
-  def __init__(self, server):
+  """
+  Keeps a pool of warmed-up quickopen instances for each display. Taking one
+  costs nothing; its replacement is launched once it exits, so that starting
+  the replacement doesn't compete with the instance the user is looking at.
+  A pool that runs dry is topped up right away.
+
+  Where it can, each display also gets a zygote, which has done the
+  imports every instance needs and forks new instances on request. That is
+  far cheaper than starting another interpreter.
+  """
+  def __init__(self, settings, server):
+    settings.register('prelaunch_pool_size', int, 2)
+    settings.register('prelaunch_zygote', bool, True)
+    self._settings = settings
+    self._server = server
     server.add_json_route('/existing_quickopen/(.+)', self.get_existing_quickopen, ['GET'])
+    server.add_json_route('/prelaunch/stats', self.get_stats, ['GET'])
     server.exit.add_listener(self._on_exit)
-    server.lo_idle.add_listener(self._join_in_use_processes)
-    self._quickopen = {}
-    self._in_use_processes = []
+    server.lo_idle.add_listener(self._on_lo_idle)
+    self._quickopen = {} # display -> list of ready PrelaunchedProcesses, oldest first
+    self._in_use_processes = [] # (display, PrelaunchedProcess)
+    self._zygotes = {} # display -> PrelaunchedProcess
     self._next_control_port = 27412
+    self._hits = 0
+    self._misses = 0
+    self._forked = 0 # instances that came from a zygote
 
   def _get_another_control_port(self):
     self._next_control_port += 1
@@ -65,59 +105,134 @@ class PrelaunchDaemon(object):
       return self._next_control_port
     raise Exception("Could not find open control port")
 
-  def _launch_new_quickopen(self, display):
-    assert display not in self._quickopen
+  def _spawn_quickopen(self, display, args):
     quickopen_script = os.path.join(os.path.dirname(__file__), "../quickopen")
     assert os.path.exists(quickopen_script)
 
-    control_port = self._get_another_control_port()
     env = {}
     if display != 'cocoa' and display != 'terminal':
       env["DISPLAY"] = display
-    proc = subprocess.Popen([quickopen_script,
-                             "prelaunch",
-                             "--wait",
-                             "--control-port",
-                             str(control_port)],
-                             env=env)
-    self._quickopen[display] = PrelaunchedProcess(proc, control_port)
+    # the instance connects to us while it waits, so tell it where we are
+    host, port = self._server.server_address
+    full_args = [quickopen_script]
+    full_args.extend(args)
+    full_args.extend(["--host", host or "localhost", "--port", str(port)])
+    return subprocess.Popen(full_args, env=env)
+
+  def _launch_new_quickopen(self, display):
+    control_port = self._get_another_control_port()
+    if self._uses_zygote(display):
+      proc = self._fork_from_zygote(display, control_port)
+      if proc:
+        return proc
+    proc = self._spawn_quickopen(display, ["prelaunch",
+                                           "--wait",
+                                           "--control-port",
+                                           str(control_port)])
+    return PrelaunchedProcess(proc, control_port)
+
+  def _uses_zygote(self, display):
+    # Cocoa can't be used in a process forked from one that loaded it, and
+    # the curses UI isn't prelaunched at all.
+    return self._settings.prelaunch_zygote and display != 'cocoa' and display != 'terminal'
+
+  def _fork_from_zygote(self, display, control_port):
+    """Returns a ForkedProcess, or None if the display's zygote isn't ready."""
+    zygote = self._zygotes.get(display)
+    if not zygote or zygote.poll() != None:
+      zygote_port = self._get_another_control_port()
+      proc = self._spawn_quickopen(display, ["prelaunch",
+                                             "--zygote",
+                                             "--control-port",
+                                             str(zygote_port)])
+      self._zygotes[display] = PrelaunchedProcess(proc, zygote_port)
+      return None # it takes as long to come up as any other instance
+    pid = prelaunch.fork_from_zygote(zygote.port, control_port)
+    if pid == None:
+      return None
+    self._forked += 1
+    return ForkedProcess(pid, control_port)
+
+  def _ready_processes(self, display):
+    if display not in self._quickopen:
+      self._quickopen[display] = []
+    pool = self._quickopen[display]
+    # drop any that died while waiting
+    pool[:] = [p for p in pool if p.poll() == None]
+    return pool
+
+  def _fill_pool(self, display, n):
+    pool = self._ready_processes(display)
+    while len(pool) < n:
+      pool.append(self._launch_new_quickopen(display))
 
   def get_existing_quickopen(self, m, verb, data):
     display = m.group(1)
-    if display not in self._quickopen:
-      self._launch_new_quickopen(display)
-    try:
-      proc = self._quickopen[display]
-      del self._quickopen[display]
-
-      self._in_use_processes.append(proc)
-      return proc.port
-    finally:
-      # todo, move this to another place... ideally, when the previous prelaunch quits
-      self._launch_new_quickopen(display)
-      pass
+    pool = self._ready_processes(display)
+    if len(pool):
+      self._hits += 1
+      proc = pool.pop(0)
+    else:
+      self._misses += 1
+      proc = self._launch_new_quickopen(display)
+    self._in_use_processes.append((display, proc))
+    return proc.port
+
+  def get_stats(self, m, verb, data):
+    requests = self._hits + self._misses
+    if requests:
+      hit_rate = float(self._hits) / requests
+    else:
+      hit_rate = None
+    ready = {}
+    for display in self._quickopen:
+      ready[display] = len(self._ready_processes(display))
+    return {"pool_size": self._settings.prelaunch_pool_size,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": hit_rate,
+            "ready": ready,
+            "in_use": len(self._in_use_processes),
+            "forked": self._forked}
 
   def _on_exit(self):
     self.stop()
 
+  def _on_lo_idle(self):
+    n = self._settings.prelaunch_pool_size
+    for display in self._join_in_use_processes():
+      self._fill_pool(display, n)
+    for display in self._quickopen.keys():
+      if not len(self._ready_processes(display)):
+        self._fill_pool(display, n)
+
   def _join_in_use_processes(self):
+    """Forgets the in-use processes that have exited. Returns their displays."""
     procs = list(self._in_use_processes)
     del self._in_use_processes[:]
-    for p in procs:
-      if not p.poll():
-        self._in_use_processes.append(p)
+    exited = []
+    for display, p in procs:
+      if p.poll() == None:
+        self._in_use_processes.append((display, p))
       else:
         logging.debug("prelaunched pid=%i is gone" % p.pid)
+        exited.append(display)
+    return exited
 
   def stop(self):
     logging.debug("closing prelaunched quickopen")
-    for proc in self._quickopen.values():
-      proc.kill()
+    for zygote in self._zygotes.values():
+      if zygote.poll() == None:
+        zygote.kill()
+    self._zygotes = {}
+    for pool in self._quickopen.values():
+      for proc in pool:
+        proc.kill()
     self._quickopen = {}
 
     self._join_in_use_processes()
-    for p in self._in_use_processes:
-      if not p.poll():
+    for display, p in self._in_use_processes:
+      if p.poll() == None:
         logging.debug("killing %i" % p.pid)
         try:
           p.kill()
@@ -0,0 +1,116 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import prelaunchd
+import re
+import settings
+import tempfile
+import unittest
+
+from event import Event
+
+class FakeServer(object):
+  def __init__(self):
+    self.server_address = ('localhost', 12345)
+    self.routes = []
+    self.exit = Event()
+    self.lo_idle = Event()
+
+  def add_json_route(self, path_regex, handler, allowed_verbs):
+    self.routes.append((path_regex, handler))
+
+  def get(self, path):
+    for path_regex, handler in self.routes:
+      m = re.match(path_regex, path)
+      if m:
+        return handler(m, 'GET', None)
+    raise Exception("No route for %s" % path)
+
+class FakeProcess(object):
+  def __init__(self, port):
+    self.port = port
+    self.pid = port
+    self.exited = False
+
+  def poll(self):
+    if self.exited:
+      return 0
+    return None
+
+  def kill(self):
+    self.exited = True
+
+class FakePrelaunchDaemon(prelaunchd.PrelaunchDaemon):
+  def __init__(self, *args):
+    prelaunchd.PrelaunchDaemon.__init__(self, *args)
+    self.launched = []
+
+  def _launch_new_quickopen(self, display):
+    p = FakeProcess(len(self.launched))
+    self.launched.append(p)
+    return p
+
+class PrelaunchDaemonTest(unittest.TestCase):
+  def setUp(self):
+    self.settings_file = tempfile.NamedTemporaryFile()
+    self.settings = settings.Settings(self.settings_file.name)
+    self.server = FakeServer()
+    self.prelaunchd = FakePrelaunchDaemon(self.settings, self.server)
+
+  def tearDown(self):
+    self.server.exit.fire()
+    self.settings_file.close()
+
+  def test_pool(self):
+    d = self.prelaunchd
+    # the first request for a display finds nothing ready
+    self.assertEquals(0, self.server.get('/existing_quickopen/:0'))
+    self.server.lo_idle.fire()
+    self.assertEquals(3, len(d.launched))
+
+    # the next two are already warm, and the pool isn't refilled while
+    # they are in use...
+    self.assertEquals(1, self.server.get('/existing_quickopen/:0'))
+    self.assertEquals(2, self.server.get('/existing_quickopen/:0'))
+    self.assertEquals(3, len(d.launched))
+
+    # ...unless it runs dry
+    self.server.lo_idle.fire()
+    self.assertEquals(5, len(d.launched))
+
+    # processes that exit are replaced, up to the pool size
+    d.launched[0].exited = True
+    d.launched[1].exited = True
+    self.server.lo_idle.fire()
+    self.assertEquals(5, len(d.launched))
+
+    stats = self.server.get('/prelaunch/stats')
+    self.assertEquals(2, stats["hits"])
+    self.assertEquals(1, stats["misses"])
+    self.assertEquals({":0": 2}, stats["ready"])
+    self.assertEquals(1, stats["in_use"])
+
+  def test_dead_ready_process_is_skipped(self):
+    d = self.prelaunchd
+    self.server.get('/existing_quickopen/:0')
+    self.server.lo_idle.fire()
+    d.launched[1].exited = True
+    self.assertEquals(2, self.server.get('/existing_quickopen/:0'))
+
+  def test_stop_kills_everything(self):
+    d = self.prelaunchd
+    self.server.get('/existing_quickopen/:0')
+    self.server.lo_idle.fire()
+    self.server.exit.fire()
+    for p in d.launched:
+      self.assertTrue(p.exited)
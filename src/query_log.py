@@ -0,0 +1,160 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+# The writer wakes up this often, or sooner once FLUSH_BATCH records are waiting.
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH = 64
+
+# Records that haven't been written yet. When the writer falls this far
+# behind, the oldest are dropped instead of making the caller wait.
+BUFFER_SIZE = 4096
+
+# Once the log is this big it is moved to <log>.1, <log>.1 to <log>.2 and so
+# on, keeping this many old logs.
+MAX_BYTES = 4 * 1024 * 1024
+BACKUPS = 2
+
+class QueryLog(object):
+  """
+  Appends one line of JSON per search to a file, for tuning and for replaying
+  as a benchmark. Records are kept in memory and written in batches by a
+  background thread, so log() never touches the disk.
+
+  A record has the time the search started, "t", and the query, "q". When
+  known, it also has the number of hits, "n", and the milliseconds until the
+  complete results arrived, "ms". "p" marks partial results, "c" a search
+  that was canceled because the query changed.
+  """
+  def __init__(self, path, max_bytes = MAX_BYTES, backups = BACKUPS, buffer_size = BUFFER_SIZE):
+    self.path = path
+    self.max_bytes = max_bytes
+    self.backups = backups
+    self.dropped = 0 # records lost because the writer fell behind
+    self._records = collections.deque(maxlen = buffer_size)
+    self._logged = 0
+    self._written = 0
+    self._closing = False
+    self._flush_requested = False
+    self._cond = threading.Condition()
+    self._thread = threading.Thread(target = self._run, name = "QueryLog")
+    self._thread.daemon = True
+    self._thread.start()
+
+  def log(self, query, hits = None, latency = None, partial = False, canceled = False, start = None):
+    """
+    Queues a record. latency is in seconds. start is the time.time() the
+    search started, when the key was pressed; it defaults to now.
+    """
+    if start is None:
+      start = time.time()
+    record = {"t": round(start, 3), "q": query}
+    if hits is not None:
+      record["n"] = hits
+    if latency is not None:
+      record["ms"] = int(round(latency * 1000))
+    if partial:
+      record["p"] = 1
+    if canceled:
+      record["c"] = 1
+    self.log_record(record)
+
+  def log_record(self, record):
+    """Queues a record built by the caller. It needs at least "t" and "q"."""
+    self._cond.acquire()
+    try:
+      if len(self._records) == self._records.maxlen:
+        self.dropped += 1
+        self._written += 1 # the writer will never see it
+      self._records.append(record)
+      self._logged += 1
+      if len(self._records) >= FLUSH_BATCH:
+        self._cond.notify_all()
+    finally:
+      self._cond.release()
+
+  def flush(self):
+    """Waits until everything logged so far is written."""
+    self._cond.acquire()
+    try:
+      target = self._logged
+      self._flush_requested = True
+      self._cond.notify_all()
+      while self._written < target and self._thread.is_alive():
+        self._cond.wait(FLUSH_INTERVAL)
+    finally:
+      self._cond.release()
+
+  def close(self):
+    """Writes what is left and stops the writer."""
+    self._cond.acquire()
+    try:
+      self._closing = True
+      self._cond.notify_all()
+    finally:
+      self._cond.release()
+    self._thread.join()
+
+  def _run(self):
+    while True:
+      self._cond.acquire()
+      try:
+        if not self._closing and not self._flush_requested and len(self._records) < FLUSH_BATCH:
+          self._cond.wait(FLUSH_INTERVAL)
+        records = list(self._records)
+        self._records.clear()
+        self._flush_requested = False
+        closing = self._closing
+      finally:
+        self._cond.release()
+
+      if len(records):
+        self._write(records)
+      self._cond.acquire()
+      try:
+        self._written += len(records)
+        self._cond.notify_all()
+      finally:
+        self._cond.release()
+      if closing:
+        return
+
+  def _write(self, records):
+    lines = [json.dumps(r, separators = (',', ':')) + "\n" for r in records]
+    try:
+      f = open(self.path, 'a')
+      try:
+        f.write("".join(lines))
+        size = f.tell()
+      finally:
+        f.close()
+      if size >= self.max_bytes:
+        self._rotate()
+    except (IOError, OSError):
+      logging.exception("Could not write the query log %s", self.path)
+
+  def _rotate(self):
+    for i in range(self.backups - 1, 0, -1):
+      older = "%s.%i" % (self.path, i)
+      if os.path.exists(older):
+        os.rename(older, "%s.%i" % (self.path, i + 1))
+    if self.backups > 0:
+      os.rename(self.path, "%s.1" % self.path)
+    else:
+      os.remove(self.path)
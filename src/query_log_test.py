@@ -0,0 +1,76 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import query_log
+import shutil
+import tempfile
+import time
+import unittest
+
+class QueryLogTest(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, 'queries')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _records(self, path):
+    return [json.loads(l) for l in open(path).readlines()]
+
+  def test_log(self):
+    log = query_log.QueryLog(self.path)
+    log.log('foo', 3, 0.0123)
+    log.log('foob', canceled = True)
+    log.log('fooba', 0, 0.5, partial = True)
+    log.flush()
+    records = self._records(self.path)
+    self.assertEquals(3, len(records))
+    self.assertEquals('foo', records[0]["q"])
+    self.assertEquals(3, records[0]["n"])
+    self.assertEquals(12, records[0]["ms"])
+    self.assertTrue("n" not in records[1])
+    self.assertEquals(1, records[1]["c"])
+    self.assertEquals(1, records[2]["p"])
+    log.close()
+
+  def test_time_is_search_start(self):
+    log = query_log.QueryLog(self.path)
+    start = time.time() - 2
+    log.log('foo', 3, 2.0, start = start)
+    log.log('bar')
+    log.close()
+    records = self._records(self.path)
+    self.assertEquals(round(start, 3), records[0]["t"])
+    self.assertTrue(records[1]["t"] - records[0]["t"] >= 1.9)
+
+  def test_close_writes_everything(self):
+    log = query_log.QueryLog(self.path)
+    for i in range(100):
+      log.log('q%i' % i)
+    log.close()
+    self.assertEquals(100, len(self._records(self.path)))
+
+  def test_rotate(self):
+    log = query_log.QueryLog(self.path, max_bytes = 100, backups = 2)
+    for i in range(3):
+      for j in range(10):
+        log.log('batch%i' % i)
+      log.flush()
+    log.close()
+    self.assertFalse(os.path.exists(self.path))
+    self.assertEquals('batch2', self._records(self.path + '.1')[0]["q"])
+    self.assertEquals('batch1', self._records(self.path + '.2')[0]["q"])
+    self.assertFalse(os.path.exists(self.path + '.3'))
@@ -13,15 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import logging
-import message_loop
 import optparse
 import os
-import platform
 import prelaunch
 import re
 import sys
-
-from db import DBException
+import time
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../third_party/py_trace_event/"))
 try:
@@ -37,6 +34,7 @@ import src.db_proxy
 
 def CMDadd(parser):
   """Adds a directory to the index"""
+  from db import DBException
   (options, args) = parser.parse_args()
   settings = load_settings(options)
   db = open_db(options)
@@ -132,6 +130,14 @@ def CMDunignore(parser):
 
 def CMDsearch(parser):
   """Search for a file"""
+  # Only the dialog needs a UI toolkit, so only it pays for finding one.
+  import message_loop
+  if not message_loop.has_toolkit:
+    supports = ['PyGtk', 'WxPython', 'Curses']
+    if '--objc' in sys.argv:
+      supports.append('PyObjC')
+    print "No supported GUI toolkit found. Quickopen supports %s." % ", ".join(supports)
+    return 255
   if prelaunch.is_prelaunched_process() and message_loop.is_curses:
     print "Prelaunching not available for curses UI."
     return 255
@@ -154,13 +160,33 @@ def CMDsearch(parser):
 
 def CMDstatus(parser):
   """Checks the status of the quick open database"""
+  parser.add_option('--shards', dest='shards', action='store_true', help='Also show how each search shard has done')
   (options, args) = parser.parse_args()
   settings = load_settings(options)
   db = open_db(options)
   try:
-    print db.status().status
+    status = db.status()
   except IOError:
     print "quickopend not running."
+    return
+  print status.status
+  if options.shards and len(status.shards):
+    print_shard_stats(status.shards,
+                      ["basenames", "searches", "late", "mean_ms", "max_ms", "scanned", "hits"])
+
+def print_shard_stats(shards, columns):
+  """Prints a table of per shard stats, one dict per shard, with the given columns."""
+  print "%6s" % "shard" + "".join(["%11s" % c for c in columns])
+  for s in shards:
+    line = "%6i" % s["shard"]
+    for c in columns:
+      if c not in s:
+        line += "%11s" % "-"
+      elif isinstance(s[c], float):
+        line += "%11.1f" % s[c]
+      else:
+        line += "%11s" % s[c]
+    print line
 
 def CMDreindex(parser):
   """Begins to reindex the quickopen database"""
@@ -173,9 +199,57 @@ def CMDreindex(parser):
   except IOError:
     print "quickopend not running."
 
+def CMDslowqueries(parser):
+  """Prints the recent searches that took slow_query_ms or more"""
+  (options, args) = parser.parse_args()
+  settings = load_settings(options)
+  db = open_db(options)
+  try:
+    entries = db.slow_queries()
+  except IOError:
+    print "quickopend not running."
+    return 255
+  print "%8s %6s %11s  %s" % ("ms", "hits", "stage", "query")
+  for e in entries:
+    flags = ""
+    if e.get("p"):
+      flags += " (partial)"
+    if e.get("cached"):
+      flags += " (cached)"
+    print "%8i %6i %11s  %s%s" % (e["ms"], e["n"], e.get("stage", "-"), e["q"], flags)
+
+def CMDprofile(parser):
+  """Samples quickopend's stacks for a while, then prints them for flamegraph.pl"""
+  parser.add_option('--seconds', dest='seconds', action='store', type='float', default=10, help='How long to profile for, 10 seconds by default; Ctrl-C stops early')
+  parser.add_option('--interval', dest='interval', action='store', type='float', default=None, help='Seconds of CPU time between samples')
+  parser.add_option('--output', '-o', dest='output', action='store', help='Write the stacks to this file instead of stdout')
+  (options, args) = parser.parse_args()
+  settings = load_settings(options)
+  db = open_db(options)
+  try:
+    db.start_profiler(options.interval)
+  except IOError:
+    print "quickopend not running."
+    return 255
+  sys.stderr.write("Profiling quickopend for %g seconds...\n" % options.seconds)
+  try:
+    time.sleep(options.seconds)
+  except KeyboardInterrupt:
+    pass
+  db.stop_profiler()
+  stacks = db.profiler_stacks()
+  if options.output:
+    f = open(options.output, 'w')
+    f.write(stacks)
+    f.close()
+  else:
+    sys.stdout.write(stacks)
+
 def CMDrawsearch(parser):
   """Prints the raw database's results for <query>"""
   parser.add_option('--show-rank', '-r', dest='show_rank', action='store_true', help='Show the ranking of results')
+  parser.add_option('--timeout', dest='timeout', action='store', type='float', default=None, help='Give up after this many seconds and print the results found so far')
+  parser.add_option('--debug', dest='debug', action='store_true', help='Show how each search shard did ahead of the results')
   (options, args) = parser.parse_args()
 
   settings = load_settings(options)
@@ -185,7 +259,17 @@ def CMDrawsearch(parser):
   if not db.has_index:
     print "Database is not fully indexed. Wait a bit or try quickopen status"
     return 255
-  res = db.search(args[0])
+  res = db.search(args[0], options.timeout, options.debug)
+  if res.partial:
+    sys.stderr.write("Search timed out; results are incomplete.\n")
+  if options.debug and res.debug:
+    if res.debug.get("cached"):
+      print "Answered from the query cache."
+    else:
+      print_shard_stats(res.debug["shards"], ["basenames", "late", "ms", "scanned", "hits"])
+      if "skew" in res.debug:
+        print "slowest shard: %i, %.2fx the mean" % (res.debug["slowest"], res.debug["skew"])
+    print
   if options.show_rank:
     combined = [(res.ranks[i],res.hits[i]) for i in range(len(res.hits))]
     print "\n".join(["%i,%s" % c for c in combined])
@@ -196,6 +280,26 @@ def CMDrawsearch(parser):
     return 0
   return 255
 
+def CMDlookup(parser):
+  """Prints the files named exactly <name>"""
+  parser.add_option('--path', dest='kind', action='store_const', const='path', default='basename', help='Look up <name> as a path, absolute or relative to an indexed directory')
+  parser.add_option('--suffix', dest='kind', action='store_const', const='suffix', help='Print the files whose path ends with <name>')
+  (options, args) = parser.parse_args()
+
+  settings = load_settings(options)
+  db = open_db(options)
+  if len(args) != 1:
+    parser.error('Expected: <name>')
+  if not db.has_index:
+    print "Database is not fully indexed. Wait a bit or try quickopen status"
+    return 255
+  hits = getattr(db, 'lookup_' + options.kind)(args[0])
+  print "\n".join(hits)
+
+  if len(hits) > 0:
+    return 0
+  return 255
+
 def CMDprelaunch(parser):
   """Performs a quickopen command in a prelaunched instance. Reduces delay in seeing the initial search dialog."""
   args = sys.argv[1:]
@@ -203,10 +307,23 @@ def CMDprelaunch(parser):
     parser.add_option("--wait", action="store_true", dest="wait")
     parser.add_option("--control-port", action="store", dest="control_port")
     (options, args) = parser.parse_args()
-    settings = load_settings(options)
     assert options.wait
+    warm_up(options)
     options.control_port = int(options.control_port)
     prelaunch.wait_for_command(options.control_port)
+  elif "--zygote" in args:
+    parser.add_option("--zygote", action="store_true", dest="zygote")
+    parser.add_option("--control-port", action="store", dest="control_port")
+    (options, args) = parser.parse_args()
+    assert options.zygote
+    # the UI can only be loaded after forking; see message_loop.preload
+    warm_up(options, False)
+    import message_loop
+    message_loop.preload()
+    def start_child(port):
+      warm_up_ui()
+      prelaunch.wait_for_command(port)
+    prelaunch.run_zygote(int(options.control_port), start_child)
   else:
     # split up args into stuff before the prelaunch command and stuff after
     before_args = []
@@ -226,12 +343,29 @@ def CMDprelaunch(parser):
     settings = load_settings(options)
     sys.stdout.write(prelaunch.run_command_in_existing(options.host, options.port, after_args))
 
+# A prelaunched instance loads its settings and connects to quickopend while
+# it waits for a command. The command picks these up instead of starting over.
+_warm_settings = {} # settings file -> (Settings, file's mtime when loaded)
+_warm_dbs = {} # (host, port) -> DBProxy
+
+def _mtime(path):
+  try:
+    return os.stat(path).st_mtime
+  except OSError:
+    return None
+
 def load_settings(options):
   settings_file = os.path.expanduser(options.settings)
-  settings = src.settings.Settings(settings_file)
-  settings.register('host', str, 'localhost')
-  settings.register('port', int, -1)
-  settings.register('trace', bool, False)
+  settings = None
+  if settings_file in _warm_settings:
+    settings, mtime = _warm_settings.pop(settings_file)
+    if mtime != _mtime(settings_file):
+      settings = None # another quickopen saved them since
+  if not settings:
+    settings = src.settings.Settings(settings_file)
+    settings.register('host', str, 'localhost')
+    settings.register('port', int, -1)
+    settings.register('trace', bool, False)
 
   if settings.port == -1:
     # Open the quickopend settings file to get the default
@@ -250,8 +384,36 @@ def load_settings(options):
   return settings
 
 def open_db(options):
+  key = (options.host, options.port)
+  if key in _warm_dbs:
+    return _warm_dbs.pop(key)
   return src.db_proxy.DBProxy(options.host, options.port, start_if_needed=False, port_for_autostart=options.port)
 
+def warm_up(options, ui = True):
+  """
+  Does the work every command starts with ahead of time, for a prelaunched
+  instance that is waiting for its command. Pass ui=False to leave loading
+  the UI toolkit to warm_up_ui.
+  """
+  settings_file = os.path.expanduser(options.settings)
+  settings = load_settings(options)
+  _warm_settings[settings_file] = (settings, _mtime(settings_file))
+
+  db = open_db(options)
+  try:
+    db.status()
+  except IOError:
+    pass # quickopend may still be coming up; the command will find out
+  _warm_dbs[(options.host, options.port)] = db
+
+  if ui:
+    warm_up_ui()
+
+def warm_up_ui():
+  import message_loop
+  if not message_loop.is_curses:
+    import src.open_dialog # the slow part: imports the UI toolkit
+
 # Subcommand addins to optparse, taken from git-cl.py, 
 # http://src.chromium.org/svn/trunk/tools/depot_tools/git_cl.py
 ###########################################################################
@@ -125,6 +125,30 @@ class QuickopenTestBase(object):
     r = self.qo("rawsearch", "MySubSystem.c").split("\n")
     self.assertEquals([self.test_data.path_to("project1/MySubSystem.c"), ''], r)
 
+  def test_lookup(self):
+    x = self.qo("add",
+                self.test_data_dir)
+    self.assertEquals("", x)
+    self._wait_for_up_to_date()
+
+    path = self.test_data.path_to("project1/MySubSystem.c")
+    self.assertEquals([path], self.qo_and_split("lookup", "MySubSystem.c"))
+    self.assertEquals([path], self.qo_and_split("lookup", "--path", "project1/MySubSystem.c"))
+    self.assertEquals([path], self.qo_and_split("lookup", "--suffix", "project1/MySubSystem.c"))
+    self.assertEquals([], self.qo_and_split("lookup", "MySubSystem"))
+
+  def test_rawsearch_debug(self):
+    x = self.qo("add",
+                self.test_data_dir)
+    self.assertEquals("", x)
+    self._wait_for_up_to_date()
+
+    lines = self.qo_and_split("rawsearch", "--debug", "MySubSystem.c")
+    self.assertTrue(lines[0].split()[0] == "shard")
+    self.assertTrue(self.test_data.path_to("project1/MySubSystem.c") in lines)
+    lines = self.qo_and_split("rawsearch", "--debug", "MySubSystem.c")
+    self.assertEquals("Answered from the query cache.", lines[0])
+
   def test_rawsearch_with_rank(self):
     x = self.qo("add",
                 self.test_data_dir)
@@ -67,7 +67,7 @@ def CMDrun(parser, args):
   try:
     daemon = src.daemon.create(settings.host, settings.port, options.test)
     db_stub = src.db_stub.DBStub(settings, daemon)
-    prelaunchd = src.prelaunchd.PrelaunchDaemon(daemon)
+    prelaunchdaemon = src.prelaunchd.PrelaunchDaemon(settings, daemon)
     daemon.run()
   finally:
     if prelaunchdaemon:
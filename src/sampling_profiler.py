@@ -0,0 +1,97 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import signal
+
+# Seconds of CPU time between samples.
+DEFAULT_INTERVAL = 0.005
+
+# Deepest stack kept for a sample; deeper ones lose their outermost frames.
+MAX_DEPTH = 64
+
+# Distinct stacks kept. Samples of any others are counted under OVERFLOW_STACK.
+MAX_STACKS = 10000
+OVERFLOW_STACK = '[other stacks]'
+
+def is_supported():
+  return hasattr(signal, 'setitimer')
+
+class SamplingProfiler(object):
+  """
+  Samples the main thread's stack every interval seconds of CPU time, using
+  SIGPROF, and counts how often each stack comes up. This is cheap enough to
+  leave running on a daemon that is in use, unlike tracing every call.
+
+  Only one profiler can run in a process, and only the main thread can start
+  or stop it. While it runs, slow system calls can fail with EINTR where
+  the OS won't restart them, select in particular.
+  """
+  def __init__(self, root = None):
+    self.root = root # name for the bottom of every stack, such as the process's
+    self.stacks = dict() # collapsed stack -> samples
+    self.samples = 0
+    self.interval = None
+
+  @property
+  def running(self):
+    return self.interval is not None
+
+  def start(self, interval = DEFAULT_INTERVAL):
+    """Starts sampling, discarding the samples of any earlier run."""
+    assert is_supported()
+    self.stop()
+    self.stacks = dict()
+    self.samples = 0
+    self.interval = interval
+    signal.signal(signal.SIGPROF, self._sample)
+    signal.siginterrupt(signal.SIGPROF, False)
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+
+  def stop(self):
+    if not self.running:
+      return
+    signal.setitimer(signal.ITIMER_PROF, 0, 0)
+    # SIGPROF kills the process by default, so one already on its way would too
+    signal.signal(signal.SIGPROF, signal.SIG_IGN)
+    self.interval = None
+
+  def _sample(self, signum, frame):
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+      code = frame.f_code
+      names.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+      frame = frame.f_back
+    if self.root:
+      names.append(self.root)
+    names.reverse()
+    stack = ';'.join(names)
+    if stack not in self.stacks and len(self.stacks) >= MAX_STACKS:
+      stack = OVERFLOW_STACK
+    self.stacks[stack] = self.stacks.get(stack, 0) + 1
+    self.samples += 1
+
+def merge_stacks(*stacks):
+  """Adds up several collapsed stack -> samples dicts."""
+  res = dict()
+  for s in stacks:
+    for stack, n in s.items():
+      res[stack] = res.get(stack, 0) + n
+  return res
+
+def collapsed(stacks):
+  """
+  Returns collapsed stack -> samples as text in the format flamegraph.pl
+  reads: a line per stack, its frames joined by ';', then its samples.
+  """
+  return ''.join(['%s %i\n' % (stack, n) for stack, n in sorted(stacks.items())])
@@ -0,0 +1,75 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import sampling_profiler
+import signal
+import sys
+import time
+import unittest
+
+def _busy(seconds):
+  start = time.clock()
+  x = 0
+  while time.clock() - start < seconds:
+    x += 1
+  return x
+
+class SamplingProfilerTest(unittest.TestCase):
+  def setUp(self):
+    self.profiler = sampling_profiler.SamplingProfiler('test')
+
+  def tearDown(self):
+    self.profiler.stop()
+
+  def test_samples_busy_function(self):
+    self.profiler.start(0.001)
+    self.assertTrue(self.profiler.running)
+    _busy(0.2)
+    self.profiler.stop()
+    self.assertFalse(self.profiler.running)
+    self.assertTrue(self.profiler.samples > 0)
+    self.assertEquals(self.profiler.samples, sum(self.profiler.stacks.values()))
+    busy = [s for s in self.profiler.stacks if s.endswith('sampling_profiler_test.py:_busy')]
+    self.assertTrue(len(busy) > 0)
+    self.assertTrue(busy[0].startswith('test;'))
+    self.assertTrue('sampling_profiler_test.py:test_samples_busy_function;' in busy[0])
+
+  def test_stop_stops_sampling(self):
+    self.profiler.start(0.001)
+    _busy(0.05)
+    self.profiler.stop()
+    samples = self.profiler.samples
+    _busy(0.05)
+    self.assertEquals(samples, self.profiler.samples)
+
+  def test_start_discards_earlier_samples(self):
+    self.profiler._sample(signal.SIGPROF, sys._getframe())
+    self.profiler.start(10)
+    self.assertEquals(0, self.profiler.samples)
+    self.assertEquals({}, self.profiler.stacks)
+
+  def test_max_stacks(self):
+    old = sampling_profiler.MAX_STACKS
+    sampling_profiler.MAX_STACKS = 1
+    try:
+      self.profiler._sample(signal.SIGPROF, sys._getframe())
+      self.profiler._sample(signal.SIGPROF, sys._getframe().f_back)
+    finally:
+      sampling_profiler.MAX_STACKS = old
+    self.assertEquals(2, len(self.profiler.stacks))
+    self.assertEquals(1, self.profiler.stacks[sampling_profiler.OVERFLOW_STACK])
+
+  def test_collapsed(self):
+    stacks = sampling_profiler.merge_stacks({"a;b": 2, "a": 1}, {"a;b": 3})
+    self.assertEquals("a 1\na;b 5\n", sampling_profiler.collapsed(stacks))
+    self.assertEquals("", sampling_profiler.collapsed({}))
@@ -0,0 +1,63 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import collections
+import query_log
+import time
+
+class SlowQueryLog(object):
+  """
+  Keeps the last max_entries searches that took threshold seconds or more,
+  along with what the index reported about them. With a path, each entry is
+  also appended to that file as a query log record, so the replay benchmark
+  can rerun the slow searches.
+
+  An entry is a query log record ("t", "q", "n", "ms" and "p") plus the
+  generation of the index that answered it. Unless the search was answered
+  from the query cache, it also has the shards' stats and the slowest shard,
+  and stage, the matching stage that took longest: wordstart, substring or
+  superfuzzy. See DBIndex._search_debug.
+  """
+  def __init__(self, threshold, max_entries, path = None):
+    self.threshold = threshold # seconds; negative turns the log off
+    self.entries = collections.deque(maxlen = max_entries)
+    self.count = 0 # slow searches seen, including those no longer kept
+    if path:
+      self._log = query_log.QueryLog(path)
+    else:
+      self._log = None
+
+  def record(self, query, seconds, res, generation):
+    """Keeps the search if it was slow. res is its DBIndexSearchResult."""
+    if self.threshold < 0 or seconds < self.threshold:
+      return False
+    entry = {"t": round(time.time(), 3),
+             "q": query,
+             "n": len(res.hits),
+             "ms": int(round(seconds * 1000)),
+             "generation": generation}
+    if res.partial:
+      entry["p"] = 1
+    if res.debug:
+      for k in ("cached", "shards", "slowest", "skew", "stage", "stage_ms"):
+        if k in res.debug:
+          entry[k] = res.debug[k]
+    self.entries.append(entry)
+    self.count += 1
+    if self._log:
+      self._log.log_record(entry)
+    return True
+
+  def close(self):
+    if self._log:
+      self._log.close()
@@ -0,0 +1,73 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import benchmark
+import os
+import shutil
+import slow_query_log
+import tempfile
+import unittest
+
+from db_types import DBIndexSearchResult
+
+def _result(hits, partial = False, debug = None):
+  res = DBIndexSearchResult()
+  res.hits = hits
+  res.ranks = [1] * len(hits)
+  res.partial = partial
+  res.debug = debug
+  return res
+
+class SlowQueryLogTest(unittest.TestCase):
+  def test_threshold(self):
+    log = slow_query_log.SlowQueryLog(0.1, 10)
+    self.assertFalse(log.record('fast', 0.05, _result([]), 1))
+    self.assertTrue(log.record('slow', 0.2, _result(['a', 'b'], partial = True), 3))
+    self.assertEquals(1, len(log.entries))
+    e = log.entries[0]
+    self.assertEquals('slow', e["q"])
+    self.assertEquals(200, e["ms"])
+    self.assertEquals(2, e["n"])
+    self.assertEquals(1, e["p"])
+    self.assertEquals(3, e["generation"])
+    log.threshold = -1
+    self.assertFalse(log.record('slower', 10, _result([]), 3))
+
+  def test_debug(self):
+    log = slow_query_log.SlowQueryLog(0, 10)
+    shards = [{"shard": 0, "late": False, "ms": 5.0, "stage_ms": {"substring": 4.0}}]
+    log.record('q', 0.01, _result([], debug = {"shards": shards, "slowest": 0, "stage": "substring", "stage_ms": {"substring": 4.0}}), 1)
+    e = log.entries[0]
+    self.assertEquals(shards, e["shards"])
+    self.assertEquals("substring", e["stage"])
+    self.assertFalse("cached" in e)
+    log.record('q', 0.01, _result([], debug = {"cached": True}), 1)
+    self.assertTrue(log.entries[1]["cached"])
+
+  def test_bounded(self):
+    log = slow_query_log.SlowQueryLog(0, 2)
+    for q in ['a', 'b', 'c']:
+      log.record(q, 1, _result([]), 1)
+    self.assertEquals(['b', 'c'], [e["q"] for e in log.entries])
+    self.assertEquals(3, log.count)
+
+  def test_persisted_as_query_log(self):
+    test_dir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(test_dir, 'slow')
+      log = slow_query_log.SlowQueryLog(0, 2, path)
+      log.record('abc', 1, _result(['x']), 1)
+      log.close()
+      self.assertEquals(['abc'], [q for t, q in benchmark.read_query_log(path)])
+    finally:
+      shutil.rmtree(test_dir)
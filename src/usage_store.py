@@ -0,0 +1,133 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import math
+import os
+import time
+
+# Opening a file counts 1. Counts halve every USAGE_HALF_LIFE seconds, so a
+# file opened a lot last month ranks below one opened a few times today.
+USAGE_HALF_LIFE = 7 * 24 * 3600.
+
+# How long boosts are reused before the decay is applied again.
+BOOST_REFRESH_INTERVAL = 3600
+
+# Rank bonus per doubling of a count, and the most a count can add. Ranker
+# gives 1-3 per matched letter, so a few opens are worth a letter or two of
+# typing without burying better matches.
+FILE_BOOST = 1.5
+MAX_FILE_BOOST = 4.5
+DIR_BOOST = 0.5
+MAX_DIR_BOOST = 1.5
+
+class UsageStore(object):
+  """
+  Remembers which files were opened from search results, as counts that
+  decay over time. The counts live in the 'usage' setting, one
+  [path, count, time of last open] entry per file, so that they survive
+  restarts. Only the usage_max_entries highest counts are kept.
+
+  Searches ask for boosts(): rank bonuses for the files that were opened,
+  and smaller ones for every file in their dirs. generation changes
+  whenever the boosts do.
+  """
+  def __init__(self, settings):
+    settings.register('usage', list, [])
+    settings.register('usage_max_entries', int, 500)
+    self.settings = settings
+    self.generation = 0
+    self._files = dict() # path -> (count, time.time() the count was last brought up to date)
+    for entry in settings.usage:
+      try:
+        path, count, t = entry
+        self._files[path] = (float(count), float(t))
+      except (TypeError, ValueError):
+        pass # hand-edited or from some other version; forget it
+    self._boosts = None
+    self._boosts_time = None
+
+  def __len__(self):
+    return len(self._files)
+
+  def count(self, path, now = None):
+    """Returns path's count, decayed to now."""
+    if path not in self._files:
+      return 0
+    if now is None:
+      now = time.time()
+    count, t = self._files[path]
+    return _decay(count, now - t)
+
+  def record(self, path, now = None):
+    """Records that path was opened."""
+    if now is None:
+      now = time.time()
+    self._files[path] = (self.count(path, now) + 1, now)
+    self._prune(now)
+    self._save()
+    self._boosts = None
+    self.generation += 1
+
+  def clear(self):
+    self._files = dict()
+    self._save()
+    self._boosts = None
+    self.generation += 1
+
+  def boosts(self, now = None):
+    """
+    Returns (path -> rank bonus, dir -> rank bonus). They are recomputed as
+    the counts decay, at most every BOOST_REFRESH_INTERVAL seconds.
+    """
+    if now is None:
+      now = time.time()
+    if self._boosts is None or now - self._boosts_time > BOOST_REFRESH_INTERVAL:
+      if self._boosts is not None:
+        self.generation += 1
+      self._boosts = self._compute_boosts(now)
+      self._boosts_time = now
+    return self._boosts
+
+  def _compute_boosts(self, now):
+    file_counts = dict()
+    dir_counts = dict()
+    for path in self._files:
+      count = self.count(path, now)
+      file_counts[path] = count
+      d = os.path.dirname(path)
+      dir_counts[d] = dir_counts.get(d, 0) + count
+    file_boosts = dict()
+    for path, count in file_counts.items():
+      file_boosts[path] = _boost(count, FILE_BOOST, MAX_FILE_BOOST)
+    dir_boosts = dict()
+    for d, count in dir_counts.items():
+      dir_boosts[d] = _boost(count, DIR_BOOST, MAX_DIR_BOOST)
+    return file_boosts, dir_boosts
+
+  def _prune(self, now):
+    excess = len(self._files) - self.settings.usage_max_entries
+    if excess <= 0:
+      return
+    by_count = [(self.count(path, now), path) for path in self._files]
+    by_count.sort()
+    for count, path in by_count[:excess]:
+      del self._files[path]
+
+  def _save(self):
+    self.settings.usage = [[path, count, t] for path, (count, t) in self._files.items()]
+
+def _decay(count, age):
+  return count * math.pow(0.5, max(0, age) / USAGE_HALF_LIFE)
+
+def _boost(count, per_doubling, most):
+  return round(min(most, per_doubling * math.log(1 + count, 2)), 1)
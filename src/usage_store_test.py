@@ -0,0 +1,76 @@
+# Copyright 2011 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import settings
+import tempfile
+import unittest
+
+from usage_store import UsageStore, USAGE_HALF_LIFE
+
+class UsageStoreTest(unittest.TestCase):
+  def setUp(self):
+    self.settings_file = tempfile.NamedTemporaryFile()
+    self.settings = settings.Settings(self.settings_file.name)
+    self.usage = UsageStore(self.settings)
+
+  def tearDown(self):
+    self.settings_file.close()
+
+  def test_record(self):
+    self.assertEquals(0, self.usage.count('/a/b.c', 1000))
+    self.usage.record('/a/b.c', 1000)
+    self.usage.record('/a/b.c', 1000)
+    self.assertEquals(2, self.usage.count('/a/b.c', 1000))
+
+  def test_decay(self):
+    self.usage.record('/a/b.c', 1000)
+    self.assertAlmostEquals(0.5, self.usage.count('/a/b.c', 1000 + USAGE_HALF_LIFE))
+    self.usage.record('/a/b.c', 1000 + USAGE_HALF_LIFE)
+    self.assertAlmostEquals(1.5, self.usage.count('/a/b.c', 1000 + USAGE_HALF_LIFE))
+
+  def test_persists(self):
+    self.usage.record('/a/b.c', 1000)
+    s = settings.Settings(self.settings_file.name)
+    self.assertEquals(1, UsageStore(s).count('/a/b.c', 1000))
+
+  def test_keeps_highest_counts(self):
+    self.settings.usage_max_entries = 2
+    self.usage.record('/a/1', 1000)
+    self.usage.record('/a/1', 1000)
+    self.usage.record('/a/2', 1000)
+    self.usage.record('/a/2', 1000)
+    self.usage.record('/a/3', 1000)
+    self.assertEquals(2, len(self.usage))
+    self.assertEquals(0, self.usage.count('/a/3', 1000))
+    self.assertEquals(2, self.usage.count('/a/1', 1000))
+
+  def test_boosts(self):
+    self.usage.record('/a/b.c', 1000)
+    self.usage.record('/a/b.c', 1000)
+    self.usage.record('/a/d.c', 1000)
+    generation = self.usage.generation
+    file_boosts, dir_boosts = self.usage.boosts(1000)
+    self.assertTrue(file_boosts['/a/b.c'] > file_boosts['/a/d.c'] > 0)
+    self.assertTrue(0 < dir_boosts['/a'] < file_boosts['/a/b.c'])
+    self.assertEquals(generation, self.usage.generation)
+
+    # the boosts decay as time goes on
+    later = 1000 + USAGE_HALF_LIFE
+    self.assertTrue(self.usage.boosts(later)[0]['/a/b.c'] < file_boosts['/a/b.c'])
+    self.assertNotEquals(generation, self.usage.generation)
+
+  def test_clear(self):
+    self.usage.record('/a/b.c', 1000)
+    self.usage.clear()
+    self.assertEquals(0, len(self.usage))
+    self.assertEquals(({}, {}), self.usage.boosts(1000))